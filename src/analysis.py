@@ -14,9 +14,14 @@ import numpy as np
 from scipy.stats import binned_statistic    
 from datetime import datetime, timedelta    # Volumetric sale filtering based on date
 from math import ceil                       # Data analysis use in medians
-from copy import deepcopy                   # Working around Python's habit of shallow copies
 from sty import fg                          # Cross-platform color printing
 import statistics                           # Convenience
+import os                                   # Headless report output
+import json
+from salesstore import SalesStore           # Columnar sales histories with binary search windows
+from schema import readItemInfo             # Loads DBdata together with its SalesStore
+from salesstore import toEpochSeconds, fromEpochSeconds
+from itemindex import ItemIndex             # Item name -> DBdata label lookups
 
 def filterPrint(df, printtype='head', printval=10, keys=['Item Name', 'Date', 'Buy Rate', 'Sales/Day'], color=None):
     if printtype == 'head':
@@ -36,6 +41,46 @@ def filterPrint(df, printtype='head', printval=10, keys=['Item Name', 'Date', 'B
     else:
         raise Exception('Unsupported print type: ' + printtype)
 
+class SellMatcher:
+    # Answers "first sale at or above price X in [left, right)" for many queries at once.
+    # Keeps maxima of aligned power-of-two blocks of the store's flat price array (about one extra
+    #     copy of the prices in total). A query skips whole blocks whose max is below X and only
+    #     descends into the block holding the hit. Queries never span two items, so block sizes
+    #     only go up to the longest single history.
+    def __init__(self, store):
+        self.prices = store.prices
+        levels = [store.prices]
+        longest = store.lengths().max() if len(store) else 0
+        while 2**len(levels) <= longest:
+            below = levels[-1][:len(levels[-1])//2*2]
+            levels.append(np.maximum(below[0::2], below[1::2]))
+        self.depth = len(levels)
+        self.starts = np.cumsum([0] + [len(x) for x in levels])[:-1]
+        self.maxima = np.concatenate(levels)
+
+    def firstAtLeast(self, left, right, threshold):
+        # Flat index of the first qualifying sale per query, -1 where there is none
+        pos = np.array(left, dtype=np.int64)
+        right = np.asarray(right, dtype=np.int64)
+        threshold = np.asarray(threshold, dtype=np.float64)
+        result = np.full(len(pos), -1, dtype=np.int64)
+        cap = np.full(len(pos), self.depth-1, dtype=np.int64) # Largest block size still allowed
+        active = np.flatnonzero(pos < right)
+        while len(active):
+            p = pos[active]
+            # Biggest aligned block starting at p that stays inside the query
+            k = np.frexp((right[active] - p).astype(np.float64))[1] - 1
+            aligned = np.where(p > 0, np.frexp((p & -p).astype(np.float64))[1] - 1, self.depth)
+            k = np.minimum(np.minimum(k, aligned), cap[active])
+            skip = self.maxima[self.starts[k] + (p >> k)] < threshold[active]
+            pos[active] = np.where(skip, p + 2**k, p)
+            cap[active] = np.where(skip, self.depth-1, k-1)
+            hit = ~skip & (k == 0)
+            result[active[hit]] = p[hit]
+            active = active[~hit]
+            active = active[pos[active] < right[active]]
+        return result
+
 class BackTesterV2:
     # This looks at historical data to see if a particular strategy would have worked.
     # Assumptions:
@@ -74,21 +119,26 @@ class BackTesterV2:
         # [{'Buy Date': , 'Recommended Sell': , 'Fallback Sell': }
         #   , ...]
         self.purchases = []
-    def runBacktest(self, DBdata, verbose=True):
+    def runBacktest(self, DBdata, verbose=True, store=None):
+        # "store" is the SalesStore for DBdata, if one was loaded alongside it. Sell windows are
+        #     binary searched out of it instead of filtering the history lists.
+        if store is None:
+            store = SalesStore.fromDF(DBdata)
+
         # First, obtain purchases.
         if verbose:
             print('Backtesting [{0}]...'.format(self.strategy.__name__))
-        sacrificial_testregion = deepcopy(self.testregion)
-        # historicalSelectorDF modifies DBdata historical to be over the testregion
-        sacrificial_DBdata = deepcopy(DBdata) 
-        test_samples = historicalSelectorDF(sacrificial_DBdata, sacrificial_testregion)
+        # Windowed over the testregion out of the store, anchored like historicalSelectorDF on the
+        #     first item's last sale. DBdata's lists are never read, so workers can pass StoredHistory
+        #     views (see sweep.py).
+        anchor = store.lastSale(store.positions(DBdata.index[:1]))[0] if len(DBdata.index) else None
+        test_samples = store.window(self.testregion, labels=DBdata.index, anchor=anchor)
 
         self.strategy = self.strategy(*self.inputs)
         if verbose:
             print('Generating purchases over testregion...')
-        # runBacktestV2 modifies DBdata historical to be after the testregion
-        sacrificial_DBdata = deepcopy(DBdata)
-        self.purchases = self.strategy.runBacktestV2(sacrificial_DBdata, test_samples, self.testregion)
+        # runBacktestV2 windows through the store and returns new frames, so DBdata is shared as-is
+        self.purchases = self.strategy.runBacktestV2(DBdata, test_samples, self.testregion, store=store)
         # Note that the format of self.purchases is:
         # {
         #     "Name": "Some Item (Factory New)",
@@ -106,81 +156,71 @@ class BackTesterV2:
         # pass it along. TODO: Remove this redundancy.
 
         # Now, sell your inventory.
-        # Note that if you hold eg. 5 of an item, you permanently remove one of the possible sells.
-        # (Unsurprisingly, this increases implementation complexity)
+        # Every purchase is matched on its own: the first sale in [Buy Date, Buy Date + LFD] at or
+        #     above the recommended sell (phase 1), else the first sale in [Buy Date + LFD, Date Pulled]
+        #     at or above the fallback price (phase 2), else never sold (phase 3).
+        # All purchases are resolved together: window edges are binary searched out of the store and
+        #     "first sale >= X" comes from a range-max index (SellMatcher) instead of list scans.
         if verbose:
             print('Number of purchases:', sum([len(x['Purchases']) for x in self.purchases]))
             print('Running liquidation sell process...')
 
-        nametoindex = {x['Item Name']: i for i, x in DBdata.iterrows()}
+        force_window = timedelta(days=self.liquidation_force_days)
+        all_buys = [] # Flattened in item, then purchase order
+        for unique_name in self.purchases:
+            for p in unique_name['Purchases']:
+                phase1bounds = [p['Buy Date'], p['Buy Date'] + force_window]
+                phase2bounds = [phase1bounds[1], unique_name['Date Pulled']]
+                p['Regions'] = (phase1bounds, phase2bounds) # Used during graphical analysis of backtest
+                all_buys.append(p)
+        item_indices = ItemIndex.fromDF(DBdata).lookup([p['Name'] for p in all_buys])
+
+        matcher = SellMatcher(store)
+        positions = store.positions(item_indices)
+        phase1_start = toEpochSeconds([p['Regions'][0][0] for p in all_buys])
+        phase1_end = toEpochSeconds([p['Regions'][0][1] for p in all_buys])
+        phase2_end = toEpochSeconds([p['Regions'][1][1] for p in all_buys])
+
+        # Phase 1: recommended sell inside the forced liquidation window
+        recommended = np.array([p['Recommended Sell'] for p in all_buys], dtype=np.float64)
+        phase1_hits = matcher.firstAtLeast(store.searchsorted(positions, phase1_start, 'left'),
+                                           store.searchsorted(positions, phase1_end, 'right'),
+                                           recommended)
+
+        # Phase 2: fallback price from the end of that window to the end of the data, for the rest
+        unsold = np.flatnonzero(phase1_hits < 0)
+        if self.usefallbackmethod: # Use the intelligent re-estimate function passed along
+            # Full histories, built once per item that has an unsold purchase
+            needed = np.unique(positions[unsold])
+            histories = dict(zip(needed.tolist(), store.subset(needed).toLists()))
+            estimates = [all_buys[i]['Fallback Method'](histories[positions[i]], all_buys[i]['Regions'][0], all_buys[i])
+                         for i in unsold]
+        else: # Go based on the less intelligent estimated fallback price
+            estimates = [all_buys[i]['Fallback Sell'] for i in unsold]
+        estimates = np.array(estimates, dtype=np.float64)
+        phase2_hits = np.full(len(all_buys), -1, dtype=np.int64)
+        phase2_hits[unsold] = matcher.firstAtLeast(store.searchsorted(positions[unsold], phase1_end[unsold], 'left'),
+                                                   store.searchsorted(positions[unsold], phase2_end[unsold], 'right'),
+                                                   estimates)
+        phase2_price = np.zeros(len(all_buys))
+        phase2_price[unsold] = estimates
+
         phase1sell = [] # Sold at recommended sell
         phase2sell = [] # Sold at fallback sell
         phase3sell = [] # Never sold
-        for unique_name in self.purchases:
-            firstrun = True
-            relevant_history = DBdata.loc[nametoindex[unique_name['Name']]]['Sales from last month']
-
-            for i, p in enumerate(unique_name['Purchases']): # For each purchase under that item name
-                # The following code uses a rolling window sell region to avoid repeated sells.
-                ### Sell Window Updating {
-                if firstrun: # Initialize rolling window
-                    phase1bounds = [p['Buy Date'], p['Buy Date'] + timedelta(days=self.liquidation_force_days)]
-                    phase1region = historicalSelector(relevant_history, phase1bounds)
-                    phase2bounds = [phase1bounds[1], unique_name['Date Pulled']]
-                    phase2region = historicalSelector(relevant_history, phase2bounds)
-                else:
-                    # Remove old left region; sell dates should be +0 or increasing
-                    phase1region = [x for x in phase1region if x > p['Buy Date']]
-                    phase2region = [x for x in phase2region if x > p['Buy Date']]
-
-                    # Add new rightmost region (only for phase1region; phase2region extends to end)
-                    previous_end = (unique_name['Purchases'][i-1]['Date'] + timedelta(days=self.liquidation_force_days))
-                    if previous_end > p['Buy Date']:
-                        rightaddition = [previous_end, p['Buy Date'] + timedelta(days=self.liquidation_force_days)]
-                    else:
-                        rightaddition = [p['Buy Date'], p['Buy Date'] + timedelta(days=self.liquidation_force_days)]
-                    phase1region += historicalSelector(relevant_history, rightaddition)
-                p['Regions'] = (phase1bounds, phase2bounds) # Used during graphical analysis of backtest
-                ### Sell Window Updating }
-                
-                ### Actual selling {
-                while True: # Enforces recommended sell -> fallback sell logic
-                    # Phase 1 checks
-                    soldphase1 = False
-                    for index, historicalsell in enumerate(phase1region):
-                        if historicalsell[1] >= p['Recommended Sell']:
-                            soldphase1 = True
-                            del phase1region[index]
-                            p['Profit'] = p['Recommended Sell']/1.15 - p['Buy Price']
-                            p['Sell Date'] = historicalsell[0]
-                            phase1sell.append(p)
-                            break
-                    if soldphase1:
-                        break
-
-                    # Phase 2 checks
-                    soldphase2 = False
-                    if self.usefallbackmethod: # Use the intelligent re-estimate function passed along
-                        fxn = p['Fallback Method']
-                        price_estimate = fxn(relevant_history, phase1bounds, p)
-                    else: # Go based on the less intelligent estimated fallback price
-                        price_estimate = p['Fallback Sell']
-                    
-                    # Try and find a sell for the fallback estimate price
-                    for index, historicalsell in enumerate(phase2region):
-                        if historicalsell[1] >= price_estimate:
-                            soldphase2 = True
-                            del phase2region[index]
-                            p['Profit'] = price_estimate/1.15 - p['Buy Price']
-                            p['Sell Date'] = historicalsell[0]
-                            phase2sell.append(p)
-                            break
-                    if soldphase2:
-                        break
-                    else:
-                        # Neither conditions satisfied, so append to phase3sell
-                        phase3sell.append(p)
-                        break
+        sell_dates = fromEpochSeconds(store.timestamps[np.maximum(phase1_hits, phase2_hits)])
+        for i, p in enumerate(all_buys):
+            if phase1_hits[i] >= 0:
+                p['Profit'] = p['Recommended Sell']/1.15 - p['Buy Price']
+                p['Sell Date'] = sell_dates[i]
+                phase1sell.append(p)
+            elif phase2_hits[i] >= 0:
+                p['Profit'] = phase2_price[i]/1.15 - p['Buy Price']
+                p['Sell Date'] = sell_dates[i]
+                phase2sell.append(p)
+            else:
+                # Neither conditions satisfied, so append to phase3sell
+                phase3sell.append(p)
         if verbose:
             print('Finished figuring out sales! Sending sells to analysis...')
 
@@ -263,26 +303,35 @@ def standardFilter(df):
 def dayFloorDate(date):
     return datetime(date.year, date.month, date.day)
 
-def historicalSelector(L, dateregion=[7,0]):
-    # Note that L is a list
-    for index, date in enumerate(dateregion):
+def resolveDateregion(L, dateregion):
+    # Returns a new [start, end] of datetimes; ints count back days from floor(last sale in L)
+    resolved = []
+    for date in dateregion:
         if isinstance(date, int) or isinstance(date, float):
             rightmost_date = L[-1][0]
             rightfloor = dayFloorDate(rightmost_date)
-            dateregion[index] = rightfloor - timedelta(days=date)
+            resolved.append(rightfloor - timedelta(days=date))
         elif isinstance(date, datetime):
-            pass
+            resolved.append(date)
         else:
             raise Exception('Unsupported type! Must be int or datetime. Your type: ' + 
                             str(type(date)))
+    return resolved
 
+def historicalSelector(L, dateregion=[7,0]):
+    # Note that L is a list. Neither L nor dateregion is modified.
+    dateregion = resolveDateregion(L, dateregion)
     L = [saleinfo for saleinfo in L if dateregion[0] <= saleinfo[0] <= dateregion[1]]
     return L
 
 def historicalSelectorDF(df, dateregion):
-    df['Sales from last month'] = df['Sales from last month'].apply(historicalSelector, 
-                                                                    dateregion=dateregion)
-    return df
+    # Returns a new frame with windowed histories; df and its lists are left alone, so callers
+    #     don't need to deepcopy first.
+    # Int regions are resolved once, against the first item's last sale, and shared by every item.
+    if len(df.index) > 0:
+        dateregion = resolveDateregion(df['Sales from last month'].iloc[0], dateregion)
+    return df.assign(**{'Sales from last month': df['Sales from last month'].apply(historicalSelector,
+                                                                                   dateregion=dateregion)})
 
 def removeHistoricalOutliers(L, sigma=1):
     # Filter all data points that are greater than sigma away from the mean
@@ -292,6 +341,45 @@ def removeHistoricalOutliers(L, sigma=1):
     finL = [x for x in L if abs((x[1]-mean)/stdev) <= sigma]
     return finL
 
+# Batched versions of the above that act on every item of a SalesStore in one grouped pass
+def volumeFilterStore(store, saleslastmonth):
+    return store.subset(np.flatnonzero(store.lengths() >= saleslastmonth))
+
+def removeHistoricalOutliersStore(store, sigma=1):
+    # Same as removeHistoricalOutliers: sample mean/stdev per item, drop points > sigma away
+    owners = store.owners()
+    lengths = store.lengths()
+    mean = np.bincount(owners, weights=store.prices, minlength=len(lengths)) / lengths
+    deviation = store.prices - mean[owners]
+    stdev = np.sqrt(np.bincount(owners, weights=deviation**2, minlength=len(lengths)) / (lengths-1))
+    stdev = stdev[owners]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        keep = np.abs(deviation/stdev) <= sigma
+    # A flat history has stdev 0 (the per-item version divides by zero there); every point is
+    # exactly on the mean, so keep them all.
+    keep |= stdev == 0
+    return store.mask(keep)
+
+def quartilesStore(store):
+    # Same Q1/Q2/Q3 as quartiles(): Q2 is the median, Q1/Q3 are medians of the lower/upper halves,
+    #     excluding the middle element for odd lengths. Sorts every item's prices in one lexsort.
+    lengths = store.lengths()
+    assert (lengths >= 3).all(), ('Quartiles are meaningless with less than 3 data points.'
+                                  ' Did you use volumeFilterStore after windowing?')
+    starts = store.offsets[:-1]
+    values = store.prices[np.lexsort((store.prices, store.owners()))]
+
+    def medianAt(start, length):
+        mid = start + length//2
+        upper = values[mid]
+        lower = values[np.maximum(mid-1, start)]
+        return np.where(length % 2 == 1, upper, (lower+upper)/2)
+
+    half = lengths//2
+    return pd.DataFrame({'Q1': medianAt(starts, half),
+                         'Q2': medianAt(starts, lengths),
+                         'Q3': medianAt(starts + lengths - half, half)}, index=store.index)
+
 ########################
 
 
@@ -325,26 +413,50 @@ class LessThanThirdQuartileHistorical:
         self.dateregion = dateregion
         self.printkeys = ['Item Name', 'Date', 'Sales/Day', 'Lowest Listing', 'Q3', 'Ratio']
     
-    def prepare(self, df, dateregion=None):
+    def prepare(self, df, dateregion=None, store=None):
+        # Windowing, outlier removal and quartiles run over every item at once on a SalesStore.
+        # "store" only has to cover df's index (the store for the full DBdata is fine); if it isn't
+        #     given, one is built from df.
         if not dateregion:
             dateregion = self.dateregion
-        
-        df = deepcopy(df)
+        if store is None:
+            store = SalesStore.fromDF(df)
 
         satdf = standardFilter(df)
         satdf = volumeFilter(satdf, 60) # Make quartiles more meaningful
-        satdf = historicalSelectorDF(satdf, dateregion)
-        satdf = volumeFilter(satdf, 3)
-        satdf['Sales from last month'] = satdf['Sales from last month'].apply(removeHistoricalOutliers, sigma=1.5)
-        satdf = volumeFilter(satdf, 5)
 
-        details = satdf['Sales from last month'].apply(quartileHistorical)
-        details = pd.DataFrame(details.tolist(), index=details.index, columns=['Q1','Q2','Q3'])
-        satdf = satdf.join(details)
+        sales = store.subset(store.positions(satdf.index))
+        # Like historicalSelectorDF, int regions are anchored on the first item's last sale
+        anchor = sales.lastSale([0])[0] if len(sales) else None
+        sales = sales.window(dateregion, anchor=anchor)
+        sales = volumeFilterStore(sales, 3)
+        sales = removeHistoricalOutliersStore(sales, sigma=1.5)
+        sales = volumeFilterStore(sales, 5)
+
+        history = pd.Series(sales.toLists(), index=sales.index, dtype=object)
+        satdf = satdf.loc[sales.index].assign(**{'Sales from last month': history})
+        satdf = satdf.join(quartilesStore(sales))
         return satdf
 
-    def run(self, df):
-        satdf = self.prepare(df)
+    def prepareIndexed(self, df, qindex):
+        # Live counterpart of prepare: Q1/Q2/Q3 are looked up in an orderstats.QuartileIndex that
+        #     scanners keep current, instead of windowing and sorting every history again.
+        # 'Sales from last month' is left as the full history.
+        satdf = standardFilter(df)
+        satdf = volumeFilter(satdf, 60) # Make quartiles more meaningful
+
+        found = [(index, qindex.quartiles(index)) for index in satdf.index]
+        found = [(index, Q) for index, Q in found if Q is not None]
+        quartiles = pd.DataFrame([Q for _, Q in found], index=[index for index, _ in found],
+                                 columns=['Q1', 'Q2', 'Q3'], dtype=np.float64)
+        return satdf.loc[quartiles.index].join(quartiles)
+
+    def run(self, df, store=None, qindex=None):
+        # "qindex" (an orderstats.QuartileIndex over self.dateregion) skips the batch windowing
+        if qindex is not None:
+            satdf = self.prepareIndexed(df, qindex)
+        else:
+            satdf = self.prepare(df, store=store)
 
         lowest_listings = pd.DataFrame(data={'Lowest Listing': satdf['Listings'].apply(lambda L: L[0])})
         satdf = satdf.join(lowest_listings)
@@ -356,18 +468,25 @@ class LessThanThirdQuartileHistorical:
 
         return satdf
     
-    def runBacktestV2(self, df, test_samples, test_region):
-        # 'test_samples' is DBdata, but 'Sales from last month' is filtered to the buy region
+    def runBacktestV2(self, df, test_samples, test_region, store=None):
+        # 'test_samples' is DBdata, but 'Sales from last month' is filtered to the buy region, or
+        #     the same as a SalesStore (only the bought items' lists are built from it)
         # 'test_region' is the boundaries of the historical region to check quartiles over
+        # 'store' is an optional SalesStore covering df, passed through to prepare
 
-        satdf = self.prepare(df, dateregion=[test_region[0] + (self.dateregion[0]-self.dateregion[1]), test_region[0]])
+        satdf = self.prepare(df, dateregion=[test_region[0] + (self.dateregion[0]-self.dateregion[1]), test_region[0]],
+                             store=store)
         purchases = []
+        if isinstance(test_samples, SalesStore):
+            bought = test_samples.subset(test_samples.positions(satdf.index))
+            buy_windows = pd.Series(bought.toLists(), index=bought.index, dtype=object)
+        else:
+            buy_windows = test_samples['Sales from last month']
 
         def fallbackPricing(fullhistory, phase1bounds, purchase_data):
             # phase1bounds = [p['Buy Date'], p['Buy Date'] + timedelta(days=self.liquidation_force_days)]
             # phase1region = historicalSelector(relevant_history, phase1bounds)
-            phase1bounds = deepcopy(phase1bounds)
-            phase1bounds[0] -= timedelta(days=2) # Increase window size on the left
+            phase1bounds = [phase1bounds[0] - timedelta(days=2), phase1bounds[1]] # Increase window size on the left
             newregion = historicalSelector(fullhistory, phase1bounds)
             if len(newregion) >= 3:
                 Q1, Q2, Q3 = quartileHistorical(newregion)
@@ -377,8 +496,7 @@ class LessThanThirdQuartileHistorical:
                 return purchase_data['Fallback Sell']
 
         for index, historical_row in satdf.iterrows():
-            test_row = test_samples.loc[index]
-            good_to_buy = test_row['Sales from last month']
+            good_to_buy = buy_windows.loc[index]
             good_to_buy = [x for x in good_to_buy if x[1] < historical_row['Q3']/(self.percentage + .01)
                                                   and x[1] < historical_row['Q1']]
             item_dict = {'Name': historical_row['Item Name'],
@@ -401,11 +519,153 @@ class LessThanThirdQuartileHistorical:
 
         return purchases
 
+# Backtest reporting
+def hourSpread(all_buys):
+    # Roughly hourly sample points from the first buy region to the last sell region
+    mindate = min([x['Regions'][0][0] for x in all_buys])
+    maxdate = max([x['Regions'][1][1] for x in all_buys])
+    expected_hours = int((maxdate-mindate).total_seconds()//3600)
+    return pd.date_range(start=mindate.strftime('%Y-%m-%d'),
+                         end=maxdate.strftime('%Y-%m-%d'),
+                         periods=expected_hours+1)
+
+def portfolioTimeline(all_buys, hour_spread=None):
+    # Capital at risk and units held at each hour. A buy is held from its buy date through its
+    #     sell date (inclusive), or to the end if it never sold.
+    # Each buy adds its price at the first hour it's held and removes it after the last one
+    #     (difference arrays), so one cumulative sum gives the whole series.
+    if hour_spread is None:
+        hour_spread = hourSpread(all_buys)
+    hours = hour_spread.values
+    buy_dates = np.array([p['Buy Date'] for p in all_buys], dtype='datetime64[ns]')
+    sell_dates = np.array([p.get('Sell Date', hours[-1]) for p in all_buys], dtype='datetime64[ns]')
+    prices = np.array([p['Buy Price'] for p in all_buys], dtype=np.float64)
+    first = np.searchsorted(hours, buy_dates, side='left')
+    last = np.searchsorted(hours, sell_dates, side='right') # Unsold buys run to the last hour
+    held = first < last
+    money = np.bincount(first[held], weights=prices[held], minlength=len(hours)+1) \
+          - np.bincount(last[held], weights=prices[held], minlength=len(hours)+1)
+    units = np.bincount(first[held], minlength=len(hours)+1) - np.bincount(last[held], minlength=len(hours)+1)
+    return pd.DataFrame({'Portfolio': np.cumsum(money)[:-1], 'Held': np.cumsum(units)[:-1]},
+                        index=hour_spread)
+
+def profitStats(phase1sell, phase2sell, phase3sell, timeline=None):
+    # Unsold items count as a loss of both Steam cuts
+    actually_sold = phase1sell + phase2sell
+    all_profits = [x['Profit'] for x in actually_sold]
+    positive_profits = sum([x for x in all_profits if x > 0])
+    negative_profits = sum([x for x in all_profits if x < 0]) - sum([x['Buy Price']-x['Buy Price']/(1.15**2) for x in phase3sell])
+    holding_time = [(x['Sell Date'] - x['Buy Date']).total_seconds()//3600 for x in actually_sold]  # in hrs
+    all_buys = actually_sold + phase3sell
+    if timeline is None and all_buys:
+        timeline = portfolioTimeline(all_buys)
+    return {'Phase 1': len(phase1sell),
+            'Phase 2': len(phase2sell),
+            'Phase 3': len(phase3sell),
+            'Net Profit': round(positive_profits + negative_profits, 2),
+            'Total Gain': round(positive_profits, 2),
+            'Total Loss': round(negative_profits, 2),
+            'Longest Hold': max(holding_time) if holding_time else 0,
+            'Max Portfolio': round(float(timeline['Portfolio'].max()), 2) if all_buys else 0,
+            'Max Held': int(timeline['Held'].max()) if all_buys else 0}
+
+def profitAnalysisV2(phase1sell, phase2sell, phase3sell, historical_metadata, DBdata, outdir=None):
+    # historical_metadata: ((5,4), 2)
+    # The holding stats part of the code needs the test region and liquidation_force_sell
+    # "outdir": headless mode. Figures are saved there as .png along with stats.json, instead of
+    #     being shown, so sweeps can run unattended.
+    if outdir:
+        plt.switch_backend('Agg')
+        os.makedirs(outdir, exist_ok=True)
+    def show(name):
+        if outdir:
+            plt.savefig(os.path.join(outdir, name + '.png'))
+            plt.close()
+        else:
+            plt.show()
+
+    actually_sold = phase1sell + phase2sell
+    all_buys = phase1sell + phase2sell + phase3sell
+
+    # Holding stats
+    # Region is different for every item, so must use the stored item buy and sell date
+    holding_time = [(x['Sell Date'] - x['Buy Date']).total_seconds()//3600 for x in actually_sold]  # in hrs
+    hourly_bins = int(max(holding_time))
+    end_of_buys = (historical_metadata[0][0] - historical_metadata[0][1])*24
+    end_of_LFD = (end_of_buys//24 + historical_metadata[1])*24
+    timeline = portfolioTimeline(all_buys)
+    stats = profitStats(phase1sell, phase2sell, phase3sell, timeline=timeline)
+
+    # Printing/graphing results
+    cround = lambda currency: round(currency, 2)
+    percent_all = lambda L: '({0}% of total)'.format(cround(100*len(L)/len(all_buys)))
+    print('###################################################################################')
+    print('Phase 1 sells:', len(phase1sell), percent_all(phase1sell))
+    print('Phase 2 sells:', len(phase2sell), percent_all(phase2sell))
+    print('Never sold:', len(phase3sell), percent_all(phase3sell))
+    print('Net profit:', stats['Net Profit'])
+    print('Total loss:', stats['Total Loss'])
+    print('Total gain:', stats['Total Gain'])
+    print('Longest time to sale (hours):', stats['Longest Hold'])
+    print('Maximum portfolio $$$:', stats['Max Portfolio'])
+    print('Highest holding number:', stats['Max Held'])
+    if outdir:
+        with open(os.path.join(outdir, 'stats.json'), 'w') as f:
+            json.dump(dict(stats, **{'Test Region': historical_metadata[0],
+                                     'Liquidation Force Days': historical_metadata[1]}), f, indent=4)
+
+    # Histogram: time to sale
+    sns.distplot(holding_time, bins=hourly_bins+1, kde=False)
+    plt.xlabel('Hours to sale')
+    plt.ylabel('Volume of item sales')
+    show('hours_to_sale')
+
+    # Plot: portfolio over time, in $ and quantity
+    portfolio_size = timeline['Portfolio'].values
+    plt.plot(portfolio_size, color='blue', label='$$$ in portfolio')
+    plt.plot(timeline['Held'].values, color='red', label='Number of items in inventory')
+    plt.axvline(end_of_buys)
+    plt.text(end_of_buys, max(portfolio_size)*1.1, 'End of buys')
+    plt.axvline(end_of_LFD)
+    plt.text(end_of_LFD, max(portfolio_size)*1.1, 'End of recommended sell')
+    plt.xlabel('Hours into sale period')
+    plt.ylabel('$$$ Portfolio Allocation')
+    plt.legend(['$$$ in portfolio', 'Number of items in inventory'], loc='upper right')
+    show('portfolio')
+
+    # Plot: average return % at each initial Q3/Buy % (lower Q3/Buy is usually worse)
+    buy_ratios = [int(round(p['Recommended Sell']/p['Buy Price'], 2)*100) for p in actually_sold]
+    low_buy = min(buy_ratios)
+    high_buy = max(buy_ratios)
+    profit_ratios = [int(round(p['Profit']/p['Buy Price'], 2)*100) for p in actually_sold]
+    bins = high_buy-low_buy
+    stats, bin_edges, numbins = binned_statistic(buy_ratios, profit_ratios, statistic='mean', bins=bins)
+    # print(stats)
+    # stats[np.isnan(stats)] = 0
+    # plt.bar(bin_edges[:-1], stats, width=1, align='edge')
+    # plt.show()
+
+    # Scatter: 
+    plt.scatter(x=[p['Recommended Sell']/p['Buy Price'] for p in actually_sold], y=[p['Profit']/p['Buy Price']*100 for p in actually_sold])
+    # plt.xlim([1,2.5])
+    # plt.ylim([-5,5])
+    # plt.axvline(1.30, c='k')
+    # plt.axvline(1.31, c='k')
+    # plt.axvline(1.32, c='k')
+    # plt.axvline(1.33, c='k')
+    # plt.axvline(1.34, c='k')
+    # plt.axvline(1.35, c='k')
+    # plt.axvline(1.40, c='k')
+    # plt.axvline(1.50, c='k')
+    plt.xlabel('Ratio Q3/Buy')
+    plt.ylabel('Actual Profit (% above break even)')
+    show('profit_by_ratio')
+
 #######################
 
 if __name__ == '__main__':
     print('Doing inital dataset import...')
-    DBdata = pd.read_hdf('../data/item_info.h5', 'csgo')
+    DBdata, store = readItemInfo('../data/item_info.h5')
     print('Successful import! Number of entries:', len(DBdata.index))
     DBdata = standardFilter(DBdata)
     print('Number that satisfy volume, souvenir, and price filters:', len(DBdata.index))
@@ -420,148 +680,13 @@ if __name__ == '__main__':
     hmeta = ([5,4], 2)
     tester = BackTesterV2(LessThanThirdQuartileHistorical, hmeta[0], hmeta[1], 
                           inputs=[1.23, [8,0]], usefallbackmethod=True)
-    purchases, phasesells = tester.runBacktest(DBdata)
+    purchases, phasesells = tester.runBacktest(DBdata, store=store)
     phase1sell, phase2sell, phase3sell = phasesells
     print('Never sold items:')
     print([p['Name'] for p in phase3sell])
 
-    def profitAnalysisV2(phase1sell, phase2sell, phase3sell, historical_metadata, DBdata):
-        # historical_metadata: ((5,4), 2)
-        # The holding stats part of the code needs the test region and liquidation_force_sell
-
-        # Basic stats
-        actually_sold = phase1sell + phase2sell
-        all_profits = [x['Profit'] for x in actually_sold]
-        positive_profits = sum([x for x in all_profits if x > 0])
-        negative_profits = sum([x for x in all_profits if x < 0]) - sum([x['Buy Price']-x['Buy Price']/(1.15**2) for x in phase3sell])
-        net = positive_profits + negative_profits
-
-        # Holding stats
-        # Goal: iterate over each available hour. Sum over currently active buys (inclusive) to
-        #       see current portfolio usage. This allows us to keep track of max inventory size and
-        #       max money input.
-        #       Generate a graph with this data. Output max holding.
-        # Region is different for every item, so must use the stored item buy and sell date
-        holding_time = [(x['Sell Date'] - x['Buy Date']).total_seconds()//3600 for x in actually_sold]  # in hrs
-        hourly_bins = int(max(holding_time))
-        # Then, figure out portfolio holdings
-        all_buys = phase1sell + phase2sell + phase3sell
-        mindate = min([x['Regions'][0][0] for x in all_buys])
-        maxdate = max([x['Regions'][1][1] for x in all_buys])
-        expected_hours = int((maxdate-mindate).total_seconds()//3600)
-        end_of_buys = (historical_metadata[0][0] - historical_metadata[0][1])*24
-        end_of_LFD = (end_of_buys//24 + historical_metadata[1])*24
-        hour_spread = pd.date_range(start=mindate.strftime('%Y-%m-%d'), 
-                                    end=maxdate.strftime('%Y-%m-%d'),
-                                    periods=expected_hours+1)
-        portfolio_size = [0]*(expected_hours+1)
-        num_held = deepcopy(portfolio_size) # Lazy/10
-        for p in all_buys:
-            has_sale = False
-            buy_date = p['Buy Date']
-            if 'Sell Date' in p:
-                has_sale = True
-                sell_date = p['Sell Date']
-            buy_price = p['Buy Price']
-            for index, hour in enumerate(hour_spread):
-                if has_sale:
-                    if buy_date <= hour <= sell_date:
-                        portfolio_size[index] += buy_price
-                        num_held[index] += 1
-                else:
-                    if buy_date <= hour:
-                        portfolio_size[index] += buy_price
-                        num_held[index] += 1
-
-        # Printing/graphing results
-        cround = lambda currency: round(currency, 2)
-        percent_all = lambda L: '({0}% of total)'.format(cround(100*len(L)/len(all_buys)))
-        print('###################################################################################')
-        print('Phase 1 sells:', len(phase1sell), percent_all(phase1sell))
-        print('Phase 2 sells:', len(phase2sell), percent_all(phase2sell))
-        print('Never sold:', len(phase3sell), percent_all(phase3sell))
-        print('Net profit:', cround(net))
-        print('Total loss:', cround(negative_profits))
-        print('Total gain:', cround(positive_profits))
-        print('Longest time to sale (hours):', max(holding_time))
-        print('Maximum portfolio $$$:', cround(max(portfolio_size)))
-        print('Highest holding number:', max(num_held))
-
-        # Histogram: time to sale
-        sns.distplot(holding_time, bins=hourly_bins+1, kde=False)
-        plt.xlabel('Hours to sale')
-        plt.ylabel('Volume of item sales')
-        plt.show()
-
-        # Plot: portfolio over time, in $ and quantity
-        plt.plot(portfolio_size, color='blue', label='$$$ in portfolio')
-        plt.plot(num_held, color='red', label='Number of items in inventory')
-        plt.axvline(end_of_buys)
-        plt.text(end_of_buys, max(portfolio_size)*1.1, 'End of buys')
-        plt.axvline(end_of_LFD)
-        plt.text(end_of_LFD, max(portfolio_size)*1.1, 'End of recommended sell')
-        plt.xlabel('Hours into sale period')
-        plt.ylabel('$$$ Portfolio Allocation')
-        plt.legend(['$$$ in portfolio', 'Number of items in inventory'], loc='upper right')
-        plt.show()
-
-        # Plot: average return % at each initial Q3/Buy % (lower Q3/Buy is usually worse)
-        buy_ratios = [int(round(p['Recommended Sell']/p['Buy Price'], 2)*100) for p in actually_sold]
-        low_buy = min(buy_ratios)
-        high_buy = max(buy_ratios)
-        profit_ratios = [int(round(p['Profit']/p['Buy Price'], 2)*100) for p in actually_sold]
-        bins = high_buy-low_buy
-        stats, bin_edges, numbins = binned_statistic(buy_ratios, profit_ratios, statistic='mean', bins=bins)
-        # print(stats)
-        # stats[np.isnan(stats)] = 0
-        # plt.bar(bin_edges[:-1], stats, width=1, align='edge')
-        # plt.show()
-
-        # Scatter: 
-        plt.scatter(x=[p['Recommended Sell']/p['Buy Price'] for p in actually_sold], y=[p['Profit']/p['Buy Price']*100 for p in actually_sold])
-        # plt.xlim([1,2.5])
-        # plt.ylim([-5,5])
-        # plt.axvline(1.30, c='k')
-        # plt.axvline(1.31, c='k')
-        # plt.axvline(1.32, c='k')
-        # plt.axvline(1.33, c='k')
-        # plt.axvline(1.34, c='k')
-        # plt.axvline(1.35, c='k')
-        # plt.axvline(1.40, c='k')
-        # plt.axvline(1.50, c='k')
-        plt.xlabel('Ratio Q3/Buy')
-        plt.ylabel('Actual Profit (% above break even)')
-        plt.show()
-
-    profitAnalysisV2(phase1sell, phase2sell, phase3sell, hmeta, DBdata)
-
-    # print('Testing for optimal strategy on given timescale...')
-
-    # day_x = []
-    # day_y = []
-    # for dayregion in range(11,26):
-    #     print('Testing {0}-{1} days ago...'.format(dayregion, dayregion-1))
-    #     ndays_list = []
-    #     net_profits = []
-    #     for days_sell in range(1,11):
-    #         ndays_list.append(days_sell)
-    #         _, profits = BackTester(LessThanThirdQuartileHistorical,
-    #                                 [dayregion,dayregion-1], days_sell, .85, [2]).runBacktest(verbose=False)
-    #         net_profits.append(sum(profits))
-    #     day_x.append(ndays_list)
-    #     day_y.append(net_profits)
-    
-    # # # Figure out highest profit day model
-    # # perdayprofit = [0]*len(day_y[0])
-    # # for x in day_y:
-    # #     highest_profit = max(x)
-    # #     for i, day in enumerate(x):
-    # #         perdayprofit[i] += day/highest_profit
-    # # print(perdayprofit)
-
-    # plt.xlabel('Force_liquidation_sell parameter value (days)')
-    # plt.ylabel('Net $$$ profit')
-    # for i, x in enumerate(day_x):
-    #     plt.plot(x, day_y[i], label='Jun ' + str(16-i))
-    # plt.legend(loc='upper left')
-    # plt.show()
+    # Set to a directory to save the figures and stats there instead of showing them
+    report_dir = None
+    profitAnalysisV2(phase1sell, phase2sell, phase3sell, hmeta, DBdata, outdir=report_dir)
+
+    # Grid searches over testregion, liquidation_force_days and buy percentage: see sweep.py
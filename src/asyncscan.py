@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### asyncio scanner for the market/search/render JSON endpoint.
+### Keeps a small number of requests in flight inside the shared 'search' rate budget, and hands
+###     each parsed page to a callback as soon as it arrives. Requests go over plain HTTP, so the
+###     base URL can point at a local stand-in server serving recorded responses.
+
+### Standard libraries
+import asyncio                              # Concurrent page fetches
+import json                                 # Parsing responses
+import urllib.request                       # Blocking HTTP, run in worker threads
+import urllib.error
+import time
+from itertools import zip_longest           # Interleaving conditions
+
+### Local Functions
+from ratelimit import limiter, Throttled    # Shared per-endpoint request budget
+from httpclient import ClientFailure        # Failures that aren't Steam limiting us
+from httpclient import THROTTLE_STATUSES
+from metrics import metrics                 # Fetch latencies and page counts
+
+STEAM_BASE = 'https://steamcommunity.com'
+SEARCH_PATH = ('/market/search/render/?category_730_ItemSet&appid=730&norender=1&'
+               'category_730_Exterior%5B%5D=tag_WearCategory{0}&count={1}&start={2}')
+PAGE_SIZE = 100 # Can't put count higher, unfortunately
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0 Safari/537.36'
+
+CONDITIONS = [0, # Factory New
+              1, # Minimal Wear
+              2, # Field-Tested
+              3, # Well-Worn
+              4] # Battle-Scarred
+
+def searchURL(condition, start=0, count=PAGE_SIZE, base=STEAM_BASE):
+    return base + SEARCH_PATH.format(condition, count, start)
+
+def fetchJSON(url, timeout=30):
+    # Blocking GET, with the same contract as SteamHTTP.getJSON: parsed JSON (a null result is
+    #     returned as is), Throttled on rate limit statuses, ClientFailure on anything else.
+    request = urllib.request.Request(url, headers={'User-Agent': USER_AGENT})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            body = response.read()
+    except urllib.error.HTTPError as e:
+        if e.code in THROTTLE_STATUSES:
+            raise Throttled('HTTP ' + str(e.code) + ': ' + url)
+        raise ClientFailure('HTTP ' + str(e.code) + ': ' + url)
+    except (urllib.error.URLError, OSError) as e:
+        raise ClientFailure(str(e) or type(e).__name__)
+    try:
+        return json.loads(body)
+    except ValueError:
+        raise ClientFailure('Not JSON: ' + url)
+
+class AsyncSearchScanner:
+    def __init__(self, concurrency=2, interval=None, base=STEAM_BASE, fetch=fetchJSON,
+                 limiter=limiter, endpoint='search', attempts=5):
+        # "concurrency" is the most requests in flight at once.
+        # "interval" seeds the endpoint's seconds/request if the limiter hasn't seen it yet.
+        # "fetch" takes a URL and returns the parsed JSON, like fetchJSON; it runs in a worker thread.
+        # Throttling (Throttled, or a null/unsuccessful result) backs the endpoint off; other
+        #     failures (ClientFailure) are retried at the current rate. Either way a page gets
+        #     "attempts" tries.
+        self.concurrency = concurrency
+        self.base = base
+        self.fetch = fetch
+        self.limiter = limiter
+        self.endpoint = endpoint
+        self.attempts = attempts
+        self.limiter.bucket(endpoint, interval)
+
+    async def fetchPage(self, condition, start):
+        url = searchURL(condition, start, base=self.base)
+        for attempt in range(self.attempts):
+            async with self._inflight:
+                await self.limiter.acquireAsync(self.endpoint)
+                started = time.perf_counter()
+                try:
+                    response = await asyncio.to_thread(self.fetch, url)
+                except Throttled:
+                    response = None
+                except ClientFailure as e:
+                    metrics.fetched('fetch_search', started)
+                    print('Request failed (' + str(e) + '), retrying', condition, start)
+                    continue
+            success = isinstance(response, dict) and response.get('success')
+            metrics.fetched('fetch_search', started, 'search_pages' if success else None)
+            if success:
+                self.limiter.success(self.endpoint)
+                return condition, start, response
+            await asyncio.sleep(self.limiter.throttled(self.endpoint))
+        return condition, start, None
+
+    async def scan(self, pages, on_page):
+        # "pages" is an iterable of (condition, start). on_page(condition, start, response) is
+        #     called in arrival order; response is None for failed pulls.
+        self._inflight = asyncio.Semaphore(self.concurrency)
+        tasks = [asyncio.ensure_future(self.fetchPage(condition, start)) for condition, start in pages]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                condition, start, response = await finished
+                on_page(condition, start, response)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def crawl(self, conditions, on_page, totals=None, done=None):
+        # Every page of every condition. The first pages give total_count; the rest are queued after,
+        #     alternating between conditions so each one progresses inside the shared budget.
+        # "totals" (condition -> total_count) and "done" (condition -> starts already fetched) resume
+        #     an earlier crawl; a condition with a known total has its first page already.
+        totals = dict(totals or {})
+        done = done or dict()
+        def first_page(condition, start, response):
+            if response and response.get('success'):
+                totals[condition] = response['total_count']
+            on_page(condition, start, response)
+        await self.scan([(condition, 0) for condition in conditions if condition not in totals], first_page)
+
+        remaining = [[(condition, start) for start in range(PAGE_SIZE, totals.get(condition, 0), PAGE_SIZE)
+                                         if start not in done.get(condition, ())] for condition in conditions]
+        rest = [page for pages in zip_longest(*remaining) for page in pages if page is not None]
+        await self.scan(rest, on_page)
+
+    def run(self, coroutine):
+        return asyncio.run(coroutine)
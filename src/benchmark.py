@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### Timings of the hot paths on synthetic data (see synthetic.py), at several catalog sizes.
+### Results are written as a JSON baseline; a later run can be compared against it to catch scan
+###     throughput regressions before they're deployed.
+###     python benchmark.py                                  # writes ../data/benchmarks/<commit>.json
+###     python benchmark.py --compare ../data/benchmarks/baseline.json
+###     python benchmark.py --scales small --only cleanListing,cleanListingSoup
+
+import argparse                             # Command line options
+import contextlib                           # Muting report output while timing
+import io
+import json                                 # Baseline files
+import os
+import platform
+import subprocess                           # Commit hash for the baseline
+import sys
+import tempfile                             # profitAnalysisV2 output
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+from analysis import standardFilter, LessThanThirdQuartileHistorical, BackTesterV2, historicalSelectorDF
+from analysis import profitAnalysisV2
+from browse_itempage import cleanListing, cleanListingSoup, cleanVolumetric
+from salesstore import SalesStore
+from synthetic import syntheticDBdata, listingHTML, chartHTML
+
+SCALES = {'small': 300, 'medium': 1500, 'large': 6000} # Items in the synthetic catalog
+PAGES_PER_ITEMS = 10 # Parser benchmarks read one page per this many catalog items
+TESTREGION = [5, 4]
+LIQUIDATION_FORCE_DAYS = 2
+INPUTS = [1.23, [8,0]]
+
+class Dataset:
+    # Everything a scale's benchmarks read, built once per scale outside the timings
+    def __init__(self, items, seed=0):
+        # Dated up to the current hour, since cleanVolumetric cuts charts to the last 30 days
+        self.DBdata = syntheticDBdata(items, seed=seed)
+        self.store = SalesStore.fromDF(self.DBdata)
+        pages = self.DBdata.iloc[:max(items//PAGES_PER_ITEMS, 1)]
+        self.listing_pages = [listingHTML(L, seed=i) for i, L in enumerate(pages['Listings'])]
+        self.chart_pages = [chartHTML(H, seed=i) for i, H in enumerate(pages['Sales from last month'])]
+        self.test_samples = historicalSelectorDF(self.DBdata, TESTREGION)
+        self._sells = None
+
+    def sells(self):
+        if self._sells is None:
+            tester = BackTesterV2(LessThanThirdQuartileHistorical, TESTREGION, LIQUIDATION_FORCE_DAYS,
+                                  inputs=INPUTS, usefallbackmethod=True)
+            self._sells = tester.runBacktest(self.DBdata, verbose=False, store=self.store)[1]
+        return self._sells
+
+def backtest(data):
+    tester = BackTesterV2(LessThanThirdQuartileHistorical, TESTREGION, LIQUIDATION_FORCE_DAYS,
+                          inputs=INPUTS, usefallbackmethod=True)
+    return tester.runBacktest(data.DBdata, verbose=False, store=data.store)
+
+def profitReport(data):
+    with tempfile.TemporaryDirectory() as outdir:
+        profitAnalysisV2(*data.sells(), (TESTREGION, LIQUIDATION_FORCE_DAYS), data.DBdata, outdir=outdir)
+
+# name -> function of a Dataset. Each one is timed as a whole.
+BENCHMARKS = {
+    'standardFilter': lambda data: standardFilter(data.DBdata),
+    'LTTQH.prepare': lambda data: LessThanThirdQuartileHistorical(*INPUTS).prepare(data.DBdata, store=data.store),
+    'LTTQH.run': lambda data: LessThanThirdQuartileHistorical(*INPUTS).run(data.DBdata, store=data.store),
+    'LTTQH.runBacktestV2': lambda data: LessThanThirdQuartileHistorical(*INPUTS).runBacktestV2(
+                                            data.DBdata, data.test_samples, TESTREGION, store=data.store),
+    'BackTesterV2.runBacktest': backtest,
+    'SalesStore.fromDF': lambda data: SalesStore.fromDF(data.DBdata),
+    'cleanListing': lambda data: [cleanListing(page) for page in data.listing_pages],
+    'cleanListingSoup': lambda data: [cleanListingSoup(page) for page in data.listing_pages],
+    'cleanVolumetric': lambda data: [cleanVolumetric(page) for page in data.chart_pages],
+    'profitAnalysisV2': profitReport,
+}
+
+def timeBest(function, data, repeat):
+    # Best of "repeat" runs; the minimum is the least noisy estimate of the cost itself.
+    #     Whatever the function prints is dropped.
+    best = float('inf')
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            function(data)
+            best = min(best, time.perf_counter() - start)
+    return best
+
+def commitHash():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def runBenchmarks(scales=SCALES, only=None, repeat=3, verbose=True):
+    results = {name: dict() for name in BENCHMARKS if only is None or name in only}
+    for scale, items in scales.items():
+        data = Dataset(items)
+        if 'profitAnalysisV2' in results:
+            data.sells() # Its input comes from a backtest; keep that out of its timing
+        for name in results:
+            results[name][scale] = round(timeBest(BENCHMARKS[name], data, repeat), 6)
+            if verbose:
+                print('    {0:<26} {1:<7} {2:>10.4f}s'.format(name, scale, results[name][scale]))
+    return {'Commit': commitHash(),
+            'Date': datetime.now().isoformat(timespec='seconds'),
+            'Python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'Scales': dict(scales),
+            'Results': results}
+
+def compare(baseline, current, tolerance=1.25):
+    # Rows of (benchmark, scale, baseline s, current s, ratio); ratio > tolerance is a regression.
+    #     Only benchmarks and scales in both runs are compared.
+    rows = []
+    for name, scales in current['Results'].items():
+        for scale, seconds in scales.items():
+            before = baseline['Results'].get(name, {}).get(scale)
+            if before:
+                rows.append((name, scale, before, seconds, seconds/before))
+    report = pd.DataFrame(rows, columns=['Benchmark', 'Scale', 'Baseline', 'Current', 'Ratio'])
+    report['Regression'] = report['Ratio'] > tolerance
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Time the hot paths on synthetic data.')
+    parser.add_argument('--scales', default=','.join(SCALES), help='comma separated, from ' + ', '.join(SCALES))
+    parser.add_argument('--only', default=None, help='comma separated benchmark names')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--out', default=None, help='baseline file to write (default ../data/benchmarks/<commit>.json)')
+    parser.add_argument('--compare', default=None, help='baseline file to compare against')
+    parser.add_argument('--tolerance', type=float, default=1.25, help='slowdown ratio counted as a regression')
+    args = parser.parse_args()
+
+    scales = {scale: SCALES[scale] for scale in args.scales.split(',')}
+    only = args.only.split(',') if args.only else None
+    current = runBenchmarks(scales, only, args.repeat)
+
+    out = args.out or os.path.join('../data/benchmarks', (current['Commit'] or 'latest') + '.json')
+    os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+    with open(out, 'w') as f:
+        json.dump(current, f, indent=4)
+    print('Wrote', out)
+
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        report = compare(baseline, current, args.tolerance)
+        print(report.to_string(index=False))
+        if report['Regression'].any():
+            print('Regressions against', args.compare + ':', ', '.join(
+                  report[report['Regression']][['Benchmark', 'Scale']].apply(' '.join, axis=1)))
+            sys.exit(1)
@@ -1,15 +1,57 @@
 from selenium import webdriver              # Primary navigation of Steam price data.
 from selenium.common.exceptions import NoSuchElementException 
+from selenium.common.exceptions import StaleElementReferenceException
+from selenium.common.exceptions import TimeoutException
                                             # ^^ Dealing with page load failure.
+from selenium.webdriver.support.ui import WebDriverWait # Waiting out a refresh
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.common.by import By
 from bs4 import BeautifulSoup               # Reading prices and seller ID from page
+import numpy as np                          # Bulk parsing of the price chart
 import time                                 # Waiting so no server-side ban
-from datetime import datetime, timedelta    # Volumetric sale filtering based on date
+import re                                   # Single-pass listing extraction
+import json                                 # The chart array is a JSON literal
+from html import unescape                   # Entities in listing prices
+from datetime import datetime               # Volumetric sale filtering based on date
+from ratelimit import limiter, Throttled    # Shared per-endpoint request budget
+from metrics import metrics                 # Fetch latencies, page counts, sleep ratio
 
 def readUSD(dollars):
     numbers = set('0123456789.')
     return float(''.join([x for x in dollars if x in numbers]))
 
+# One pass over #searchResultsRows picks up both kinds of tokens cleanListing needs, in page order:
+#     the price spans (exact class, like BeautifulSoup's class_ match) and every <a> tag's attributes.
+LISTING_TOKENS = re.compile(r'<span\b[^>]*?\sclass\s*=\s*(["\'])market_listing_price market_listing_price_with_fee\1'
+                            r'[^>]*>(?P<price>.*?)</span\s*>'
+                            r'|<a\b(?P<attrs>[^>]*)>', re.S | re.I)
+ID_ATTR = re.compile(r'(?:^|\s)id\s*=\s*(["\'])(.*?)\1', re.S | re.I)
+TAGS = re.compile(r'<[^>]*>')
+
 def cleanListing(html):
+    ### Get prices and listing IDs from html output from #searchresultsrows
+    prices = []
+    ids = []
+    for token in LISTING_TOKENS.finditer(html):
+        price = token.group('price')
+        if price is not None:
+            prices.append(unescape(TAGS.sub('', price)).strip())
+        else:
+            found = ID_ATTR.search(token.group('attrs'))
+            if found and found.group(2):
+                ids.append(unescape(found.group(2)).split('_')[1])
+
+    # Drops 'Sold!' rows (dynamic updating during the data pull) and sorts, since Steam sometimes
+    # displays listings out of order. A page where everything just sold has no listings left.
+    listings = sorted([(readUSD(x),y) for x,y in zip(prices, ids) if x != 'Sold!'], key = lambda x: x[0])
+    if not listings:
+        return (), ()
+    prices, ids = zip(*listings)
+    return prices, ids
+
+def cleanListingSoup(html):
+    # Original BeautifulSoup implementation of cleanListing, kept as the reference for equivalence
+    #     checks and benchmarks.
     ### Get prices from html output from #searchresultsrows
     soup = BeautifulSoup(html, 'html.parser')
     priceraw = [x for x in soup.find_all('span', class_='market_listing_price market_listing_price_with_fee')]
@@ -27,29 +69,53 @@ def cleanListing(html):
     # The following line filters out any items which say 'Sold!', which is a dynamic updating
     # thing that sometimes happens during data pull.
     # It also sorts listings; sometimes Steam displays them out of order.
-    # list(zip(*n)) does [(a1,b1),...] -> [[a1, a2, ...], [b1, b2, ...]]
-    prices, ids = list(zip(*sorted([(readUSD(x),y) for x,y in zip(prices, ids) if x != 'Sold!'], key = lambda x: x[0])))
+    listings = sorted([(readUSD(x),y) for x,y in zip(prices, ids) if x != 'Sold!'], key = lambda x: x[0])
+    if not listings:
+        return (), ()
+    prices, ids = zip(*listings)
     return prices, ids
 
-def cleanVolumetric(data):
-    # Parses data from the price chart on an item listing
+# Month abbreviations in sorted order, with their month numbers, for a vectorized lookup
+CHART_MONTHS = np.array(['Apr', 'Aug', 'Dec', 'Feb', 'Jan', 'Jul', 'Jun', 'Mar', 'May', 'Nov', 'Oct', 'Sep'])
+CHART_MONTH_NUMS = np.array([4, 8, 12, 2, 1, 7, 6, 3, 5, 11, 10, 9])
+
+def parseVolumetric(data, now=None):
+    # Parses the price chart on an item listing into parallel arrays:
+    #     hourly datetime64 timestamps, float prices and int volumes, cut to the last 30 days.
+    # Chart points look like ["Jun 20 2019 01: +0",2.345,"12"]. The array is read as JSON rather
+    #     than eval'd, since it is untrusted page content.
     data = data[data.find('var line1')+10:data.find(']];')+2] # Gets all price data from chart
     if data == '': # No recent prices - rarely sold item
-        return []
-    better_data = eval(data) # JS has the same format lists as Python, so eval is fine
-    better_data = [[x[0][:3],x[0][4:6],x[0][7:11],x[0][12:14],x[1]] for x in better_data] # Cuts date info into easily accessible bits
-    month_lookup = {'Jan': 1, 'Feb': 2, 'Mar': 3,
-                    'Apr': 4, 'May': 5, 'Jun': 6,
-                    'Jul': 7, 'Aug': 8, 'Sep': 9,
-                    'Oct': 10, 'Nov': 11, 'Dec': 12}
-    better_data = [[datetime(year=int(x[2]),month=month_lookup[x[0]],day=int(x[1]), hour=int(x[3])),x[4]] for x in better_data]
+        return (np.zeros(0, dtype='datetime64[h]'), np.zeros(0, dtype=np.float64),
+                np.zeros(0, dtype=np.int64))
+    points = np.array(json.loads(data), dtype=object).reshape(-1, 3)
+
+    # Dates have a fixed layout, so cut them into fields on a character view of the string array
+    dates = points[:,0].astype('U14')
+    chars = dates.view('U1').reshape(len(dates), 14)
+    field = lambda a, b: np.ascontiguousarray(chars[:,a:b]).view('U' + str(b-a)).ravel()
+    months = CHART_MONTH_NUMS[np.searchsorted(CHART_MONTHS, field(0, 3))]
+    days = field(4, 6).astype(np.int64)
+    years = field(7, 11).astype(np.int64)
+    hours = field(12, 14).astype(np.int64)
+    timestamps = ((years-1970).astype('datetime64[Y]').astype('datetime64[M]') + (months-1)
+                  ).astype('datetime64[D]') + (days-1)
+    timestamps = timestamps.astype('datetime64[h]') + hours
+    prices = points[:,1].astype(np.float64)
+    volumes = points[:,2].astype(np.int64)
 
     # Cuts data to recent data (within last 30 days of sales)
-    last_month = datetime.now() - timedelta(days=30)
-    now = datetime.now()
-    recent_data = [x for x in better_data if last_month < x[0] < now]
-    
-    return recent_data
+    if now is None:
+        now = datetime.now()
+    now = np.datetime64(now)
+    recent = (now - np.timedelta64(30, 'D') < timestamps) & (timestamps < now)
+    return timestamps[recent], prices[recent], volumes[recent]
+
+def cleanVolumetric(data, now=None):
+    # Parses data from the price chart on an item listing, in the DBdata [[datetime, price], ...] form
+    timestamps, prices, volumes = parseVolumetric(data, now)
+    dates = timestamps.astype('datetime64[s]').astype(object).tolist()
+    return [[date, price] for date, price in zip(dates, prices.tolist())]
 
 class WaitUntil():
     # Enforces that everything inside a "with WaitUntil(10):" block waits 10 seconds to complete
@@ -62,48 +128,64 @@ class WaitUntil():
         return self.start
     def __exit__(self, *args):
         elapsed = time.time() - self.start
+        metrics.count('work_seconds', elapsed)
         if elapsed < self.lengthwait:
+            metrics.count('sleep_seconds', self.lengthwait-elapsed)
             time.sleep(self.lengthwait-elapsed)
 
-def browseItempage(browser, item, navigation_time, firstscan=False):
-    # Input: Browser currently on item page, item obj
-    # Output: Browser still on item page, pagedata dict (scraped info)
+REFRESH_TIMEOUT = 10 # Seconds to wait for #searchResultsRows after a refresh
+
+def readItempage(browser, endpoint='listings'):
+    # Input: Browser currently on item page
+    # Output: the raw page pieces parseItempage needs, read straight off the DOM. Keeping this
+    #     separate lets the browser move on to the next page while these are parsed elsewhere.
     find_css = browser.find_element_by_css_selector
-    haslistings = True
+    raw = dict()
 
     try:
         find_css('#message > h3') # Sorry! You've made too many requests recently. Please wait and...
-        raise Exception('CRITICAL: Server temp-banned you based on request freqency. Turn up selenium_loadtime.')
+        raise Throttled('Server temp-banned you based on request freqency.')
     except NoSuchElementException:
         pass
 
     try:
         prices_element = find_css('#searchResultsRows')
     except NoSuchElementException:
+        limiter.acquire(endpoint) # A refresh is another request
         browser.refresh()
-        time.sleep(navigation_time*2)
+        # The page before the refresh had no results element, so one showing up is the reloaded page
         try:
-            prices_element = find_css('#searchResultsRows')
-        except NoSuchElementException:
+            prices_element = WebDriverWait(browser, REFRESH_TIMEOUT).until(
+                EC.presence_of_element_located((By.CSS_SELECTOR, '#searchResultsRows')))
+        except TimeoutException:
             # Probably no items
-            haslistings = False
-    
-    if haslistings:
-        itemized, IDs = cleanListing(prices_element.get_attribute('outerHTML'))
-    else:
-        itemized, IDs = ([], [])
-    
+            prices_element = None
+    raw['Listings'] = prices_element.get_attribute('outerHTML') if prices_element else None
+
     try:
-        buy_rate = readUSD(find_css('#market_commodity_buyrequests > '
-                                        'span:nth-child(2)').text)
+        raw['Buy Rate'] = find_css('#market_commodity_buyrequests > span:nth-child(2)').text
         # ^^ Highest buy order currently on the market. 
         # If a price drops below this, it will immediately be purchased by the buy orderer.
     except NoSuchElementException:
-        buy_rate = 0 # Sometimes there are no buy orders
-    
-    # Grab volumetric data for recent sales/prices (from chart).
+        raw['Buy Rate'] = None # Sometimes there are no buy orders
+
+    # Volumetric data for recent sales/prices (from chart).
     volumetrics = find_css('body > div.responsive_page_frame.with_header > div.responsive_page_content > div.responsive_page_template_content')
-    recent_data = cleanVolumetric(volumetrics.get_attribute('outerHTML'))
+    raw['Chart'] = volumetrics.get_attribute('outerHTML')
+    return raw
+
+def parseItempage(raw, item, firstscan=False, now=None):
+    # Input: readItempage output, item obj
+    # Output: pagedata dict (scraped info)
+    # "now" is when the page was read (default: this moment); replays pass the recorded time
+    if raw['Listings'] is not None:
+        itemized, _ = cleanListing(raw['Listings']) # Listing IDs aren't kept
+    else:
+        itemized = []
+    buy_rate = readUSD(raw['Buy Rate']) if raw['Buy Rate'] is not None else 0
+    if now is None:
+        now = datetime.now()
+    recent_data = cleanVolumetric(raw['Chart'], now)
     
     pagedata = dict()
     if firstscan:
@@ -120,7 +202,7 @@ def browseItempage(browser, item, navigation_time, firstscan=False):
             'Well-Worn': 3,
             'Battle-Scarred': 4
         }
-        pagedata['Condition'] = to_num(raw_condition_name)
+        pagedata['Condition'] = to_num[raw_condition_name]
     else:
         pagedata['Item Name'] = item['Item Name']
         pagedata['Special Type'] = item['Special Type']
@@ -128,11 +210,44 @@ def browseItempage(browser, item, navigation_time, firstscan=False):
 
     pagedata['Sales/Day'] = round(len(recent_data)/30, 2)
     pagedata['Buy Rate'] = buy_rate
-    pagedata['Date'] = datetime.now()
+    pagedata['Date'] = now
     pagedata['Sales from last month'] = recent_data
     pagedata['Listings'] = itemized
 
-    return browser, pagedata
+    return pagedata
+
+def browseItempage(browser, item, navigation_time, firstscan=False):
+    # Input: Browser currently on item page, item obj
+    # Output: Browser still on item page, pagedata dict (scraped info)
+    return browser, parseItempage(readItempage(browser), item, firstscan)
+
+def fetchItempage(browser, url, attempts=5, endpoint='listings'):
+    # browser.get + readItempage under the "endpoint" budget (shared 'listings' by default). Stale
+    #     pages are reloaded once; the ban page backs every fetcher on that budget off and the page
+    #     is retried.
+    for attempt in range(attempts):
+        limiter.acquire(endpoint)
+        start = time.perf_counter()
+        browser.get(url)
+        try:
+            try:
+                raw = readItempage(browser, endpoint)
+            except StaleElementReferenceException: # Not entirely sure why this happens
+                limiter.acquire(endpoint)
+                browser.get(browser.current_url)
+                raw = readItempage(browser, endpoint)
+        except Throttled:
+            metrics.fetched('fetch_item', start)
+            time.sleep(limiter.throttled(endpoint))
+            continue
+        metrics.fetched('fetch_item', start, 'item_pages')
+        limiter.success(endpoint)
+        return browser, raw
+    raise Throttled('CRITICAL: Still temp-banned after ' + str(attempts) + ' attempts. Turn up selenium_loadtime.')
+
+def loadItempage(browser, url, item, navigation_time, firstscan=False, attempts=5):
+    browser, raw = fetchItempage(browser, url, attempts)
+    return browser, parseItempage(raw, item, firstscan)
 
 def steamLogin(browser, username, password, navigation_time):
     find_css = browser.find_element_by_css_selector
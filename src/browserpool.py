@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### A pool of headless browser sessions for item page scans.
+### Every session has its own webdriver (so its own cookie jar) and its own 'listings/<n>' rate
+###     budget, and works through items from a shared work queue. Ban pages and stale elements
+###     are retried inside the session that hit them; an item its session gives up on (or fails on
+###     any other way) goes back on the queue for another one. Scraped pages are handed to a single callback, so DBdata keeps
+###     one writer.
+
+from selenium import webdriver              # Headless item page sessions
+import threading                            # One thread per session
+import queue                                # Work shared by the sessions
+
+from browse_itempage import fetchItempage   # Rate limited page load + raw DOM read
+from ratelimit import limiter               # Per-session budgets
+
+STEAM_BASE = 'https://steamcommunity.com'
+RECHECK = 0.05 # Seconds an idle session waits before looking at the work queue again
+
+def headlessChrome():
+    options = webdriver.ChromeOptions()
+    options.add_argument('--headless=new')
+    options.add_argument('--disable-gpu')
+    return webdriver.Chrome(options=options)
+
+class BrowserSession:
+    def __init__(self, number, make_browser=headlessChrome, interval=None, cookies=None, base=STEAM_BASE):
+        # "cookies" (e.g. browser.get_cookies() from a logged in browser) are copied into this
+        #     session's jar; Selenium can only set cookies for the domain currently loaded.
+        self.number = number
+        self.endpoint = 'listings/' + str(number)
+        self.browser = make_browser()
+        self.fetched = 0
+        self.failed = 0
+        limiter.bucket(self.endpoint, interval)
+        if cookies:
+            self.browser.get(base)
+            for cookie in cookies:
+                self.browser.add_cookie({key: cookie[key] for key in ('name', 'value', 'path', 'secure')
+                                         if key in cookie})
+
+    def fetch(self, url, attempts=5):
+        self.browser, raw = fetchItempage(self.browser, url, attempts, endpoint=self.endpoint)
+        self.fetched += 1
+        return raw
+
+    def close(self):
+        self.browser.quit()
+
+class BrowserPool:
+    def __init__(self, sessions=4, make_browser=headlessChrome, interval=None, cookies=None,
+                 base=STEAM_BASE, retries=2):
+        # "retries" is how many more sessions an item is offered to after one gives up on it
+        self.sessions = [BrowserSession(n, make_browser, interval, cookies, base) for n in range(sessions)]
+        self.retries = retries
+
+    def scan(self, jobs, on_page, attempts=5):
+        # "jobs" is a list of (url, context) pairs. on_page(context, raw) is called from the session
+        #     threads as pages come in, so it should only hand off (e.g. Pipeline.emit).
+        # Returns the contexts that no session managed to load.
+        # Sessions stay up until every job is settled, so an item one session gave up on is only
+        #     taken by sessions that haven't tried it yet.
+        work = queue.Queue()
+        for url, context in jobs:
+            work.put((url, context, frozenset()))
+        dropped = []
+        errors = []
+        lock = threading.Lock()
+        pending = [len(jobs)] # Jobs not yet loaded or dropped
+        stop = threading.Event()
+
+        def settle():
+            with lock:
+                pending[0] -= 1
+                if pending[0] == 0:
+                    stop.set()
+
+        def worker(session):
+            while not stop.is_set():
+                try:
+                    url, context, tried = work.get(timeout=RECHECK)
+                except queue.Empty:
+                    continue
+                if session.number in tried: # Leave it for a session that hasn't tried it
+                    work.put((url, context, tried))
+                    stop.wait(RECHECK)
+                    continue
+                try:
+                    raw = session.fetch(url, attempts)
+                except Exception as e: # Throttled, or a dead webdriver, missing element, network error...
+                    session.failed += 1
+                    print('Session', session.number, 'gave up on', url, '-', e)
+                    tried = tried | {session.number}
+                    if len(tried) <= self.retries and len(tried) < len(self.sessions):
+                        work.put((url, context, tried))
+                    else:
+                        dropped.append(context)
+                        settle()
+                    continue
+                try:
+                    on_page(context, raw)
+                except Exception as e: # Stop every session; re-raised below
+                    errors.append(e)
+                    stop.set()
+                    return
+                settle()
+
+        if not jobs:
+            return dropped
+
+        threads = [threading.Thread(target=worker, args=(session,), daemon=True) for session in self.sessions]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return dropped
+
+    def stats(self):
+        return [{'Session': x.number, 'Fetched': x.fetched, 'Failed': x.failed,
+                 'Interval': round(limiter.interval(x.endpoint), 2)} for x in self.sessions]
+
+    def close(self):
+        for session in self.sessions:
+            session.close()
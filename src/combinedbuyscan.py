@@ -5,26 +5,27 @@
 ### PURPOSE:
 ### Alternate between doing selenium updates (high fidelity, 1 item/selenium_loadtime)
 ###     and json updates (low fidelity - only price, and 100 item/selenium_loadtime)
-### TODO: Implement concurrency and see how it works out.
+### Pages are fetched, parsed, evaluated and persisted in a staged pipeline (see pipeline.py).
 
 ####################################################################################################
 
 ### External libraries
 from selenium import webdriver              # Web navigation
-import pandas as pd                         # Primary dataset format
-from sty import fg                          # Color stdout printing
 
 ### Standard libraries
-from collections import deque               # Flexible structure for reacting to incoming information
-from copy import deepcopy                   # Working around how Python does references
 import warnings                             # Mute PerformanceWarning during pd.to_hdf
 
 ### Local Functions
 from combinedfuncs import getLoginInfo
-from combinedfuncs import selenium_search, json_search
+from combinedfuncs import json_search       # Step function(s) used in the pattern below
+from combinedfuncs import SOURCES           # Pattern step -> pipeline source
+from pipeline import Pipeline               # fetch -> parse -> evaluate -> persist stages
+from replay import Recorder                 # Saves fetched pages for replay.py
+from metrics import metrics                 # Per-stage latencies and throughput, flushed to a file
+from journal import openJournal
+from statestore import openStateStore       # Scan cursors and ban log
+from ratelimit import limiter
 from browse_itempage import steamLogin
-from analysis import filterPrint
-from analysis import standardFilter
 
 ### Hyperparameters {
 selenium_loadtime = 2.5 # Selenium page loadtime
@@ -34,11 +35,16 @@ json_loadtime = 10      # Json page loadtime
                         # but it does seem to ban lower than this speed.
 identity = 'Syris'
 verbose = True          # Print data about each item when scanned
+queue_size = 8          # Most jobs waiting between any two pipeline stages
+record = False          # Save every fetched page to ../data/recordings for replay.py
+metrics_file = '../data/metrics.jsonl' # Or a .prom file for Prometheus' textfile collector
+metrics_every = 60      # Seconds between metrics flushes
 # Pattern: list of dicts (each of which represent steps) to be cycled over
-#     [MANDATORY] step 'Method' is a function
+#     [MANDATORY] step 'Method' is a function; import the ones you use from combinedfuncs (selenium_search,
+#     scheduled_selenium_search, pooled_selenium_search, async_json_search, json_search)
 #     The rest are optional inputs specific to that 'Method' function
-# Implementation detail: make sure the wait happens at the end of the function; this will allow
-#     methods to overlap nicely.
+# Steps are fetched in order by one thread (it owns the browser); parsing, strategy evaluation and
+#     writes happen in later stages while the next page loads.
 pattern = [
     # {
     #     'Method': selenium_search,
@@ -47,10 +53,32 @@ pattern = [
     #     'Verbose': verbose,
     #     'Start 0, halt on full scan': True
     # }
+    # {
+    #     'Method': scheduled_selenium_search, # Rescans the items most likely to turn up a buy
+    #     'Pages': 15,
+    #     'Load Time': selenium_loadtime,
+    #     'Verbose': verbose,
+    #     'LTTQH Percent': 1.15             # Buy line the scheduler aims scans at
+    # }
+    # {
+    #     'Method': pooled_selenium_search, # Headless sessions, each with its own budget
+    #     'Pages': 60,
+    #     'Sessions': 4,
+    #     'Load Time': selenium_loadtime,   # Starting seconds/request per session
+    #     'Verbose': verbose
+    # }
+    # {
+    #     'Method': async_json_search, # All conditions per step, no browser needed
+    #     'Load Time': json_loadtime,  # Spacing between request starts
+    #     'Concurrency': 2,            # Requests in flight at once
+    #     'Verbose': verbose,
+    #     'LTTQH Percent': 1.15
+    # }
     {
         'Method': json_search,
         'Load Time': json_loadtime,
         'Verbose': verbose,
+        'HTTP': True,         # Keep-alive HTTP client; False loads the JSON through the browser
         'LTTQH Percent': 1.15 # Might as well log everything theoretically profitable and filter in post
     }
 ]
@@ -60,44 +88,20 @@ warnings.simplefilter('ignore') # Not best practice, but wasn't sure how to make
 
 ####################################################################################################
 
-class QueueExecuter:
-    def __init__(self, curr_queue, DBdata):
-        self.base_queue = deepcopy(curr_queue)
-        self.curr_queue = curr_queue
-        self.step = self.curr_queue.popleft()
-        self.DBdata = DBdata
-    def run(self, browser_obj):
-        print(self.step)
-        infodict = self.step
-        fxn = deepcopy(infodict['Method'])
-        del infodict['Method']
-
-        if infodict: # Nonempty
-            browser_obj, self.DBdata, self.curr_queue = fxn(browser_obj, self.DBdata, self.curr_queue, infodict)
-        else:
-            browser_obj, self.DBdata, self.curr_queue = fxn(browser_obj, self.DBdata, self.curr_queue)
-        
-        if len(self.curr_queue) == 0:
-            self.curr_queue = deepcopy(self.base_queue)
-            self.step = self.curr_queue.popleft()
-        else:
-            self.step = self.curr_queue.popleft()
-        return browser_obj
-
-####################################################################################################
-
 if __name__ == '__main__':
-    # Import dataset, filter to high volume
-    DBdata = pd.read_hdf('../data/item_info.h5', 'csgo')
-
-    # Login
-    browser = webdriver.Chrome()
-    username, password = getLoginInfo(identity)
-    browser = steamLogin(browser, username, password, selenium_loadtime)
-
-    # Set pattern to repeat
-    base_queue = deque(pattern)
-
-    executer = QueueExecuter(base_queue, DBdata)
-    while True:
-        browser = executer.run(browser)
+    # Import dataset (replaying any journaled rows from an unclean shutdown), filter to high volume
+    DBdata = openJournal('../data/item_info.h5').load()
+    limiter.on_throttle = openStateStore().ban # Keep a record of every ban
+    metrics.start(metrics_file, every=metrics_every)
+
+    # Set pattern to repeat; each step becomes a source feeding the fetch stage, in order
+    sources = [SOURCES[step['Method']](step) for step in pattern]
+
+    # Login, only if some step loads pages through the browser. JSON-only patterns go over plain HTTP.
+    browser = None
+    if any(source.needs_browser for source in sources):
+        browser = webdriver.Chrome()
+        username, password = getLoginInfo(identity)
+        browser = steamLogin(browser, username, password, selenium_loadtime)
+    recorder = Recorder() if record else None
+    Pipeline(sources, browser, DBdata, maxsize=queue_size, verbose=verbose, recorder=recorder).run()
@@ -3,24 +3,34 @@
 # Author: Syris Norelli, snore001@ucr.edu
 
 ### External Libraries
-from selenium import webdriver              # Primary navigation of Steam price data.
-from selenium.common.exceptions import NoSuchElementException
-from selenium.common.exceptions import StaleElementReferenceException
-                                            # ^^ Dealing with page load failure.
 import pandas as pd                         # Primary dataset format
+import numpy as np
 from sty import fg                          # Convenient cross-platform color printing
 
 ### Standard libraries
 import time                                 # Waiting so no server-side ban
 from datetime import datetime               # Used for printing an error message and logging hash overlap
-import json                                 # Metadata read/write
+import json                                 # Login info, JSON pages
+import threading                            # Sources share DBdata with the pipeline's stages
 
 ### Local Functions
 from analysis import filterPrint            # Pretty printing by info in dict
 from analysis import LessThanThirdQuartileHistorical # Alerts during selenium_search
 from analysis import standardFilter         # These are the only items that matter
-from browse_itempage import browseItempage  # Scrapes data from Steam item pages
-from browse_itempage import WaitUntil       # Implements standard page waits in with block
+from browse_itempage import fetchItempage   # Loads Steam item pages under the shared rate limiter
+from browse_itempage import parseItempage   # Scrapes data from the loaded pages
+from matchlog import MatchLog               # Append-only log of strategy matches
+from journal import openJournal             # Background, journaled writes of changed DBdata rows
+from asyncscan import AsyncSearchScanner    # Concurrent market/search/render fetches
+from asyncscan import CONDITIONS
+from ratelimit import limiter, Throttled    # Shared per-endpoint request budget
+from browserpool import BrowserPool         # Headless sessions for pooled item page scans
+from scheduler import RescanScheduler      # Value-driven rescan order
+from httpclient import SteamHTTP, ClientFailure # Keep-alive JSON fetches without the browser
+from orderstats import openQuartileIndex    # Live per-item quartiles for LTTQH
+from itemindex import openItemIndex         # Shared item name -> DBdata label lookups
+from statestore import openStateStore       # Scan cursors, item scan times, counters
+from metrics import metrics                 # Per-stage latencies and throughput
 
 ####################################################################################################
 
@@ -29,23 +39,11 @@ def getLoginInfo(identity):
         data = json.load(f)
     return (data[identity]['Username'], data[identity]['Password'])
 
-def getMetadata(filename):
-    with open(filename,'r') as f:
-        metadata = json.load(f)
-    return metadata
-
-def updateMetadata(filename, update_dict):
-    # Assume metadata file isn't too big, so just do file I/O instead of taking metadata as a param
-    metadata = getMetadata(filename)
-    for key in update_dict:
-        metadata[key] = update_dict[key]
-    with open(filename, 'w') as f:
-        json.dump(metadata, f, indent=4)
-
 def writeMatch(filename, append_df):
-    matches = pd.read_hdf(filename, 'csgo')
-    matches = matches.append(append_df, ignore_index = True)
-    matches.to_hdf(filename, 'csgo', mode='w')
+    # Only the new rows are written; see matchlog.py
+    with metrics.time('match_write'):
+        MatchLog(filename).append(append_df)
+    metrics.count('matches', len(append_df.index))
 
 class Timer():
     def __init__(self):
@@ -59,154 +57,348 @@ class Timer():
 
 ####################################################################################################
 
-def selenium_search(browser, DBdata, curr_queue, infodict):
-    ### Hyperparameters {
-    pages_to_scan = infodict['Pages']
-    navigation_time = infodict['Load Time']
-    verbose = infodict['Verbose']
+# Each step function in a combinedbuyscan pattern has a source class that splits the step into
+#     fetch -> parse -> evaluate -> persist (see pipeline.py). The step functions themselves run
+#     those pieces back to back.
+
+def runSerially(source, browser, DBdata):
+    source.lock = threading.Lock()
+    serial = threading.Lock() # Sources may emit from several threads; DBdata keeps one writer
+    def emit(job):
+        with serial:
+            job = source.parse(job)
+            job = source.evaluate(job, DBdata)
+            source.persist(job)
+    return source.fetch(browser, DBdata, emit) or browser
 
-    metadata = getMetadata('combineddata.json')
-    current_iloc = metadata['selenium_iloc']
+class SeleniumSource:
     item_base_url = 'https://steamcommunity.com/market/listings/730/'
-    ### }
-
-    # IT'S VERY IMPORTANT THAT FILTERING HAPPENS HERE.
-    # If it happens earlier, DBdata is written as the filtered version, which causes dataset loss.
-    of_interest = standardFilter(DBdata)
-    dflength = len(of_interest.index)
-
-    for i in range(pages_to_scan):
-        item = of_interest.iloc[current_iloc]
-        DBdata_index = of_interest.index[current_iloc]
-        
-        browser.get(item_base_url + item['Item Name'])
-        with WaitUntil(navigation_time):
-            # Obtains all the page information and throws it into a dict called pagedata
-            try:
-                browser, pagedata = browseItempage(browser, item, navigation_time)
-            except StaleElementReferenceException: # Not entirely sure why this happens
-                browser.get(browser.current_url)
-                browser, pagedata = browseItempage(browser, item, navigation_time)
-
-            newentry = pd.Series(pagedata)
-            DBdata.loc[DBdata_index] = newentry
-
-            if pagedata['Listings']: # Nonempty
-                # TODO: Log this in a different way
-                # model = LessThanThirdQuartileHistorical(1.30, [8,0])
-                # printkeys = model.printkeys
-                # satdf = model.run(pd.DataFrame([newentry]))
-                # if len(satdf.index) > 0:
-                #     print(fg.li_green + '!!!! Found a Q3 satisfying item' + fg.rs)
-                #     filterPrint(satdf, keys=printkeys, color=fg.li_green)
-                if verbose:
-                    print('    ' + str(DBdata_index+1) + '.', item['Item Name'], pagedata['Listings'][0], pagedata["Sales/Day"])
-            else:
-                if verbose:
-                    print('    ' + str(DBdata_index+1) + '.', item['Item Name'], '[]', pagedata["Sales/Day"])
-            current_iloc += 1
-            if current_iloc >= dflength:
-                print('Index reset!')
-                current_iloc = 0
-
-    DBdata.to_hdf('../data/item_info.h5', 'csgo', mode='w')
-    if verbose:
-        print('    [SELENIUM WROTE TO FILE.]')
-    
-    metadata_update = {
-        'selenium_iloc': current_iloc
-    }
-    updateMetadata('combineddata.json', metadata_update)
-    
+    needs_browser = True
+
+    def __init__(self, infodict):
+        ### Hyperparameters {
+        self.pages_to_scan = infodict['Pages']
+        self.navigation_time = infodict['Load Time']
+        self.verbose = infodict['Verbose']
+        ### }
+        self.of_interest = None
+        self.lock = threading.Lock()
+
+    def itemsOfInterest(self, DBdata):
+        # IT'S VERY IMPORTANT THAT FILTERING HAPPENS HERE.
+        # If it happens earlier, DBdata is written as the filtered version, which causes dataset loss.
+        # Only names and types are read from it while pages are in flight, so it's refreshed per pass.
+        if self.of_interest is None:
+            with self.lock:
+                self.of_interest = standardFilter(DBdata)[['Item Name', 'Special Type', 'Condition']]
+        return self.of_interest
+
+    def claimBatch(self, DBdata):
+        # The next 'Pages' items in selenium_iloc order. The cursor is read and moved on in one
+        #     transaction, so scanners sharing the state store never get the same items.
+        of_interest = self.itemsOfInterest(DBdata)
+        dflength = len(of_interest.index)
+        start = openStateStore().advance('selenium_iloc', self.pages_to_scan, modulo=dflength)
+        if start + self.pages_to_scan >= dflength:
+            print('Index reset!')
+            self.of_interest = None # Picks up the refreshed item list on the next pass
+        return of_interest.iloc[start:start + self.pages_to_scan]
+
+    def fetch(self, browser, DBdata, emit):
+        limiter.bucket('listings', self.navigation_time) # Seeds the shared budget on first use
+        for DBdata_index, item in self.claimBatch(DBdata).iterrows():
+            browser, raw = fetchItempage(browser, self.item_base_url + item['Item Name'])
+            emit({'Source': self, 'Label': DBdata_index, 'Item': item, 'Raw': raw})
+        return browser
+
+    def parse(self, job):
+        # Obtains all the page information and throws it into a dict called pagedata
+        job['Pagedata'] = parseItempage(job['Raw'], job['Item'])
+        return job
+
+    def evaluate(self, job, DBdata):
+        DBdata_index = job['Label']
+        pagedata = job['Pagedata']
+        DBdata.loc[DBdata_index] = pd.Series(pagedata)
+        openQuartileIndex(DBdata).update(DBdata_index, pagedata['Sales from last month'])
+
+        if pagedata['Listings']: # Nonempty
+            # TODO: Log this in a different way
+            # model = LessThanThirdQuartileHistorical(1.30, [8,0])
+            # printkeys = model.printkeys
+            # satdf = model.run(pd.DataFrame([newentry]))
+            # if len(satdf.index) > 0:
+            #     print(fg.li_green + '!!!! Found a Q3 satisfying item' + fg.rs)
+            #     filterPrint(satdf, keys=printkeys, color=fg.li_green)
+            if self.verbose:
+                print('    ' + str(DBdata_index+1) + '.', pagedata['Item Name'], pagedata['Listings'][0], pagedata["Sales/Day"])
+        else:
+            if self.verbose:
+                print('    ' + str(DBdata_index+1) + '.', pagedata['Item Name'], '[]', pagedata["Sales/Day"])
+        return job
+
+    def persist(self, job):
+        openJournal('../data/item_info.h5').record(job['Label'], job['Pagedata'])
+        state = openStateStore()
+        state.scanned([job['Label']])
+        state.count('Item pages')
+
+def selenium_search(browser, DBdata, curr_queue, infodict):
+    browser = runSerially(SeleniumSource(infodict), browser, DBdata)
     return (browser, DBdata, curr_queue)
 
-def json_search(browser, DBdata, curr_queue, infodict):
+class PooledSeleniumSource(SeleniumSource):
+    # SeleniumSource over a pool of headless sessions (see browserpool.py). Each pass takes the
+    #     next 'Pages' items and spreads them over the sessions; pages come back in any order.
+    def __init__(self, infodict):
+        SeleniumSource.__init__(self, infodict)
+        self.sessions = infodict['Sessions']
+        self.pool = None
+
+    def fetch(self, browser, DBdata, emit):
+        if self.pool is None: # Sessions start with the main browser's cookies, if there is one
+            cookies = browser.get_cookies() if browser is not None else None
+            self.pool = BrowserPool(self.sessions, interval=self.navigation_time, cookies=cookies)
+        batch = self.claimBatch(DBdata)
 
-    ### Hyperparameters {
-    navigation_time = infodict['Load Time']
-    verbose = infodict['Verbose']
-    LTTQH_percent = infodict['LTTQH Percent']
+        def on_page(context, raw):
+            DBdata_index, item = context
+            emit({'Source': self, 'Label': DBdata_index, 'Item': item, 'Raw': raw})
 
-    metadata = getMetadata('combineddata.json')
-    condition = metadata['json_condition']
-    ### }
+        jobs = [(self.item_base_url + item['Item Name'], (DBdata_index, item))
+                for DBdata_index, item in batch.iterrows()]
+        dropped = self.pool.scan(jobs, on_page)
+        if dropped:
+            print('Skipped', len(dropped), 'items this pass; every session was throttled on them.')
+        return browser
+
+def pooled_selenium_search(browser, DBdata, curr_queue, infodict):
+    source = PooledSeleniumSource(infodict)
+    try:
+        browser = runSerially(source, browser, DBdata)
+    finally:
+        if source.pool is not None:
+            source.pool.close()
+    return (browser, DBdata, curr_queue)
 
-    conditions = [0, # Factory New
-                  1, # Minimal Wear
-                  2, # Field-Tested
-                  3, # Well-Worn
-                  4] # Battle-Scarred
+class ScheduledSeleniumSource(SeleniumSource):
+    # SeleniumSource where each pass scans the 'Pages' items a RescanScheduler rates most worth
+    #     another look (see scheduler.py) instead of the next ones in selenium_iloc order. Last scan
+    #     times come from DBdata's 'Date', so nothing else needs saving between runs.
+    def __init__(self, infodict):
+        SeleniumSource.__init__(self, infodict)
+        self.LTTQH_percent = infodict['LTTQH Percent']
+        self.scheduler = None
 
-    price_query_url = ('https://steamcommunity.com/market/search/render/?category_730_ItemSet&'
-                       'appid=730&norender=1&category_730_Exterior%5B%5D=tag_WearCategory' + str(condition) +
-                       '&count=100&start=') # Can't put count higher, unfortunately
+    def fetch(self, browser, DBdata, emit):
+        limiter.bucket('listings', self.navigation_time) # Seeds the shared budget on first use
+        with self.lock: # The evaluate stage rescores items and writes DBdata under the same lock
+            if self.scheduler is None:
+                self.scheduler = RescanScheduler.fromDF(standardFilter(DBdata), percentage=self.LTTQH_percent,
+                                                        qindex=openQuartileIndex(DBdata))
+            labels = self.scheduler.take(self.pages_to_scan)
+            items = DBdata.loc[labels, ['Item Name', 'Special Type', 'Condition']]
 
-    find_xpath = browser.find_element_by_xpath
+        for DBdata_index, item in items.iterrows():
+            browser, raw = fetchItempage(browser, self.item_base_url + item['Item Name'])
+            emit({'Source': self, 'Label': DBdata_index, 'Item': item, 'Raw': raw})
+        return browser
 
+    def evaluate(self, job, DBdata):
+        job = SeleniumSource.evaluate(self, job, DBdata)
+        self.scheduler.observe(job['Label'], job['Pagedata'])
+        return job
+
+def scheduled_selenium_search(browser, DBdata, curr_queue, infodict):
+    browser = runSerially(ScheduledSeleniumSource(infodict), browser, DBdata)
+    return (browser, DBdata, curr_queue)
+
+def readBrowserJSON(browser, url):
+    # Parsed JSON body of a page loaded in the browser, or None if it isn't JSON (502 page)
+    browser.get(url)
+    text = browser.find_element_by_xpath('//body').text
     try:
-        browser.get(price_query_url + '0')
-        text = find_xpath('//body').text
-        response = json.loads(text)
+        return json.loads(text)
     except json.decoder.JSONDecodeError:
-        # TODO: Implement exponential backoff here
-        print('502 Bad Gateway, waiting longer')
-        time.sleep(navigation_time*5)
-        browser.get(price_query_url + '0')
-        text = find_xpath('//body').text
-        response = json.loads(text)
-    
-    with WaitUntil(navigation_time):
+        return None
+
+def loadJSON(browser, url, client=None, endpoint='search', attempts=5):
+    # Loads a JSON endpoint under the shared limiter, over the pooled HTTP client if there is one.
+    #     The browser is only used without a client, or for a request the client got no answer to
+    #     for some reason other than throttling (dropped connection, login page).
+    # A throttle status from the client, or a non-JSON body or null result, counts as throttling:
+    #     the endpoint backs off and the page is retried. Any other client failure (connection or
+    #     parse error) with no browser to fall back on isn't Steam limiting us, so the page is
+    #     skipped (None) and the rate budget is left alone.
+    for attempt in range(attempts):
+        limiter.acquire(endpoint)
+        start = time.perf_counter()
+        response = None
         try:
-            success = response['success']
-        except TypeError:
-            print('Uh oh, null result. Increase navigation_time. Server cooldown is roughly 5 minutes.')
-            print('Waiting...')
-            time.sleep(60*5)
-            raise Exception('Restart program, please.')
+            if client is None:
+                response = readBrowserJSON(browser, url)
+            else:
+                response = client.getJSON(url)
+        except Throttled:
+            pass
+        except ClientFailure as e:
+            if browser is None:
+                metrics.fetched('fetch_search', start)
+                print('HTTP client failed (' + str(e) + '), skipping', url)
+                return None
+            print('HTTP client failed (' + str(e) + '), loading through the browser.')
+            response = readBrowserJSON(browser, url)
+        if isinstance(response, dict) and response.get('success'):
+            metrics.fetched('fetch_search', start, 'search_pages')
+            limiter.success(endpoint)
+            return response
+        metrics.fetched('fetch_search', start)
+        time.sleep(limiter.throttled(endpoint))
+    raise Throttled('Still throttled after ' + str(attempts) + ' attempts: ' + url)
 
+def searchMatches(DBdata, names, prices, LTTQH_percent, now=None, verbose=True, itemindex=None, qindex=None):
+    # Runs LTTQH over the items on one market/search/render page, using the page's lowest price as
+    #     the listing. Matches are printed and returned.
+    # "now" stamps the matches (default: this moment); replays pass the recorded time.
+    # "itemindex" and "qindex" default to the process-wide ones for DBdata; replays pass their own.
+    # Cut to relevant data: resolve the page's names to DBdata rows in one lookup, and use the
+    #     page's sell price as the only listing
+    with metrics.time('strategy'):
+        if itemindex is None:
+            itemindex = openItemIndex(DBdata)
+        if qindex is None:
+            qindex = openQuartileIndex(DBdata, [8,0])
+        labels = itemindex.lookup(names)
+        known = (labels >= 0) & ~pd.Index(names).duplicated(keep='last') # Last price for a name wins
+        order = np.argsort(labels[known], kind='stable') # Keep DBdata's row order
+        filteredDBdata = DBdata.loc[labels[known][order]]
+        filteredDBdata = filteredDBdata.assign(Listings=[(price,) for price in prices[known][order]])
+        satdf = LessThanThirdQuartileHistorical(LTTQH_percent, [8,0]).run(filteredDBdata, qindex=qindex)
+    if len(satdf.index) > 0:
+        satdf = satdf.sort_values('Ratio', ascending=False)
         if verbose:
+            print(fg.li_green, end='')
+            filterPrint(satdf, printval=50, keys=['Item Name', 'Buy Rate', 'Sales/Day', 'Lowest Listing', 'Q3', 'Ratio'])
+            print(fg.rs, end='')
+        satdf['Date'] = datetime.now() if now is None else now # Overwrite with time of match
+    return satdf
+
+def searchPage(results):
+    # Names and lowest prices (in dollars) off one market/search/render page
+    names = [res['name'] for res in results]
+    prices = np.array([round(res['sell_price']/100, 2) for res in results])
+    return names, prices
+
+def evaluateSearchResults(DBdata, results, LTTQH_percent):
+    # searchMatches on a page of results, with matches logged
+    satdf = searchMatches(DBdata, *searchPage(results), LTTQH_percent)
+    if len(satdf.index) > 0:
+        writeMatch('../data/LTTQHitems.h5', satdf)
+    return satdf
+
+class JSONSource:
+    conditions = CONDITIONS
+
+    def __init__(self, infodict):
+        ### Hyperparameters {
+        self.navigation_time = infodict['Load Time']
+        self.verbose = infodict['Verbose']
+        self.LTTQH_percent = infodict['LTTQH Percent']
+        self.use_http = infodict.get('HTTP', True) # Plain HTTP instead of the browser
+        ### }
+        self.needs_browser = not self.use_http
+        self.client = None
+        self.lock = threading.Lock()
+
+    def httpClient(self, browser):
+        # Built on first use, with the logged-in browser's cookies if there is a browser
+        if self.client is None:
+            self.client = SteamHTTP.fromBrowser(browser) if browser is not None else SteamHTTP()
+        return self.client
+
+    def fetch(self, browser, DBdata, emit):
+        # Claims the next condition; scanners sharing the state store each get a different one
+        condition = self.conditions[openStateStore().advance('json_condition', 1, len(self.conditions))]
+        price_query_url = ('https://steamcommunity.com/market/search/render/?category_730_ItemSet&'
+                           'appid=730&norender=1&category_730_Exterior%5B%5D=tag_WearCategory' + str(condition) +
+                           '&count=100&start=') # Can't put count higher, unfortunately
+
+        limiter.bucket('search', self.navigation_time) # Seeds the shared budget on first use
+        client = self.httpClient(browser) if self.use_http else None
+        response = loadJSON(browser, price_query_url + '0', client)
+        if response is None:
+            print('Uh oh, failed pull for', [condition], '- skipping it this cycle.')
+            return browser
+
+        if self.verbose:
             print(fg(245), end='')
             print('    Checking out', [condition], '(first 100 method)')
             # Note that the 100 are ROUGHLY randomized. Not sure if they actually are; it seems like
             # it might be on a cycle.
             print(fg.rs, end='')
-        results = response['results']
-        # Cut to relevant data
-        json_name_dict = dict()
-        for res in results:
-            json_name_dict[res['name']] = {
-                'sell_price': round(res['sell_price']/100, 2),
-                'sell_listings_num': res['sell_listings'] # Don't think this is needed
-            }
-
-        ############################################################################################
-
-        filteredDBdata = DBdata[DBdata['Item Name'].isin(json_name_dict)]
-        def convertListings(row):
-            row['Listings'] = (json_name_dict[row['Item Name']]['sell_price'],)
-            return row
-        filteredDBdata = filteredDBdata.apply(convertListings, axis=1)
-        satdf = LessThanThirdQuartileHistorical(LTTQH_percent, [8,0]).run(filteredDBdata)
-        if len(satdf.index) > 0:
-            satdf = satdf.sort_values('Ratio', ascending=False)
-            print(fg.li_green, end='')
-            filterPrint(satdf, printval=50, keys=['Item Name', 'Buy Rate', 'Sales/Day', 'Lowest Listing', 'Q3', 'Ratio'])
-            print(fg.rs, end='')
-            satdf.date = datetime.now() # Overwrite with time of match
-            writeMatch('../data/LTTQHitems.h5', satdf)
-
-        ############################################################################################
-
-        # Update condition and condition_loc
-        size = response['total_count']
-        condition_num = conditions.index(condition)
-        if condition_num == len(conditions) - 1:
-            metadata_update = {
-                'json_condition': 0
-            }
-        else:
-            metadata_update = {
-                'json_condition': conditions[condition_num+1],
-            }
-        updateMetadata('combineddata.json', metadata_update)
+        emit({'Source': self, 'Condition': condition, 'Response': response})
+        return browser
+
+    def parse(self, job):
+        job['Names'], job['Prices'] = searchPage(job['Response']['results'])
+        return job
+
+    def evaluate(self, job, DBdata):
+        job['Matches'] = searchMatches(DBdata, job['Names'], job['Prices'], self.LTTQH_percent)
+        return job
+
+    def persist(self, job):
+        if len(job['Matches'].index) > 0:
+            writeMatch('../data/LTTQHitems.h5', job['Matches'])
+        openStateStore().count('Search pages')
+
+def json_search(browser, DBdata, curr_queue, infodict):
+    source = JSONSource(infodict)
+    try:
+        browser = runSerially(source, browser, DBdata)
+    finally:
+        if source.client is not None:
+            source.client.close()
     return (browser, DBdata, curr_queue)
+
+class AsyncJSONSource(JSONSource):
+    # Same strategy pass as JSONSource, but the first page of every condition is fetched
+    #     concurrently over plain HTTP and handed on as each one arrives. The browser isn't used.
+    def __init__(self, infodict):
+        JSONSource.__init__(self, infodict)
+        self.concurrency = infodict['Concurrency']
+        self.needs_browser = False
+
+    def fetch(self, browser, DBdata, emit):
+        def on_page(condition, start, response):
+            if not response or not response.get('success'):
+                print('Uh oh, failed pull for', [condition], '- skipping it this cycle.')
+                return
+            if self.verbose:
+                print(fg(245), end='')
+                print('    Checking out', [condition], '(async first 100 method)')
+                print(fg.rs, end='')
+            emit({'Source': self, 'Condition': condition, 'Response': response})
+
+        scanner = AsyncSearchScanner(concurrency=self.concurrency, interval=self.navigation_time,
+                                     fetch=self.httpClient(browser).fetch)
+        scanner.run(scanner.scan([(condition, 0) for condition in CONDITIONS], on_page))
+        return browser
+
+def async_json_search(browser, DBdata, curr_queue, infodict):
+    source = AsyncJSONSource(infodict)
+    try:
+        browser = runSerially(source, browser, DBdata)
+    finally:
+        if source.client is not None:
+            source.client.close()
+    return (browser, DBdata, curr_queue)
+
+# Pattern 'Method' -> source class, for running a pattern as a pipeline
+SOURCES = {
+    selenium_search: SeleniumSource,
+    pooled_selenium_search: PooledSeleniumSource,
+    scheduled_selenium_search: ScheduledSeleniumSource,
+    json_search: JSONSource,
+    async_json_search: AsyncJSONSource,
+}
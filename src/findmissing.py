@@ -7,17 +7,30 @@ import pandas as pd                         # Primary dataset format
 ### Standard libraries
 import time                                 # Waiting so no server-side ban
 import json
+import os                                   # Atomic checkpoint replace
 
 ### Local Functions
-from browse_itempage import browseItempage  # Scrapes data from Steam item pages
-from browse_itempage import WaitUntil       # Implements standard page waits in with block
+from browse_itempage import loadItempage    # Scrapes data from Steam item pages, rate limited
+from ratelimit import limiter               # Shared per-endpoint request budget
 from browse_itempage import steamLogin      # Make code more readable
 from combinedfuncs import getLoginInfo
+from journal import openJournal             # Background, journaled writes of new DBdata rows
+from itemindex import ItemIndex             # Names already in DBdata
 
 ####################################################################################################
 
-navigation_time = 2
+navigation_time = 2 # Starting seconds/request; the shared limiter adapts it from there
 identity = 'Syris'
+flush_every = 50    # Scraped items buffered before they're handed to the journal and checkpointed
+
+def writeCheckpoint(filename, position):
+    # Atomic: the resume pointer is either the old value or the new one, never a torn file
+    temp = filename + '.tmp'
+    with open(temp, 'w') as f:
+        json.dump({'Current_missing': position}, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, filename)
 
 with open('missinglog.json','r') as f:
     startloc = json.load(f)['Current_missing']
@@ -25,33 +38,60 @@ with open('missinglog.json','r') as f:
 with open('../data/missing.json','r') as f:
     missing = json.load(f)
 
-DBdata = pd.read_hdf('../data/item_info.h5', 'csgo')
+journal = openJournal('../data/item_info.h5')
+DBdata = journal.load()
+known = ItemIndex.fromDF(DBdata) # Items already backfilled (e.g. before a crash) are skipped
 
 base = 'https://steamcommunity.com/market/listings/730/'
 browser = webdriver.Chrome()
 username, password = getLoginInfo(identity)
 browser = steamLogin(browser, username, password, 2)
+limiter.bucket('listings', navigation_time)
+
+# Scraped rows wait in a columnar buffer; each flush appends them to DBdata in one concat, queues
+#     them on the journal, and only moves the resume pointer once the journal has them on disk.
+new_index = DBdata.index.max() + 1 # New labels continue past the stored index so journal replay lines up
+buffer = {column: [] for column in DBdata.columns}
+labels = []
 
-for index, name in enumerate(missing[startloc:]):
+def flush(position):
+    global DBdata
+    if labels:
+        chunk = pd.DataFrame(buffer, index=labels, columns=DBdata.columns)
+        DBdata = pd.concat([DBdata, chunk])
+        for label, row in zip(labels, chunk.to_dict('records')):
+            journal.record(label, row)
+        journal.flush()
+        for column in buffer.values():
+            column.clear()
+        labels.clear()
+    writeCheckpoint('missinglog.json', position)
+
+for index, name in enumerate(missing[startloc:], startloc):
+    if known.contains([name])[0]:
+        continue
     item_url = base + name
-    with WaitUntil(navigation_time):
-        browser.get(item_url)
-        temp_item = {
-            'Item Name': name
-        }
-        
-        browser, pagedata = browseItempage(browser, temp_item, navigation_time, firstscan=True)
-
-        if len(pagedata['Listings']) > 0: # Nonzero
-            print('    ' + str(index) + '.', name, 'lowest_price=' + 
-                    str(pagedata['Listings'][0]), 'sales/day=' + str(pagedata["Sales/Day"]))
-        else:
-            print('    ' + str(index) + '.', name, 'lowest_price=EMPTY', 
-                'sales/day=' + str(pagedata["Sales/Day"]))
-
-        DBdata = DBdata.append(pagedata, ignore_index=True, verify_integrity=True) # Just in case
-
-    if (index+1) % 30 == 0 or startloc + index == len(missing)-1:
-        DBdata.to_hdf('../data/item_info.h5', 'csgo', mode='w')
-        print('    [WROTE TO FILE.]')
-        print()
+    temp_item = {
+        'Item Name': name
+    }
+
+    browser, pagedata = loadItempage(browser, item_url, temp_item, navigation_time, firstscan=True)
+
+    if len(pagedata['Listings']) > 0: # Nonzero
+        print('    ' + str(index) + '.', name, 'lowest_price=' + 
+                str(pagedata['Listings'][0]), 'sales/day=' + str(pagedata["Sales/Day"]))
+    else:
+        print('    ' + str(index) + '.', name, 'lowest_price=EMPTY', 
+            'sales/day=' + str(pagedata["Sales/Day"]))
+
+    for column, values in buffer.items():
+        values.append(pagedata.get(column))
+    labels.append(new_index)
+    known.add(name, new_index)
+    new_index += 1
+    if len(labels) >= flush_every:
+        flush(index + 1)
+
+flush(len(missing))
+journal.close(compact=True)
+print('    [WROTE TO FILE.]')
@@ -1,6 +1,5 @@
 import pandas as pd
 from datetime import datetime, timedelta
-from copy import deepcopy
 import matplotlib.pyplot as plt
 import seaborn as sns
 import statistics
@@ -36,8 +35,7 @@ if SHOW_OUTLIERS:
         std = statistics.stdev(L)
         return [(x-mean)/std for x in L]
     all_sigmas = []
-    local_DBdata = deepcopy(DBdata)
-    local_DBdata = historicalSelectorDF(local_DBdata, [N_DAYS, 0])
+    local_DBdata = historicalSelectorDF(DBdata, [N_DAYS, 0])
     local_DBdata = volumeFilter(local_DBdata, 10)
     for i, row in local_DBdata.iterrows():
         history = convert_to_sigmas([x[1] for x in row['Sales from last month']])
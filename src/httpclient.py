@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### Keep-alive HTTP client for Steam's JSON endpoints, so they don't need a browser render.
+### Connections are pooled per host and reused across requests and threads, responses are asked
+###     for gzipped, and the cookie jar can be copied out of a logged-in webdriver. Bodies that
+###     aren't JSON, connection failures and refusals are reported separately from throttling, so
+###     callers can hand those requests to the browser instead.
+
+### Standard libraries
+import http.client                          # Persistent connections
+import gzip                                 # Compressed response bodies
+import json                                 # Parsing responses
+import queue                                # Idle connections, shared between threads
+import threading
+from urllib.parse import urlsplit
+from http.cookies import SimpleCookie       # Reading Set-Cookie headers
+
+### Local Functions
+from ratelimit import Throttled             # 429/5xx answers
+
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/108.0 Safari/537.36'
+THROTTLE_STATUSES = {429, 500, 502, 503, 504}
+
+class ClientFailure(Exception):
+    # The request didn't get a JSON answer for a reason other than throttling (connection error,
+    #     refusal, login page). A browser may still get through.
+    pass
+
+class SteamHTTP:
+    def __init__(self, cookies=None, size=4, timeout=30):
+        # "cookies" is a list of webdriver-style dicts (name, value, domain); "size" is the most
+        #     idle connections kept per host.
+        self.size = size
+        self.timeout = timeout
+        self.jar = dict() # name -> (domain, value)
+        self.pools = dict()
+        self.lock = threading.Lock()
+        for cookie in cookies or []:
+            self.jar[cookie['name']] = (cookie.get('domain', '').lstrip('.'), cookie['value'])
+
+    @classmethod
+    def fromBrowser(cls, browser, **kwargs):
+        return cls(browser.get_cookies(), **kwargs)
+
+    def cookieHeader(self, host):
+        return '; '.join(name + '=' + value for name, (domain, value) in self.jar.items()
+                         if not domain or host == domain or host.endswith('.' + domain))
+
+    def _pool(self, key):
+        with self.lock:
+            if key not in self.pools:
+                self.pools[key] = queue.LifoQueue(self.size)
+            return self.pools[key]
+
+    def _connect(self, scheme, host):
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, timeout=self.timeout)
+        return http.client.HTTPConnection(host, timeout=self.timeout)
+
+    def _checkout(self, scheme, host):
+        # (connection, reused) - the most recently used idle connection if there is one
+        try:
+            return self._pool((scheme, host)).get_nowait(), True
+        except queue.Empty:
+            return self._connect(scheme, host), False
+
+    def _checkin(self, scheme, host, connection):
+        try:
+            self._pool((scheme, host)).put_nowait(connection)
+        except queue.Full:
+            connection.close()
+
+    def get(self, url):
+        # Returns (status, body). A reused connection the server has since dropped is retried
+        #     once on a fresh one; other connection errors raise ClientFailure.
+        parts = urlsplit(url)
+        path = parts.path + ('?' + parts.query if parts.query else '')
+        headers = {'User-Agent': USER_AGENT, 'Accept': 'application/json', 'Accept-Encoding': 'gzip'}
+        cookie = self.cookieHeader(parts.hostname)
+        if cookie:
+            headers['Cookie'] = cookie
+
+        while True:
+            connection, reused = self._checkout(parts.scheme, parts.netloc)
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+                body = response.read()
+            except (http.client.HTTPException, OSError) as e:
+                connection.close()
+                if reused and not isinstance(e, TimeoutError):
+                    continue
+                raise ClientFailure(str(e) or type(e).__name__)
+            break
+
+        if response.will_close:
+            connection.close()
+        else:
+            self._checkin(parts.scheme, parts.netloc, connection)
+        for header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(header).items():
+                self.jar[name] = (morsel['domain'].lstrip('.') or parts.hostname, morsel.value)
+        if response.getheader('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return response.status, body
+
+    def getJSON(self, url):
+        # Parsed JSON. Raises Throttled on rate limit statuses and ClientFailure on anything else
+        #     that isn't JSON; a null result ({"success": false}) is returned as is.
+        status, body = self.get(url)
+        if status in THROTTLE_STATUSES:
+            raise Throttled('HTTP ' + str(status) + ': ' + url)
+        try:
+            return json.loads(body)
+        except ValueError:
+            raise ClientFailure('HTTP ' + str(status) + ', not JSON: ' + url)
+
+    def fetch(self, url):
+        # asyncscan's fetch contract; throttling and other failures raise separately
+        return self.getJSON(url)
+
+    def close(self):
+        with self.lock:
+            pools, self.pools = self.pools, dict()
+        for pool in pools.values():
+            while not pool.empty():
+                pool.get_nowait().close()
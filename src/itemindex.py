@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### Shared item name -> DBdata row lookups.
+### Every item name gets a stable integer id (its category code, in order of first appearance).
+###     Batches of names resolve to ids or DBdata labels through one hash lookup instead of isin
+###     scans, iterrows dicts or sets rebuilt by each module. The index is saved next to DBdata in
+###     item_info.h5 so ids stay the same between runs.
+
+import pandas as pd                         # Dataset format
+import numpy as np
+
+class ItemIndex:
+    # names:  pd.Index of item names; position = item id
+    # labels: int64 DBdata index label for every id
+    def __init__(self, names, labels):
+        self.names = pd.Index(names)
+        self.labels = np.asarray(labels, dtype=np.int64)
+        self.rows = None # len(DBdata) as of the last sync
+
+    @classmethod
+    def fromDF(cls, df):
+        # If a name appears more than once, its first row wins
+        first = ~df['Item Name'].duplicated().values
+        index = cls(df['Item Name'].values[first], df.index.values[first])
+        index.rows = len(df.index)
+        return index
+
+    def __len__(self):
+        return len(self.names)
+
+    def ids(self, names):
+        # Item id for every name, -1 where the name isn't known
+        return self.names.get_indexer(pd.Index(names))
+
+    def contains(self, names):
+        return self.ids(names) >= 0
+
+    def lookup(self, names):
+        # DBdata label for every name, -1 where the name isn't known
+        ids = self.ids(names)
+        return np.where(ids >= 0, self.labels[ids], -1)
+
+    def categorical(self, names):
+        # Names as a Categorical over the shared categories; unknown names become NaN
+        return pd.Categorical.from_codes(self.ids(names), categories=self.names)
+
+    def add(self, name, label):
+        # New items get the next id; known names keep theirs
+        if name not in self.names:
+            self.names = self.names.append(pd.Index([name]))
+            self.labels = np.append(self.labels, np.int64(label))
+
+    def sync(self, df):
+        # Picks up rows added to df since the index was built (rows are only ever appended)
+        if len(df.index) != self.rows:
+            new = df[~df['Item Name'].isin(self.names)]
+            for label, name in zip(new.index, new['Item Name']):
+                self.add(name, label)
+            self.rows = len(df.index)
+        return self
+
+    def matches(self, df):
+        first = ~df['Item Name'].duplicated().values
+        return (len(self.names) == first.sum() and
+                np.array_equal(self.labels, df.index.values[first]) and
+                self.names.equals(pd.Index(df['Item Name'].values[first])))
+
+    def toHDF(self, filename, key='names'):
+        # Table format keeps the names as a categorical column
+        table = pd.DataFrame({'Name': pd.Categorical.from_codes(np.arange(len(self.names)), categories=self.names),
+                              'Label': self.labels})
+        table.to_hdf(filename, key, mode='a', format='table')
+
+    @classmethod
+    def readHDF(cls, filename, key='names'):
+        table = pd.read_hdf(filename, key)
+        return cls(table['Name'].astype(object).values, table['Label'].values)
+
+def readItemIndex(DBdata, filename='../data/item_info.h5', key='names'):
+    # The saved index if it still lines up with DBdata, otherwise a fresh one
+    try:
+        index = ItemIndex.readHDF(filename, key)
+        if index.matches(DBdata):
+            return index
+    except (KeyError, FileNotFoundError):
+        pass
+    return ItemIndex.fromDF(DBdata)
+
+_indexes = dict()
+def openItemIndex(DBdata, filename='../data/item_info.h5'):
+    # One index per store, shared by every module in the process and kept in step with DBdata
+    if filename not in _indexes:
+        _indexes[filename] = readItemIndex(DBdata, filename)
+    return _indexes[filename].sync(DBdata)
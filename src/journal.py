@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### Incremental persistence of DBdata (item_info.h5) through a write-ahead journal.
+### Scanners hand changed rows to record(), which only queues them. A background thread appends
+###     them to journal segments next to the store, and every so often compacts the closed segments
+###     into item_info.h5 (read, apply, write to a temp file, swap in). After a crash, load()
+###     replays whatever segments are left on top of the last compacted file.
+### If the writer fails (disk full, HDF error), it stops and the error is raised from the next
+###     record(), flush() or close() in the caller's thread.
+
+import pandas as pd                         # Dataset format
+import pickle                               # Journal records hold datetimes, lists and tuples
+import os                                   # Segment files, atomic replace
+import threading                            # Background writer
+import queue                                # Hand-off from the scan loop
+import atexit                               # Flush queued rows on interpreter exit
+import time
+
+from schema import writeCompact             # Writes DBdata with its SalesStore and compact tables
+from schema import readCompact              # Reads it back without unpickling the object frame
+from metrics import metrics                 # Journal write and compaction latencies
+
+CLOSE = object() # Queue sentinel for ItemJournal.close
+FLUSH = object() # Queue sentinel for ItemJournal.flush
+RECHECK = 0.5    # Seconds between checks that the writer is still alive while flush() waits
+
+def readSegment(path):
+    # Yields (index, row dict) records. A torn record at the end (crash mid-write) is dropped.
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except (EOFError, pickle.UnpicklingError):
+                return
+
+def applyRecords(DBdata, records):
+    # Existing rows are overwritten in place. New labels (backfilled items) are collected and
+    #     appended in one concat, since growing DBdata a row at a time copies it every time.
+    new = dict()
+    for index, row in records:
+        if index in new or index not in DBdata.index:
+            new[index] = row
+        else:
+            DBdata.loc[index] = pd.Series(row)
+    if new:
+        rows = pd.DataFrame.from_dict(new, orient='index').reindex(columns=DBdata.columns)
+        DBdata = pd.concat([DBdata, rows])
+    return DBdata
+
+class ItemJournal:
+    def __init__(self, filename='../data/item_info.h5', key='csgo', compact_every=300):
+        # "compact_every" is the number of journaled rows before the segment is closed and folded
+        #     into the main store.
+        self.filename = filename
+        self.key = key
+        self.directory = filename + '.journal'
+        self.compact_every = compact_every
+        self.queue = queue.Queue()
+        self.lock = threading.Lock() # Held while the main file and the segment list disagree
+        self.thread = None
+        self.error = None # What stopped the writer, if it failed
+        os.makedirs(self.directory, exist_ok=True)
+
+    def segments(self):
+        names = sorted(x for x in os.listdir(self.directory) if x.endswith('.pkl'))
+        return [os.path.join(self.directory, x) for x in names]
+
+    def _newSegment(self):
+        existing = self.segments()
+        number = int(os.path.basename(existing[-1])[:-4]) + 1 if existing else 0
+        return os.path.join(self.directory, '{0:08d}.pkl'.format(number))
+
+    def load(self):
+        # Recovery: last compacted store plus every journaled row since
+        with self.lock:
+            DBdata = readCompact(self.filename, self.key).toDF()
+            for path in self.segments():
+                DBdata = applyRecords(DBdata, readSegment(path))
+        return DBdata
+
+    def start(self):
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._worker, daemon=True)
+            self.thread.start()
+        return self
+
+    def _raise(self):
+        if self.error is not None:
+            raise self.error
+
+    def record(self, index, row):
+        # Called from the scan loop; never touches the disk
+        self._raise()
+        self.queue.put((index, dict(row)))
+
+    def flush(self):
+        # Blocks until everything recorded so far is on disk (in a segment, not necessarily compacted)
+        thread = self.thread
+        if thread is not None:
+            self._raise()
+            written = threading.Event()
+            self.queue.put((FLUSH, written))
+            while not written.wait(RECHECK):
+                if not thread.is_alive():
+                    break
+            self._raise()
+            if not written.is_set():
+                raise RuntimeError('Journal writer stopped before the flush was written')
+
+    def close(self, compact=False):
+        # Writes out everything queued. Uncompacted segments are fine to leave; load() replays them.
+        if self.thread is not None:
+            self.queue.put((CLOSE, compact))
+            self.thread.join()
+            self.thread = None
+        self._raise()
+
+    def compact(self, segments):
+        with self.lock, metrics.time('compaction'):
+            DBdata = readCompact(self.filename, self.key).toDF()
+            for path in segments:
+                DBdata = applyRecords(DBdata, readSegment(path))
+            temp = self.filename + '.tmp'
+            writeCompact(DBdata, temp, self.key)
+            os.replace(temp, self.filename)
+            # Replaying a segment twice is harmless, so a crash before these removals only costs time
+            for path in segments:
+                os.remove(path)
+
+    def _worker(self):
+        # Flush waiters are only woken once the error (if any) is stored, so they see it
+        waiting = []
+        try:
+            self._write(waiting)
+        except Exception as e:
+            self.error = e
+        finally:
+            while not self.queue.empty():
+                index, row = self.queue.get_nowait()
+                if index is FLUSH:
+                    waiting.append(row)
+            for event in waiting:
+                event.set()
+
+    def _write(self, waiting):
+        pending = self.segments() # Left over from a previous run
+        if pending:
+            self.compact(pending)
+        path = self._newSegment()
+        f = open(path, 'ab')
+        written = 0
+        while True:
+            # Take everything already queued so one fsync covers the whole batch
+            batch = [self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            start = time.perf_counter()
+            closing = None
+            for index, row in batch:
+                if index is CLOSE: # Rows and flushes queued behind it in the batch still count
+                    closing = row
+                    continue
+                if index is FLUSH:
+                    waiting.append(row)
+                    continue
+                pickle.dump((index, row), f)
+                written += 1
+            f.flush()
+            os.fsync(f.fileno())
+            metrics.observe('journal_write', time.perf_counter() - start)
+            for event in waiting:
+                event.set()
+            waiting.clear()
+
+            if closing is not None:
+                f.close()
+                if closing and written:
+                    self.compact([path])
+                return
+            if written >= self.compact_every:
+                f.close()
+                self.compact([path])
+                path = self._newSegment()
+                f = open(path, 'ab')
+                written = 0
+
+_journals = dict()
+def openJournal(filename='../data/item_info.h5', key='csgo'):
+    # One running journal per store, shared by every scanner in the process
+    if filename not in _journals:
+        journal = ItemJournal(filename, key).start()
+        atexit.register(journal.close)
+        _journals[filename] = journal
+    return _journals[filename]
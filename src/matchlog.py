@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### Append-only log of strategy matches (LTTQHitems.h5).
+### Matches are appended to a PyTables table, so a hit only writes its own rows instead of reading
+###     and rewriting the whole history. 'Date' is a queryable data column, so a time range can be
+###     read back without deserializing everything.
+
+import pandas as pd                         # Dataset format
+from datetime import timedelta              # Day-sized reads
+import os
+
+# Only scalar columns go into the log. The list columns ('Sales from last month', 'Listings') can't
+#     live in an appendable table, and are already covered by item_info.h5 and 'Lowest Listing'.
+LOG_COLUMNS = ['Item Name', 'Condition', 'Special Type', 'Sales/Day', 'Buy Rate', 'Date',
+               'Lowest Listing', 'Q1', 'Q2', 'Q3', 'Ratio']
+NAME_SIZE = 128 # Fixed string width for 'Item Name' in the table
+
+class MatchLog:
+    def __init__(self, filename='../data/LTTQHitems.h5', key='matchlog', legacy_key='csgo'):
+        # "legacy_key" is where writeMatch used to rewrite the whole frame. Those rows are still
+        #     returned by read() until migrate() folds them into the log.
+        self.filename = filename
+        self.key = key
+        self.legacy_key = legacy_key
+
+    def _conform(self, matches):
+        matches = matches[[c for c in LOG_COLUMNS if c in matches.columns]].copy()
+        matches['Date'] = pd.to_datetime(matches['Date'])
+        for column in ['Condition', 'Special Type']:
+            if column in matches.columns:
+                matches[column] = matches[column].astype('int64')
+        return matches.reset_index(drop=True)
+
+    def append(self, matches):
+        if len(matches.index) == 0:
+            return
+        with pd.HDFStore(self.filename, mode='a') as store:
+            store.append(self.key, self._conform(matches), format='table', data_columns=['Date'],
+                         min_itemsize={'Item Name': NAME_SIZE}, index=False)
+            store.flush(fsync=True)
+
+    def read(self, start=None, end=None):
+        # Matches with start <= Date < end. Either bound can be left open.
+        where = []
+        if start is not None:
+            where.append('Date >= start')
+        if end is not None:
+            where.append('Date < end')
+        parts = []
+        if not os.path.exists(self.filename): # Nothing logged yet; reading doesn't create the file
+            return pd.DataFrame(columns=LOG_COLUMNS)
+        with pd.HDFStore(self.filename, mode='r') as store:
+            if '/' + self.legacy_key in store.keys():
+                legacy = store.get(self.legacy_key)
+                if start is not None:
+                    legacy = legacy[legacy['Date'] >= start]
+                if end is not None:
+                    legacy = legacy[legacy['Date'] < end]
+                parts.append(legacy)
+            if '/' + self.key in store.keys():
+                parts.append(store.select(self.key, where=' & '.join(where) or None))
+        if not parts:
+            return pd.DataFrame(columns=LOG_COLUMNS)
+        return pd.concat(parts, ignore_index=True)
+
+    def readDay(self, day):
+        start = pd.Timestamp(day).normalize()
+        return self.read(start, start + timedelta(days=1))
+
+    def migrate(self):
+        # One-off: move the rewritten legacy frame into the appendable log
+        if not os.path.exists(self.filename):
+            return
+        with pd.HDFStore(self.filename, mode='r') as store:
+            if '/' + self.legacy_key not in store.keys():
+                return
+            legacy = store.get(self.legacy_key)
+        self.append(legacy)
+        with pd.HDFStore(self.filename, mode='a') as store:
+            store.remove(self.legacy_key)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### Scan loop instrumentation: where the time goes (server limit, Chrome, parsing or HDF writes).
+### Hot paths record latencies into per-stage histograms and bump throughput counters on the
+###     shared "metrics" registry; both are cheap (a lock and a bisect). A background thread flushes
+###     them every "every" seconds, as a line appended to a JSONL file or as a Prometheus text
+###     exposition file (node_exporter's textfile collector can pick that up as is).
+### Stages:
+###     fetch_item, fetch_search   page loads / JSON requests, rate limit waits excluded
+###     ratelimit_wait             time blocked on the limiter before a request
+###     parse, evaluate, persist   pipeline stage work per job
+###     strategy, match_write      searchMatches / writeMatch
+###     journal_write, compaction  DBdata rows to the journal (fsync) / folding them into item_info.h5
+### The sleep ratio is seconds spent sleeping (WaitUntil, rate limit waits and throttle backoffs) per
+###     second spent on requests. Well above 1 means the server limit is the bottleneck.
+
+import threading                            # Registry is shared by every stage; background flushes
+import time
+import json
+import os                                   # Atomic replace of the Prometheus file
+import atexit                               # Last flush on exit
+from bisect import bisect_left              # Histogram bucket lookup
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the histogram buckets; fetches are seconds, parses are milliseconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+PREFIX = 'arbiter_'
+
+class Histogram:
+    def __init__(self, bounds=BUCKETS):
+        self.bounds = bounds
+        self.counts = [0]*(len(bounds)+1) # Last one is everything over the top bound
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.bounds, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        # Interpolated within the bucket holding the q-th observation (like Prometheus'
+        #     histogram_quantile); the overflow bucket reports the max.
+        if self.count == 0:
+            return None
+        rank = q*self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count > 0:
+                if i == len(self.bounds):
+                    return self.max
+                lo = self.bounds[i-1] if i > 0 else 0
+                return min(lo + (self.bounds[i] - lo)*(rank - seen)/count, self.max)
+            seen += count
+        return self.max
+
+    def summary(self):
+        rounded = lambda x: round(x, 6) if x is not None else None
+        return {'Count': self.count, 'Mean': rounded(self.total/self.count if self.count else None),
+                'p50': rounded(self.quantile(0.5)), 'p90': rounded(self.quantile(0.9)),
+                'p99': rounded(self.quantile(0.99)), 'Max': rounded(self.max), 'Total': rounded(self.total)}
+
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = dict()
+        self.counters = dict()
+        self.started = time.time()
+        self.last_flush = self.started
+        self.last_counters = dict()
+        self.filename = None
+        self.format = None
+        self.thread = None
+        self.stop = threading.Event()
+
+    def observe(self, stage, seconds):
+        with self.lock:
+            if stage not in self.histograms:
+                self.histograms[stage] = Histogram()
+            self.histograms[stage].observe(seconds)
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    @contextmanager
+    def time(self, stage):
+        # with metrics.time('parse'): ...
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def fetched(self, stage, start, counter=None):
+        # A request that began at perf_counter "start" just finished; its time counts as working
+        #     time for the sleep ratio. "counter" is bumped too, if given (successful pages).
+        elapsed = time.perf_counter() - start
+        self.observe(stage, elapsed)
+        self.count('work_seconds', elapsed)
+        if counter is not None:
+            self.count(counter)
+
+    def sleepRatio(self):
+        # Seconds sleeping per second working, None before any work
+        with self.lock:
+            sleep, work = self.counters.get('sleep_seconds', 0), self.counters.get('work_seconds', 0)
+        return round(sleep/work, 3) if work > 0 else None
+
+    def snapshot(self):
+        # Everything since start, plus per-minute rates of every counter since the last snapshot
+        now = time.time()
+        with self.lock:
+            counters = dict(self.counters)
+            stages = {stage: histogram.summary() for stage, histogram in sorted(self.histograms.items())}
+            minutes = (now - self.last_flush)/60
+            rates = {name: round((value - self.last_counters.get(name, 0))/minutes, 2) if minutes > 0 else None
+                     for name, value in counters.items() if not name.endswith('_seconds')}
+            self.last_flush = now
+            self.last_counters = counters
+        return {'Time': now, 'Uptime': round(now - self.started, 1), 'Counters': counters,
+                'Per Minute': rates, 'Sleep Ratio': self.sleepRatio(), 'Stages': stages}
+
+    def prometheus(self):
+        # Text exposition format: counters, the sleep ratio gauge and one histogram over stages
+        with self.lock:
+            counters = dict(self.counters)
+            histograms = {stage: (list(h.counts), h.total, h.count) for stage, h in sorted(self.histograms.items())}
+        lines = []
+        for name, value in sorted(counters.items()):
+            lines.append('# TYPE {0}{1}_total counter'.format(PREFIX, name))
+            lines.append('{0}{1}_total {2}'.format(PREFIX, name, value))
+        ratio = self.sleepRatio()
+        if ratio is not None:
+            lines.append('# TYPE {0}sleep_ratio gauge'.format(PREFIX))
+            lines.append('{0}sleep_ratio {1}'.format(PREFIX, ratio))
+        lines.append('# TYPE {0}stage_seconds histogram'.format(PREFIX))
+        for stage, (counts, total, count) in histograms.items():
+            cumulative = 0
+            for bound, bucket in zip(list(BUCKETS) + ['+Inf'], counts):
+                cumulative += bucket
+                lines.append('{0}stage_seconds_bucket{{stage="{1}",le="{2}"}} {3}'.format(PREFIX, stage, bound, cumulative))
+            lines.append('{0}stage_seconds_sum{{stage="{1}"}} {2}'.format(PREFIX, stage, total))
+            lines.append('{0}stage_seconds_count{{stage="{1}"}} {2}'.format(PREFIX, stage, count))
+        return '\n'.join(lines) + '\n'
+
+    def flush(self):
+        if self.filename is None:
+            return
+        if self.format == 'prometheus':
+            temp = self.filename + '.tmp'
+            with open(temp, 'w') as f:
+                f.write(self.prometheus())
+            os.replace(temp, self.filename) # Scrapers never see a half-written file
+        else:
+            with open(self.filename, 'a') as f:
+                f.write(json.dumps(self.snapshot()) + '\n')
+
+    def start(self, filename='../data/metrics.jsonl', every=60, format=None):
+        # Flushes every "every" seconds from a background thread, and once more on exit.
+        #     "format" is 'jsonl' or 'prometheus'; by default a .prom filename means prometheus.
+        self.filename = filename
+        self.format = format or ('prometheus' if filename.endswith('.prom') else 'jsonl')
+        if self.thread is None:
+            def loop():
+                while not self.stop.wait(every):
+                    self.flush()
+            self.thread = threading.Thread(target=loop, name='metrics', daemon=True)
+            self.thread.start()
+            atexit.register(self.close)
+        return self
+
+    def close(self):
+        if self.thread is not None:
+            self.stop.set()
+            self.thread.join()
+            self.thread = None
+            self.flush()
+
+metrics = Metrics() # Shared by every scanner in the process
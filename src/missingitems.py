@@ -1,74 +1,90 @@
 import json
-from selenium import webdriver
-import pandas as pd
-from browse_itempage import WaitUntil       # Implements standard page waits in with block
-import time                                 # Waiting so no server-side ban
-from combinedfuncs import getLoginInfo
-from browse_itempage import steamLogin
+import os                                   # Checkpoint fsync/removal
+from asyncscan import AsyncSearchScanner    # Concurrent market/search/render pages over plain HTTP
+from asyncscan import CONDITIONS
+from httpclient import SteamHTTP            # Keep-alive connections shared by the requests
+from itemindex import readItemIndex         # Item names already in DBdata
+from schema import readCompact              # Only the names are needed, so the list columns are skipped
 
 ### Hyperparameters {
-navigation_time = 7
+navigation_time = 7 # Spacing between request starts
+concurrency = 2     # Requests in flight at once
 verbose = True
-identity = 'Syris'
+checkpoint = '../data/missingcrawl.jsonl' # One line per fetched page; delete it to start over
 ### }
 
-conditions = [0, # Factory New
-              1, # Minimal Wear
-              2, # Field-Tested
-              3, # Well-Worn
-              4] # Battle-Scarred
+# The crawl checkpoints every page as it arrives: its condition, offset, the condition's total and
+#     the page's names that aren't in DBdata. A rerun after a failure skips the pages already logged.
+def readCheckpoint(filename):
+    totals, done, missing = dict(), dict(), []
+    good = 0 # Bytes of whole lines
+    try:
+        with open(filename, 'rb+') as f:
+            for line in f:
+                try:
+                    page = json.loads(line)
+                except ValueError: # Torn last line from a crash mid-write
+                    break
+                if not line.endswith(b'\n'):
+                    break
+                totals[page['Condition']] = page['Total']
+                done.setdefault(page['Condition'], set()).add(page['Start'])
+                missing.extend(page['Missing'])
+                good += len(line)
+            f.truncate(good) # Cut the torn line off, or the next page is appended onto it
+    except FileNotFoundError:
+        pass
+    return totals, done, missing
 
-browser = webdriver.Chrome()
-username, password = getLoginInfo(identity)
-browser = steamLogin(browser, username, password, 2)
+def crawlMissing(names, scanner, checkpoint, conditions=CONDITIONS, verbose=True):
+    # Every search page not already in the checkpoint. "names" is an ItemIndex of the names DBdata
+    #     has. Returns (missing names, (condition, start) of the pages that failed).
+    totals, done, missing = readCheckpoint(checkpoint)
+    missing_set = set(missing)
+    if done:
+        print('Resuming crawl,', sum(len(x) for x in done.values()), 'pages already checkpointed.')
 
-fullres = []
-for i in conditions:
-    allquery = ('https://steamcommunity.com/market/search/render/?category_730_ItemSet&'
-                'appid=730&norender=1&category_730_Exterior%5B%5D=tag_WearCategory' + str(i) +
-                '&count=100&start=')
+    log = open(checkpoint, 'a')
+    failed = []
+    def collect(condition, start, response):
+        if not response or not response.get('success'):
+            print('Uh oh, pull failure at', condition, start, '- rerun to pick it up. Try and figure out how long the cooldown is.')
+            failed.append((condition, start))
+            return
+        if verbose:
+            print('Got json at:', condition, start)
+        pagenames = [item['name'] for item in response['results']]
+        new = [name for name, found in zip(pagenames, names.contains(pagenames))
+               if not found and name not in missing_set]
+        missing_set.update(new)
+        missing.extend(new)
+        log.write(json.dumps({'Condition': condition, 'Start': start, 'Total': response['total_count'],
+                              'Missing': new}) + '\n')
+        log.flush()
+        os.fsync(log.fileno())
 
-    firstrun = True
-    all_items_reached = False
-    currloc = 0
-    results = []
-    find_xpath = browser.find_element_by_xpath
-    while not all_items_reached:
-        with WaitUntil(navigation_time):
-            # Get json response using selenium (requests seemed to be more prone to breaking)
-            browser.get(allquery + str(currloc))
-            text = find_xpath('//body').text
-            response = json.loads(text)
-            try:
-                success = response['success']
-            except TypeError:
-                print('Uh oh, pull failure. Try and figure out how long the cooldown is.')
-                raise Exception
-            
-            if verbose:
-                print('Got json at:', currloc)
-            results += response['results']
+    try:
+        scanner.run(scanner.crawl(conditions, collect, totals, done))
+    finally:
+        log.close()
+    return missing, failed
 
-            # If first run, get total number of expected items
-            if firstrun:
-                size = response['total_count']
-                firstrun = False
-            
-            # Loop breaking logic based on expected item count
-            currloc += 100
-            if currloc > size:
-                break
+if __name__ == '__main__':
+    items = readCompact('../data/item_info.h5').scalars
+    names = readItemIndex(items)
 
-    for i, item in enumerate(results):
-        results[i] = item['name']
-    fullres += results
+    client = SteamHTTP(size=concurrency)
+    scanner = AsyncSearchScanner(concurrency=concurrency, interval=navigation_time, fetch=client.fetch)
+    try:
+        missing, failed = crawlMissing(names, scanner, checkpoint, verbose=verbose)
+    finally:
+        client.close()
 
-DBdata = pd.read_hdf('../data/item_info.h5', 'csgo')
-DBnames = set(DBdata['Item Name'].tolist())
-missing = []
-for founditem in fullres:
-    if founditem not in DBnames:
-        missing.append(founditem)
+    with open('../data/missing.json', 'w') as f:
+        json.dump(missing, f, indent=4)
 
-with open('../data/missing.json', 'w') as f:
-    json.dump(missing, f, indent=4)
+    if failed:
+        print(len(failed), 'pages failed; missing.json has the', len(missing), 'names found so far.')
+    else:
+        os.remove(checkpoint) # Complete, so the next crawl starts fresh
+        print('Crawl complete,', len(missing), 'missing items.')
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### Live Q1/Q2/Q3 per item for LessThanThirdQuartileHistorical without re-sorting histories.
+### Each item keeps its windowed prices in a sorted container. New sales are inserted and sales
+###     that age out of the window are removed in O(log n), and the outlier cut (points within
+###     sigma stdevs of the mean) is a contiguous range of the sorted prices, so quartiles are
+###     index lookups into that range.
+### The window matches historicalSelector with [days+offset, offset]: from floor(clock) - days
+###     through floor(clock), where the clock is the newest sale seen for any item.
+
+from sortedcontainers import SortedList     # Order statistics with O(log n) insert/remove
+from collections import deque               # Window contents in time order, for aging out
+from math import sqrt
+
+from salesstore import SalesStore, SECONDS_PER_DAY, toSeconds
+
+class WindowQuartiles:
+    # One item's window. Sales newer than the window's right edge (today's, since the window ends
+    #     at midnight) wait in "pending" until the day rolls over; their prices may still change.
+    def __init__(self):
+        self.sorted = SortedList()
+        self.held = deque() # (timestamp, price) inside the window, oldest first
+        self.pending = []   # (timestamp, price) past the right edge, oldest first
+        self.mean = 0.0
+        self.spread = 0.0 # Sum of squared deviations from the mean
+        self.bounds = (None, None)
+
+    # Welford's updates, run forwards for new sales and backwards for aged out ones. A running sum
+    #     of squares minus total*mean cancels away the spread of a pricey item with steady prices.
+    def _add(self, timestamp, price):
+        self.held.append((timestamp, price))
+        self.sorted.add(price)
+        delta = price - self.mean
+        self.mean += delta/len(self.sorted)
+        self.spread += delta*(price - self.mean)
+
+    def _drop(self):
+        timestamp, price = self.held.popleft()
+        self.sorted.remove(price)
+        if not self.sorted:
+            self.mean = 0.0
+            self.spread = 0.0
+            return
+        delta = price - self.mean
+        self.mean -= delta/len(self.sorted)
+        self.spread -= delta*(price - self.mean)
+
+    def roll(self, lo, hi):
+        # Moves the window to [lo, hi] (epoch seconds); both edges only ever move forward
+        if self.bounds == (lo, hi):
+            return
+        self.bounds = (lo, hi)
+        while self.pending and self.pending[0][0] <= hi:
+            timestamp, price = self.pending.pop(0)
+            if timestamp >= lo:
+                self._add(timestamp, price)
+        while self.held and self.held[0][0] < lo:
+            self._drop()
+
+    def update(self, sales):
+        # "sales" is (timestamp, price) pairs in time order, e.g. a freshly scraped history.
+        # Sales already in the window are final; anything past the right edge replaces pending.
+        lo, hi = self.bounds
+        last = self.held[-1][0] if self.held else lo - 1
+        self.pending = []
+        for timestamp, price in sales:
+            if timestamp > hi:
+                self.pending.append((timestamp, price))
+            elif last < timestamp and lo <= timestamp:
+                self._add(timestamp, price)
+                last = timestamp
+
+    def __len__(self):
+        return len(self.sorted)
+
+    def _median(self, start, length):
+        mid = start + length//2
+        if length % 2 == 1:
+            return self.sorted[mid]
+        return (self.sorted[mid-1] + self.sorted[mid])/2
+
+    def quartiles(self, sigma=1.5, before=3, after=5):
+        # Same steps as LTTQH.prepare: at least "before" sales in the window, drop points more than
+        #     sigma sample stdevs from the mean, at least "after" left, then quartiles() semantics.
+        # Returns None when the item doesn't make the volume cuts.
+        n = len(self.sorted)
+        if n < max(before, 2):
+            return None
+        mean = self.mean
+        stdev = sqrt(max(self.spread, 0)/(n-1))
+        if stdev > 0:
+            start = self.sorted.bisect_left(mean - sigma*stdev)
+            stop = self.sorted.bisect_right(mean + sigma*stdev)
+        else: # Flat history; every point is on the mean
+            start, stop = 0, n
+        length = stop - start
+        if length < after:
+            return None
+        half = length//2
+        return (self._median(start, half),
+                self._median(start, length),
+                self._median(stop - half, half))
+
+class QuartileIndex:
+    def __init__(self, dateregion=[8,0], sigma=1.5):
+        # "dateregion" is an int [start, end] region like LTTQH's, in days back from the clock
+        self.days = dateregion[0] - dateregion[1]
+        self.offset = dateregion[1]
+        self.sigma = sigma
+        self.items = dict()
+        self.clock = None
+
+    def window(self):
+        hi = (self.clock // SECONDS_PER_DAY - self.offset) * SECONDS_PER_DAY
+        return hi - self.days*SECONDS_PER_DAY, hi
+
+    def _tick(self, newest):
+        if self.clock is None or newest > self.clock:
+            self.clock = newest
+
+    def advance(self, seconds):
+        # Moves the clock up to "seconds" (epoch) even without a sale that new; replays keep the
+        #     window in step with the recorded time this way
+        self._tick(seconds)
+
+    def update(self, label, sales):
+        # "sales" is the item's [[datetime, price], ...] history (any suffix of it is enough)
+        pairs = [(toSeconds(date), price) for date, price in sales]
+        self.updateSeconds(label, pairs)
+
+    def updateSeconds(self, label, pairs):
+        if pairs:
+            self._tick(pairs[-1][0])
+        if self.clock is None:
+            return
+        item = self.items.setdefault(label, WindowQuartiles())
+        item.roll(*self.window())
+        item.update(pairs)
+
+    def quartiles(self, label):
+        # (Q1, Q2, Q3) for the item's current window, or None
+        item = self.items.get(label)
+        if item is None:
+            return None
+        item.roll(*self.window()) # Lazily catch up if the clock moved since this item was touched
+        return item.quartiles(self.sigma)
+
+    @classmethod
+    def fromStore(cls, store, dateregion=[8,0], sigma=1.5, clock=None):
+        # "clock" (epoch seconds) builds the index as of that moment, leaving out later sales.
+        #     By default it's the newest sale in the store.
+        index = cls(dateregion, sigma)
+        if clock is not None:
+            index.clock = int(clock)
+        elif len(store.timestamps):
+            index.clock = int(store.timestamps.max())
+        lo, hi = index.window() if index.clock is not None else (0, 0)
+        # Only the part of each history that can still reach the window is loaded
+        for position, label in enumerate(store.index):
+            start, stop = store.offsets[position], store.offsets[position+1]
+            timestamps = store.timestamps[start:stop]
+            keep = (timestamps >= lo) & (timestamps <= (index.clock or 0))
+            index.updateSeconds(label, list(zip(timestamps[keep].tolist(), store.prices[start:stop][keep].tolist())))
+        return index
+
+_indexes = dict()
+def openQuartileIndex(DBdata, dateregion=[8,0], store=None):
+    # One live index per window, shared by every scanner in the process. Built from DBdata (or its
+    #     store) the first time it's asked for; scanners keep it current through update().
+    key = tuple(dateregion)
+    if key not in _indexes:
+        if store is None:
+            store = SalesStore.fromDF(DBdata)
+        _indexes[key] = QuartileIndex.fromStore(store, dateregion)
+    return _indexes[key]
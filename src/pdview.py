@@ -1,6 +1,7 @@
 import pandas as pd
 import pickle
 from analysis import filterPrint
+from matchlog import MatchLog
 import time
 
 class Timer():
@@ -48,7 +49,12 @@ class Timer():
 
 # print('Max index:', DBdata.index[-1])
 
-matches = pd.read_hdf('../data/LTTQHitems.h5', 'csgo')
+VIEW_DAY = None # Only load matches from this day, eg. datetime(2019, 6, 20). None loads everything.
+
+if VIEW_DAY:
+    matches = MatchLog('../data/LTTQHitems.h5').readDay(VIEW_DAY)
+else:
+    matches = MatchLog('../data/LTTQHitems.h5').read()
 # filterPrint(matches, printval=100, keys=['Item Name', 'Buy Rate', 'Sales/Day', 'Lowest Listing', 'Q3', 'Ratio'])
 print(len(matches.index))
 matches = matches[matches['Ratio'] >= 1.15]
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### Staged scanning: fetch -> parse -> evaluate -> persist, with a bounded queue between stages.
+### The fetch stage runs in the calling thread (it owns the browser) and cycles through the
+###     sources built from the pattern list. Every other stage is its own thread, so page loads
+###     never wait on parsing, strategy evaluation or disk. A full queue blocks the stage feeding
+###     it (backpressure); time spent blocked and queue depths are reported periodically.
+### A source implements fetch(browser, DBdata, emit) plus parse(job), evaluate(job, DBdata) and
+###     persist(job). Jobs are dicts carrying their 'Source'.
+
+import threading                            # One thread per stage after fetch
+import queue                                # Bounded hand-off between stages
+import time
+from itertools import cycle                 # Repeating the pattern
+from sty import fg                          # Color stdout printing
+
+from metrics import metrics                 # Per-job stage latencies
+
+STOP = object() # Passed down the stages on close
+
+class Stage:
+    def __init__(self, name, work, maxsize):
+        # "work" takes a job and returns the job for the next stage (or None to drop it)
+        self.name = name
+        self.work = work
+        self.inbox = queue.Queue(maxsize)
+        self.outbox = None # Next stage's inbox; None for the last stage
+        self.done = 0
+        self.busy = 0.0    # Seconds spent working
+        self.blocked = 0.0 # Seconds spent waiting on a full outbox
+        self.error = None
+        self.thread = threading.Thread(target=self._loop, name=name, daemon=True)
+
+    def _loop(self):
+        while True:
+            job = self.inbox.get()
+            if job is STOP:
+                if self.outbox is not None:
+                    self.outbox.put(STOP)
+                return
+            start = time.monotonic()
+            try:
+                job = self.work(job)
+            except Exception as e: # Surfaced in the fetch thread by Pipeline.emit
+                self.error = e
+                job = None
+            elapsed = time.monotonic() - start
+            self.busy += elapsed
+            metrics.observe(self.name, elapsed)
+            self.done += 1
+            if job is not None and self.outbox is not None:
+                start = time.monotonic()
+                self.outbox.put(job)
+                self.blocked += time.monotonic() - start
+
+class Pipeline:
+    def __init__(self, sources, browser, DBdata, maxsize=8, report_every=60, verbose=True, recorder=None):
+        # "sources" are run in order, forever. "maxsize" bounds every queue between stages.
+        # "recorder" (a replay.Recorder) is handed every job in the persist stage, for later replay.
+        self.sources = sources
+        self.recorder = recorder
+        self.browser = browser
+        self.DBdata = DBdata
+        self.report_every = report_every
+        self.verbose = verbose
+        self.lock = threading.Lock() # Held by the evaluate stage while it writes DBdata
+        for source in sources:
+            source.lock = self.lock
+
+        self.stages = [Stage('parse', lambda job: job['Source'].parse(job), maxsize),
+                       Stage('evaluate', self._evaluate, maxsize),
+                       Stage('persist', self._persist, maxsize)]
+        for stage, following in zip(self.stages, self.stages[1:]):
+            stage.outbox = following.inbox
+        self.fetched = 0
+        self.blocked = 0.0 # Fetch time spent waiting on a full parse queue
+        self.last_report = time.monotonic()
+
+    def _evaluate(self, job):
+        with self.lock:
+            return job['Source'].evaluate(job, self.DBdata)
+
+    def _persist(self, job):
+        if self.recorder is not None:
+            self.recorder.record(job)
+        return job['Source'].persist(job)
+
+    def emit(self, job):
+        # Called by sources from the fetch thread for every fetched page
+        job['Fetched'] = time.time()
+        for stage in self.stages:
+            if stage.error is not None:
+                raise stage.error
+        start = time.monotonic()
+        self.stages[0].inbox.put(job)
+        self.blocked += time.monotonic() - start
+        self.fetched += 1
+        if self.verbose and time.monotonic() - self.last_report >= self.report_every:
+            self.report()
+
+    def stats(self):
+        stats = {'fetch': {'Depth': 0, 'Done': self.fetched, 'Busy': None, 'Blocked': round(self.blocked, 1)}}
+        for stage in self.stages:
+            stats[stage.name] = {'Depth': stage.inbox.qsize(), 'Done': stage.done,
+                                 'Busy': round(stage.busy, 1), 'Blocked': round(stage.blocked, 1)}
+        return stats
+
+    def report(self):
+        self.last_report = time.monotonic()
+        print(fg(245), end='')
+        print('    [PIPELINE] ' + ' | '.join('{0}: {1} queued, {2} done, {3}s blocked'.format(
+              name, x['Depth'], x['Done'], x['Blocked']) for name, x in self.stats().items()) +
+              ' | sleep ratio: {0}'.format(metrics.sleepRatio()))
+        print(fg.rs, end='')
+
+    def start(self):
+        for stage in self.stages:
+            stage.thread.start()
+        return self
+
+    def run(self, rounds=None):
+        # Cycles the sources; "rounds" limits the number of full passes (None runs forever)
+        self.start()
+        try:
+            for count, source in enumerate(cycle(self.sources)):
+                if rounds is not None and count >= rounds*len(self.sources):
+                    break
+                self.browser = source.fetch(self.browser, self.DBdata, self.emit) or self.browser
+        finally:
+            self.close()
+        return self.browser
+
+    def close(self):
+        # Drains everything already fetched through the remaining stages
+        self.stages[0].inbox.put(STOP)
+        for stage in self.stages:
+            stage.thread.join()
+        if self.recorder is not None:
+            self.recorder.close()
+        for stage in self.stages:
+            if stage.error is not None:
+                raise stage.error
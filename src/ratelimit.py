@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### Shared, adaptive rate limiting for every Steam fetcher (item pages and market/search/render).
+### Each endpoint gets a token bucket. Successes nudge its rate up additively, throttling signals
+###     (ban page, 429/502, null JSON) cut it multiplicatively and put the whole endpoint on a
+###     jittered exponential backoff, so parallel fetchers back off together.
+
+### Standard libraries
+import time                                 # Monotonic clock, blocking waits
+import random                               # Backoff jitter
+import asyncio                              # Non-blocking waits for the async scanner
+import threading                            # Buckets are shared across threads
+
+from metrics import metrics                 # Rate limit waits, backoffs and bans
+
+class Throttled(Exception):
+    # Raised by fetchers when Steam signals that we're going too fast
+    pass
+
+class TokenBucket:
+    def __init__(self, interval, burst=1, fastest=None, slowest=None):
+        # "interval" is the starting number of seconds per request.
+        # "fastest"/"slowest" bound how far adaptation can move that interval.
+        self.rate = 1/interval
+        self.max_rate = 1/(fastest or interval/2)
+        self.min_rate = 1/(slowest or interval*8)
+        self.increase = (self.max_rate - self.min_rate)/50 # Additive step per success
+        self.decrease = 0.5                                # Multiplicative cut per throttle
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0
+        self.streak = 0 # Consecutive throttles, drives the backoff exponent
+
+    def reserve(self, now):
+        # Takes a token (possibly one that hasn't accrued yet) and returns how long to wait for it
+        self.tokens = min(self.burst, self.tokens + (now - self.updated)*self.rate)
+        self.updated = now
+        self.tokens -= 1
+        wait = 0 if self.tokens >= 0 else -self.tokens/self.rate
+        return max(wait, self.blocked_until - now)
+
+    def success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+        self.streak = 0
+
+    def throttled(self, now, base, cap):
+        self.rate = max(self.min_rate, self.rate*self.decrease)
+        self.tokens = min(self.tokens, 0)
+        delay = min(cap, base*2**self.streak)
+        delay = delay/2 + random.uniform(0, delay/2) # Equal jitter: always wait at least half
+        self.streak += 1
+        self.blocked_until = max(self.blocked_until, now + delay)
+        return delay
+
+class RateLimiter:
+    def __init__(self, budgets, backoff_base=30, backoff_cap=600):
+        # "budgets" maps endpoint name -> TokenBucket kwargs.
+        # Backoff starts at backoff_base seconds and doubles per consecutive throttle up to
+        #     backoff_cap (server cooldown has been roughly 5 minutes).
+        self.budgets = budgets
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.buckets = dict()
+        self.lock = threading.Lock()
+        self.on_throttle = None # Optional callback(endpoint, delay), e.g. StateStore.ban
+
+    def bucket(self, endpoint, interval=None):
+        # Buckets are created on first use; "interval" only seeds a bucket that doesn't exist yet,
+        #     so whatever adaptation happened so far is kept.
+        # Sub-budgets like 'listings/2' (one browser session) start from their parent's budget.
+        with self.lock:
+            if endpoint not in self.buckets:
+                parent = endpoint.split('/')[0]
+                budget = dict(self.budgets.get(endpoint, self.budgets.get(parent, {'interval': 10})))
+                if interval:
+                    budget['interval'] = interval
+                self.buckets[endpoint] = TokenBucket(**budget)
+            return self.buckets[endpoint]
+
+    def delay(self, endpoint):
+        bucket = self.bucket(endpoint)
+        with self.lock:
+            return bucket.reserve(time.monotonic())
+
+    def acquire(self, endpoint):
+        wait = self.delay(endpoint)
+        self._waited(wait)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquireAsync(self, endpoint):
+        wait = self.delay(endpoint)
+        self._waited(wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def _waited(self, wait):
+        metrics.observe('ratelimit_wait', wait)
+        metrics.count('sleep_seconds', wait)
+
+    def success(self, endpoint):
+        bucket = self.bucket(endpoint)
+        with self.lock:
+            bucket.success()
+
+    def throttled(self, endpoint):
+        # Returns the backoff delay; the endpoint stays blocked for that long for every caller
+        bucket = self.bucket(endpoint)
+        with self.lock:
+            delay = bucket.throttled(time.monotonic(), self.backoff_base, self.backoff_cap)
+        print('Throttled on [{0}], backing off {1:.0f}s (now {2:.1f}s/request)'.format(
+              endpoint, delay, 1/bucket.rate))
+        metrics.count('bans')
+        metrics.count('sleep_seconds', delay) # Every caller sleeps out the backoff
+        if self.on_throttle is not None:
+            self.on_throttle(endpoint, delay)
+        return delay
+
+    def interval(self, endpoint):
+        return 1/self.bucket(endpoint).rate
+
+# Starting points come from the old hand-tuned waits: selenium_loadtime = 2.5, json_loadtime = 10
+DEFAULT_BUDGETS = {
+    'listings': {'interval': 2.5, 'fastest': 1.5, 'slowest': 30}, # Item pages
+    'search': {'interval': 10, 'fastest': 4, 'slowest': 60},      # market/search/render JSON
+}
+
+limiter = RateLimiter(DEFAULT_BUDGETS) # Shared by every fetcher in the process
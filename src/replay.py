@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### Forward testing on recorded market activity (the question in forwardtest.py: do flagged
+###     listings sell in 1 minute or 15?).
+### Recorder saves every market/search/render response and item page the pipeline fetches, with
+###     the time it was fetched, as gzipped JSON lines in ../data/recordings.
+### ReplayEngine feeds recordings back in time order through the same parsing, DBdata updates,
+###     LTTQH matching (searchMatches) and match logging the scanner uses, as fast as one core
+###     goes (or at a fixed multiple of real time), and follows every flagged listing through the
+###     later observations of its item.
+### Each engine has its own item and quartile indexes. The quartiles start from DBdata's sales
+###     before the recording's first event and move with the recorded time, so a replay only sees
+###     the history the scanner had then.
+### Flagged listings are then scored on:
+###     - Detection latency: the listing wasn't there at the item's previous observation, so it
+###         appeared somewhere in between; half that gap is the estimate.
+###     - Fill rate: a buyer reacting r seconds after detection gets the listing if it's still the
+###         lowest at detection + r. It was last seen at some time and gone by the next
+###         observation, so fills in that gap are interpolated. Listings still up when the
+###         recording ends only count at reactions the recording covers.
+###     python replay.py ../data/recordings/*.jsonl.gz
+
+import pandas as pd                         # Dataset format
+import numpy as np
+import gzip                                 # Recordings are mostly repetitive HTML
+import json
+import heapq                                # Merging several recordings by time
+import threading                            # The persist stage and runSerially's emitters share a recorder
+import time
+import os
+import sys
+from datetime import datetime
+
+from browse_itempage import parseItempage   # Same page parsing as the scanner
+from combinedfuncs import searchPage, searchMatches, writeMatch
+from orderstats import QuartileIndex        # Live quartiles, kept current as pages replay
+from itemindex import ItemIndex
+from salesstore import SalesStore, toSeconds
+from schema import readCompact              # item_info.h5 without unpickling the object frame
+
+REACTIONS = (0, 60, 300, 900) # Seconds from detection to buying, for the fill rate
+
+class Recorder:
+    def __init__(self, filename=None, directory='../data/recordings'):
+        # One file per run unless "filename" is given
+        if filename is None:
+            os.makedirs(directory, exist_ok=True)
+            filename = os.path.join(directory, datetime.now().strftime('%Y%m%d-%H%M%S') + '.jsonl.gz')
+        self.filename = filename
+        self.file = gzip.open(filename, 'at')
+        self.lock = threading.Lock()
+        self.events = 0
+
+    def record(self, job):
+        # Takes a pipeline job after parsing; only the raw page and fetch time are kept
+        when = job.get('Fetched', time.time())
+        if 'Response' in job:
+            event = {'Time': when, 'Kind': 'search', 'Condition': job['Condition'], 'Response': job['Response']}
+        elif 'Raw' in job:
+            item = {key: job['Item'][key] for key in ['Item Name', 'Special Type', 'Condition']}
+            item['Special Type'], item['Condition'] = int(item['Special Type']), int(item['Condition'])
+            event = {'Time': when, 'Kind': 'item', 'Item': item, 'Raw': job['Raw']}
+        else:
+            return
+        line = json.dumps(event) + '\n'
+        with self.lock:
+            self.file.write(line)
+            self.events += 1
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+def readRecording(filename):
+    # Yields events in file order. A torn last line (crash mid-write) ends the file.
+    with gzip.open(filename, 'rt') as f:
+        try:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    return
+        except EOFError: # Gzip stream cut off mid-block
+            return
+
+def readRecordings(filenames):
+    # Every event from every file, in time order
+    return heapq.merge(*[readRecording(filename) for filename in sorted(filenames)], key=lambda x: x['Time'])
+
+class Opportunity:
+    # One flagged listing, followed until a later observation of its item doesn't show it
+    def __init__(self, name, price, detected, previous, ratio):
+        self.name = name
+        self.price = price
+        self.detected = detected
+        self.previous = previous # Last observation of the item before detection (None if first)
+        self.ratio = ratio
+        self.last_seen = detected
+        self.gone = None         # First observation without it
+
+    def latency(self):
+        if self.previous is None:
+            return None
+        return (self.detected - self.previous)/2
+
+    def fill(self, reaction):
+        # Chance the listing is still up "reaction" seconds after detection; None if the recording
+        #     ended before that could be known
+        buy = self.detected + reaction
+        if buy <= self.last_seen:
+            return 1.0
+        if self.gone is None:
+            return None
+        if buy >= self.gone:
+            return 0.0
+        return (self.gone - buy)/(self.gone - self.last_seen)
+
+class ReplayEngine:
+    def __init__(self, DBdata, LTTQH_percent=1.15, reactions=REACTIONS, matchfile=None, speed=None, store=None):
+        # DBdata is updated in place by item pages, like the scanner's; pass a copy to keep it.
+        # "matchfile" receives matches through writeMatch (None skips logging). "speed" paces the
+        #     replay at that multiple of real time; None replays as fast as possible.
+        # "store" is DBdata's SalesStore, if there is one already; otherwise it's built.
+        self.DBdata = DBdata
+        self.store = store
+        self.itemindex = ItemIndex.fromDF(DBdata)
+        self.qindex = None # Built at the first event, as of its time
+        self.LTTQH_percent = LTTQH_percent
+        self.reactions = reactions
+        self.matchfile = matchfile
+        self.speed = speed
+        self.observed = dict() # name -> time of its last observation
+        self.open = dict()     # name -> Opportunity still showing
+        self.closed = []
+        self.counts = {'Events': 0, 'Search pages': 0, 'Item pages': 0, 'Matches': 0}
+        self.first = None
+        self.last = None
+
+    def observe(self, when, names, lowest):
+        # Any page that shows an item's lowest listing; a flagged listing is gone once the lowest
+        #     price is above it (or there are no listings)
+        for name, price in zip(names, lowest):
+            opportunity = self.open.get(name)
+            if opportunity is not None:
+                if price is not None and price <= opportunity.price:
+                    opportunity.last_seen = when
+                else:
+                    opportunity.gone = when
+                    self.closed.append(self.open.pop(name))
+
+    def match(self, when, names, prices):
+        # searchMatches on the items that could match. LTTQH only flags a listing under
+        #     Q3/(LTTQH_percent + .01), so the rest are dropped up front with a quartile lookup each;
+        #     pages without a candidate (most of them) skip the strategy entirely. Every row is
+        #     judged on its own, so the matches are the same.
+        labels = self.itemindex.lookup(names)
+        last = {name: i for i, name in enumerate(names)} # Like searchMatches, a name's last price wins
+        keep = []
+        for i, (label, price) in enumerate(zip(labels, prices)):
+            Q = self.qindex.quartiles(label) if label >= 0 and last[names[i]] == i else None
+            if Q is not None and price*(self.LTTQH_percent + .01) < Q[2]:
+                keep.append(i)
+        if not keep:
+            return None
+        return searchMatches(self.DBdata, [names[i] for i in keep], prices[keep], self.LTTQH_percent,
+                             now=datetime.fromtimestamp(when), verbose=False,
+                             itemindex=self.itemindex, qindex=self.qindex)
+
+    def flag(self, when, matches, previous):
+        if matches is None:
+            return
+        for name, price, ratio in zip(matches['Item Name'], matches['Lowest Listing'], matches['Ratio']):
+            if name not in self.open:
+                self.open[name] = Opportunity(name, price, when, previous.get(name), ratio)
+        self.counts['Matches'] += len(matches.index)
+        if self.matchfile is not None and len(matches.index) > 0:
+            writeMatch(self.matchfile, matches)
+
+    def searchEvent(self, event, when):
+        names, prices = searchPage(event['Response']['results'])
+        self.observe(when, names, prices.tolist())
+        matches = self.match(when, names, prices)
+        previous = {name: self.observed.get(name) for name in names}
+        self.observed.update((name, when) for name in names)
+        self.flag(when, matches, previous)
+        self.counts['Search pages'] += 1
+
+    def itemEvent(self, event, when):
+        item = event['Item']
+        name = item['Item Name']
+        label = self.itemindex.lookup([name])[0]
+        pagedata = parseItempage(event['Raw'], item, now=datetime.fromtimestamp(when))
+        lowest = pagedata['Listings'][0] if pagedata['Listings'] else None
+        self.observe(when, [name], [lowest])
+        self.counts['Item pages'] += 1
+        if label < 0: # Not in this DBdata
+            return
+        self.DBdata.loc[label] = pd.Series(pagedata)
+        self.qindex.update(label, pagedata['Sales from last month'])
+        previous = {name: self.observed.get(name)}
+        self.observed[name] = when
+        if lowest is not None:
+            matches = self.match(when, [name], np.array([lowest]))
+            self.flag(when, matches, previous)
+
+    def clock(self, when):
+        # Recorded time in the index's seconds (naive datetimes as UTC, like the page parsing's "now")
+        return toSeconds(datetime.fromtimestamp(when))
+
+    def begin(self, when):
+        # Quartiles as of the first event: DBdata's later sales are left out
+        if self.store is None:
+            self.store = SalesStore.fromDF(self.DBdata)
+        self.qindex = QuartileIndex.fromStore(self.store, [8,0], clock=self.clock(when))
+
+    def run(self, events):
+        start = time.perf_counter()
+        for event in events:
+            when = event['Time']
+            if self.first is None:
+                self.first = when
+                self.begin(when)
+            self.qindex.advance(self.clock(when))
+            if self.speed is not None: # Wait until this event is due at "speed" times real time
+                time.sleep(max(0, (when - self.first)/self.speed - (time.perf_counter() - start)))
+            if event['Kind'] == 'search':
+                self.searchEvent(event, when)
+            elif event['Kind'] == 'item':
+                self.itemEvent(event, when)
+            self.last = when
+            self.counts['Events'] += 1
+        self.wall = time.perf_counter() - start
+        return self.report()
+
+    def opportunities(self):
+        # One row per flagged listing, with its fill chance at every reaction time
+        rows = []
+        for x in self.closed + list(self.open.values()):
+            row = {'Item Name': x.name, 'Price': x.price, 'Ratio': x.ratio,
+                   'Detected': datetime.fromtimestamp(x.detected), 'Latency': x.latency(),
+                   'Lasted': (x.gone if x.gone is not None else x.last_seen) - x.detected,
+                   'Gone': x.gone is not None}
+            row.update({'Fill ' + str(r) + 's': x.fill(r) for r in self.reactions})
+            rows.append(row)
+        return pd.DataFrame(rows)
+
+    def report(self):
+        replayed = (self.last - self.first) if self.first is not None else 0
+        report = dict(self.counts)
+        report['Replayed Hours'] = round(replayed/3600, 2)
+        report['Wall Seconds'] = round(self.wall, 2)
+        report['Speedup'] = round(replayed/self.wall) if self.wall > 0 else None
+        report['Opportunities'] = len(self.closed) + len(self.open)
+        latencies = [x.latency() for x in self.closed + list(self.open.values()) if x.latency() is not None]
+        report['Latency Median'] = round(float(np.median(latencies)), 1) if latencies else None
+        report['Latency p90'] = round(float(np.percentile(latencies, 90)), 1) if latencies else None
+        for r in self.reactions:
+            fills = [x.fill(r) for x in self.closed + list(self.open.values())]
+            fills = [x for x in fills if x is not None]
+            report['Fill Rate ' + str(r) + 's'] = round(float(np.mean(fills)), 3) if fills else None
+        return report
+
+if __name__ == '__main__':
+    filenames = sys.argv[1:]
+    if not filenames:
+        directory = '../data/recordings'
+        filenames = [os.path.join(directory, x) for x in os.listdir(directory) if x.endswith('.jsonl.gz')]
+    compact = readCompact('../data/item_info.h5')
+    engine = ReplayEngine(compact.toDF(), store=compact.sales)
+    report = engine.run(readRecordings(filenames))
+    for key, value in report.items():
+        print('{0:<16} {1}'.format(key, value))
+    print(engine.opportunities().to_string(max_rows=50))
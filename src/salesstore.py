@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### Columnar storage for the 'Sales from last month' column of item_info.h5.
+### Every item's [datetime, price] list is flattened into one int64 timestamp array (seconds) and
+###     one price array, with per-item offsets into them. Sales inside an item are kept sorted by
+###     time, so date windows are binary searches instead of list comprehensions.
+
+import pandas as pd                         # Dataset format
+import numpy as np                          # Flat sales arrays
+from itertools import chain                 # Flattening the per-item sales lists
+from collections.abc import Sequence        # Lazy per-item history views
+from datetime import datetime, timedelta    # Converting sale dates to and from epoch seconds
+
+from itemindex import ItemIndex             # Saved alongside DBdata
+
+SECONDS_PER_DAY = 86400
+EPOCH = datetime(1970, 1, 1)
+ONE_SECOND = timedelta(seconds=1)
+
+# Naive datetimes are treated as UTC so that fromEpochSeconds gives back the same wall time.
+# Plain datetime arithmetic is several times faster here than pd.to_datetime on object lists.
+def toSeconds(date):
+    return (date - EPOCH) // ONE_SECOND
+
+def toEpochSeconds(dates):
+    return np.fromiter(map(toSeconds, dates), dtype=np.int64, count=len(dates))
+
+def fromEpochSeconds(seconds):
+    return np.asarray(seconds, dtype=np.int64).astype('datetime64[s]').astype(object).tolist()
+
+class SalesStore:
+    # index:      DBdata index labels, one per item
+    # offsets:    int64, len(index)+1. Item i owns timestamps[offsets[i]:offsets[i+1]]
+    # timestamps: int64 seconds, sorted within each item
+    # prices:     float64. Kept at full precision since sells are matched with >= against Q3,
+    #             which is itself one of these prices.
+    def __init__(self, index, offsets, timestamps, prices):
+        self.index = pd.Index(index)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.timestamps = np.asarray(timestamps, dtype=np.int64)
+        self.prices = np.asarray(prices, dtype=np.float64)
+
+    @classmethod
+    def fromDF(cls, df, column='Sales from last month'):
+        histories = df[column].tolist()
+        lengths = np.fromiter(map(len, histories), dtype=np.int64, count=len(histories))
+        offsets = np.zeros(len(histories)+1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        flat = list(chain.from_iterable(histories))
+        if flat:
+            dates, prices = zip(*flat)
+        else:
+            dates, prices = (), ()
+        timestamps = toEpochSeconds(dates)
+        prices = np.array(prices, dtype=np.float64)
+
+        # Steam hands the chart back in time order, but don't rely on it for the binary searches
+        owner = np.repeat(np.arange(len(histories)), lengths)
+        order = np.lexsort((timestamps, owner))
+        return cls(df.index, offsets, timestamps[order], prices[order])
+
+    def __len__(self):
+        return len(self.index)
+
+    def lengths(self):
+        return np.diff(self.offsets)
+
+    def positions(self, labels):
+        positions = self.index.get_indexer(labels)
+        if (positions == -1).any():
+            missing = [label for label, pos in zip(labels, positions) if pos == -1]
+            raise KeyError('Items not in sales store: ' + str(missing[:5]))
+        return positions
+
+    def history(self, label):
+        pos = self.index.get_loc(label)
+        start, stop = self.offsets[pos], self.offsets[pos+1]
+        return self.timestamps[start:stop], self.prices[start:stop]
+
+    def lastSale(self, positions):
+        # Timestamp of the final sale per item; items without sales get -1
+        positions = np.asarray(positions, dtype=np.int64)
+        stops = self.offsets[positions+1]
+        has_sales = stops > self.offsets[positions]
+        return np.where(has_sales, self.timestamps[np.maximum(stops-1, 0)], -1)
+
+    def resolveRegion(self, dateregion, rightmost):
+        # Same rules as analysis.historicalSelector, without mutating dateregion:
+        # ints/floats count days back from the floor of the rightmost sale, datetimes are used as is.
+        # rightmost can be a scalar or an array (one anchor per item).
+        rightfloor = rightmost - rightmost % SECONDS_PER_DAY
+        bounds = []
+        for date in dateregion:
+            if isinstance(date, (int, float, np.integer, np.floating)):
+                bounds.append(rightfloor - int(round(date*SECONDS_PER_DAY)))
+            elif hasattr(date, 'year'): # datetime or pd.Timestamp
+                bounds.append(np.full_like(rightfloor, toSeconds(date)))
+            else:
+                raise Exception('Unsupported type! Must be int or datetime. Your type: ' +
+                                str(type(date)))
+        return bounds[0], bounds[1]
+
+    def _segmentSearch(self, starts, stops, values, side):
+        # Vectorized bisect over every item's slice at once (log2(longest history) numpy steps)
+        lo = starts.copy()
+        hi = stops.copy()
+        last = max(len(self.timestamps)-1, 0)
+        while True:
+            active = lo < hi
+            if not active.any():
+                return lo
+            mid = (lo + hi) // 2
+            midvals = self.timestamps[np.minimum(mid, last)]
+            if side == 'left':
+                go_right = active & (midvals < values)
+            else:
+                go_right = active & (midvals <= values)
+            lo = np.where(go_right, mid+1, lo)
+            hi = np.where(active & ~go_right, mid, hi)
+
+    def searchsorted(self, positions, values, side='left'):
+        # Per-query bisect of "values" (epoch seconds) into the history of the item at "positions";
+        #     returns flat indices, like np.searchsorted offset by each item's start
+        positions = np.asarray(positions, dtype=np.int64)
+        values = np.asarray(values, dtype=np.int64)
+        return self._segmentSearch(self.offsets[positions], self.offsets[positions+1], values, side)
+
+    def bounds(self, dateregion, positions=None, anchor=None):
+        # Returns (starts, stops) into the flat arrays for sales with lo <= date <= hi.
+        # "anchor" (epoch seconds) pins int regions to a single rightmost date for every item
+        #     (historicalSelectorDF behaviour); otherwise each item is measured from its own last sale.
+        if positions is None:
+            positions = np.arange(len(self.index))
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = self.offsets[positions]
+        stops = self.offsets[positions+1]
+        if anchor is None:
+            rightmost = self.lastSale(positions)
+        else:
+            rightmost = np.full(len(positions), anchor, dtype=np.int64)
+        lo, hi = self.resolveRegion(dateregion, rightmost)
+        lo = np.broadcast_to(lo, positions.shape)
+        hi = np.broadcast_to(hi, positions.shape)
+        left = self._segmentSearch(starts, stops, lo, 'left')
+        right = self._segmentSearch(starts, stops, hi, 'right')
+        # Items without any sales can't be anchored; leave them empty
+        empty = (stops == starts) | (rightmost < 0)
+        right = np.where(empty | (right < left), left, right)
+        return left, right
+
+    def select(self, label, dateregion):
+        # Binary search counterpart of analysis.historicalSelector for one item, as arrays
+        pos = self.index.get_loc(label)
+        left, right = self.bounds(dateregion, positions=[pos])
+        return self.timestamps[left[0]:right[0]], self.prices[left[0]:right[0]]
+
+    def historicalSelector(self, label, dateregion=[7,0]):
+        # Drop-in for analysis.historicalSelector(DBdata.loc[label]['Sales from last month'], ...)
+        timestamps, prices = self.select(label, dateregion)
+        return [[date, price] for date, price in zip(fromEpochSeconds(timestamps), prices.tolist())]
+
+    def owners(self):
+        # Position of the owning item for every sale
+        return np.repeat(np.arange(len(self.index)), self.lengths())
+
+    def subset(self, positions):
+        positions = np.asarray(positions, dtype=np.int64)
+        return self.take(self.offsets[positions], self.offsets[positions+1], self.index[positions])
+
+    def mask(self, keep):
+        # New store with only the sales where keep is True; every item stays, possibly empty
+        lengths = np.bincount(self.owners()[keep], minlength=len(self.index))
+        offsets = np.zeros(len(self.index)+1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return SalesStore(self.index, offsets, self.timestamps[keep], self.prices[keep])
+
+    def take(self, starts, stops, labels):
+        # New store made of the given [start, stop) slices, one per label
+        lengths = stops - starts
+        offsets = np.zeros(len(lengths)+1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        flat = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        return SalesStore(labels, offsets, self.timestamps[flat], self.prices[flat])
+
+    def window(self, dateregion, labels=None, anchor=None):
+        # Columnar counterpart of historicalSelectorDF: returns a new, windowed store
+        if labels is None:
+            labels = self.index
+        positions = self.positions(labels)
+        starts, stops = self.bounds(dateregion, positions=positions, anchor=anchor)
+        return self.take(starts, stops, labels)
+
+    def toLists(self):
+        # Back to the DBdata cell format: one [[datetime, price], ...] list per item
+        dates = fromEpochSeconds(self.timestamps)
+        prices = self.prices.tolist()
+        pairs = [[date, price] for date, price in zip(dates, prices)]
+        offsets = self.offsets.tolist()
+        return [pairs[offsets[i]:offsets[i+1]] for i in range(len(self.index))]
+
+    def toViews(self):
+        # Like toLists, but every cell is a StoredHistory over this store's arrays; nothing is copied
+        offsets = self.offsets.tolist()
+        return [StoredHistory(self, offsets[i], offsets[i+1]) for i in range(len(self.index))]
+
+    def matches(self, df, column='Sales from last month'):
+        # Cheap staleness check against the DataFrame the store was supposedly built from
+        if not self.index.equals(df.index):
+            return False
+        lengths = np.fromiter(map(len, df[column]), dtype=np.int64, count=len(df.index))
+        return np.array_equal(lengths, self.lengths())
+
+    def toHDF(self, filename, key='sales'):
+        items = pd.DataFrame({'Start': self.offsets[:-1], 'Stop': self.offsets[1:]}, index=self.index)
+        points = pd.DataFrame({'Timestamp': self.timestamps, 'Price': self.prices})
+        items.to_hdf(filename, key + '/items', mode='a')
+        points.to_hdf(filename, key + '/points', mode='a')
+
+    @classmethod
+    def readHDF(cls, filename, key='sales'):
+        items = pd.read_hdf(filename, key + '/items')
+        points = pd.read_hdf(filename, key + '/points')
+        offsets = np.append(items['Start'].values, items['Stop'].values[-1:]) if len(items.index) else [0]
+        return cls(items.index, offsets, points['Timestamp'].values, points['Price'].values)
+
+class StoredHistory(Sequence):
+    # One item's sales as a read-only [[datetime, price], ...] sequence over a SalesStore's arrays.
+    #     len() is free, so the volume filters cost nothing; pairs are only built when read.
+    __slots__ = ('store', 'start', 'stop')
+
+    def __init__(self, store, start, stop):
+        self.store = store
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.pairs()[key]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError('StoredHistory index out of range')
+        flat = self.start + key
+        return [fromEpochSeconds([self.store.timestamps[flat]])[0], float(self.store.prices[flat])]
+
+    def __iter__(self):
+        return iter(self.pairs())
+
+    def pairs(self):
+        dates = fromEpochSeconds(self.store.timestamps[self.start:self.stop])
+        return [[date, price] for date, price in zip(dates, self.store.prices[self.start:self.stop].tolist())]
+
+def writeItemInfo(DBdata, filename='../data/item_info.h5', key='csgo', store=None):
+    if store is None:
+        store = SalesStore.fromDF(DBdata)
+    DBdata.to_hdf(filename, key, mode='w')
+    store.toHDF(filename)
+    ItemIndex.fromDF(DBdata).toHDF(filename)
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### Picks which item page to rescan next by how likely a scan is to turn up a buy, instead of
+###     walking the item list in a circle.
+### Every item has a value per unit of staleness:
+###     sales/day * (1 + quartile spread) * closeness of its lowest listing to the LTTQH buy line
+###               * (1 + recent near misses)
+###     and is due again base_interval/value after its last scan. Items sit in a heap keyed on their
+###     due time, so picking is O(log n) and nothing has to be rescored as the clock moves. A rescore
+###     pushes a fresh entry and bumps the item's version; stale entries are skipped when popped.
+
+import heapq                                # Due time ordered item queue
+import itertools                            # Tie breaking counter
+from datetime import datetime
+import numpy as np
+
+from salesstore import toSeconds            # Same clock as DBdata's 'Date' (naive local time)
+
+def clock():
+    return toSeconds(datetime.now())
+
+class RescanScheduler:
+    def __init__(self, percentage=1.15, qindex=None, base_interval=86400, near=0.10, half_life=86400,
+                 floor=0.05, max_near=4):
+        # "percentage" is LTTQH's; an item's listing is on the buy line at Q3/(percentage + .01).
+        # "qindex" is an orderstats.QuartileIndex for volatility and the buy line; without one (or
+        #     for items it has no quartiles for) only volume and staleness count.
+        # "base_interval" is how long (seconds) an item with value 1 waits between scans.
+        # "near" is how far above the buy line (as a fraction of it) a listing counts as a near miss,
+        #     and how fast closeness falls off; near misses halve in weight every "half_life" seconds.
+        # "floor" keeps every item's value above zero so that nothing is starved outright, and
+        #     "max_near" caps the near miss count so an item sitting under the line can't run away.
+        self.percentage = percentage
+        self.qindex = qindex
+        self.base_interval = base_interval
+        self.near = near
+        self.half_life = half_life
+        self.floor = floor
+        self.max_near = max_near
+        self.items = dict()   # label -> {'Sales/Day', 'Lowest', 'Last', 'Near', 'Seen'}
+        self.version = dict() # label -> version of its live heap entry
+        self.heap = []        # (due, tiebreak, label, version)
+        self.counter = itertools.count()
+
+    @classmethod
+    def fromDF(cls, df, **kwargs):
+        # Seeds every row of df (e.g. the items of interest), using 'Date' as the last scan
+        scheduler = cls(**kwargs)
+        lasts = df['Date'].values.astype('datetime64[s]').astype(np.int64)
+        lowest = [L[0] if isinstance(L, (list, tuple)) and len(L) else None for L in df['Listings']]
+        for label, sales, low, last in zip(df.index, df['Sales/Day'].values, lowest, lasts):
+            scheduler.items[label] = {'Sales/Day': float(sales), 'Lowest': low, 'Last': float(last),
+                                      'Near': 0.0, 'Seen': float(last)}
+            scheduler.version[label] = 0
+            scheduler.heap.append((scheduler.due(label), next(scheduler.counter), label, 0))
+        heapq.heapify(scheduler.heap)
+        return scheduler
+
+    def __len__(self):
+        return len(self.items)
+
+    def gap(self, label):
+        # Lowest listing over the buy line (<= 1 is a buy), or None without quartiles or listings
+        item = self.items[label]
+        Q = self.qindex.quartiles(label) if self.qindex is not None else None
+        if Q is None or item['Lowest'] is None:
+            return None
+        return item['Lowest']*(self.percentage + .01)/Q[2]
+
+    def value(self, label):
+        item = self.items[label]
+        Q = self.qindex.quartiles(label) if self.qindex is not None else None
+        if Q is None:
+            spread, closeness = 0, self.near
+        else:
+            spread = (Q[2] - Q[0])/Q[1]
+            gap = self.gap(label)
+            closeness = 1 if gap is None or gap <= 1 else self.near/(self.near + gap - 1)
+        value = item['Sales/Day'] * (1 + spread) * closeness * (1 + item['Near'])
+        return max(value, self.floor)
+
+    def due(self, label):
+        return self.items[label]['Last'] + self.base_interval/self.value(label)
+
+    def _push(self, label):
+        version = self.version[label] + 1
+        self.version[label] = version
+        heapq.heappush(self.heap, (self.due(label), next(self.counter), label, version))
+        if len(self.heap) > 4*len(self.items): # Mostly stale entries; rebuild from the live ones
+            self.heap = [entry for entry in self.heap if self.version[entry[2]] == entry[3]]
+            heapq.heapify(self.heap)
+
+    def _popLive(self):
+        # Most overdue item, off the heap until it's rescheduled
+        while self.heap:
+            due, _, label, version = heapq.heappop(self.heap)
+            if self.version.get(label) == version:
+                return label
+        raise IndexError('pop from an empty scheduler')
+
+    def _taken(self, label, now):
+        # Provisionally rescheduled as if scanned now, so a page that never comes back doesn't drop
+        #     the item from the rotation
+        self.items[label]['Last'] = clock() if now is None else now
+        self._push(label)
+
+    def pop(self, now=None):
+        # Takes the most overdue item
+        label = self._popLive()
+        self._taken(label, now)
+        return label
+
+    def take(self, count, now=None):
+        # The "count" most overdue items, each once. They're only put back after all are taken;
+        #     otherwise an item rescheduled sooner than the rest are due would come up again.
+        labels = [self._popLive() for _ in range(min(count, len(self.items)))]
+        for label in labels:
+            self._taken(label, now)
+        return labels
+
+    def observe(self, label, pagedata, now=None):
+        # Rescores an item from a freshly scanned page (after the quartile index has seen it)
+        if label not in self.items:
+            return
+        now = clock() if now is None else now
+        item = self.items[label]
+        item['Sales/Day'] = pagedata['Sales/Day']
+        item['Lowest'] = pagedata['Listings'][0] if pagedata['Listings'] else None
+        item['Near'] *= 0.5**((now - item['Seen'])/self.half_life)
+        item['Seen'] = now
+        item['Last'] = now
+        gap = self.gap(label)
+        if gap is not None and gap <= 1 + self.near:
+            item['Near'] = min(item['Near'] + 1, self.max_near)
+        self._push(label)
+
+    def add(self, label, sales_per_day, lowest=None, last=0):
+        # Items that appear after the scheduler was built; "last" 0 makes them due right away
+        if label not in self.items:
+            self.items[label] = {'Sales/Day': sales_per_day, 'Lowest': lowest, 'Last': last,
+                                 'Near': 0.0, 'Seen': last}
+            self.version[label] = 0
+            self._push(label)
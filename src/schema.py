@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### Compact, typed in-memory form of item_info.h5 and a per-column memory report.
+### DBdata keeps names as Python strings, codes as int64 and 'Listings'/'Sales from last month' as
+###     object columns of tuples and lists, which dominate RSS and make loading and pickling slow.
+###     CompactItems holds the same data as:
+###         scalars:  categorical names, int8 condition/special type codes, float32 rates
+###         listings: ragged float32 prices (per-item offsets into one flat array)
+###         sales:    the SalesStore (ragged int64 timestamps, float64 prices)
+### Sale prices stay float64: backtests match sells with >= against Q3, which is itself one of
+###     those prices, so rounding them would move matches. Everything float32 is a dollar amount or
+###     rate with two decimals, which float32 holds exactly enough to round back on the way out.
+
+import pandas as pd                         # Dataset format
+import numpy as np                          # Ragged arrays
+import sys                                  # Object sizes for the memory report
+import time
+
+from salesstore import SalesStore, writeItemInfo
+
+COLUMNS = ['Item Name', 'Special Type', 'Condition', 'Sales/Day', 'Buy Rate', 'Date',
+           'Sales from last month', 'Listings'] # DBdata's column order
+SCALAR_TYPES = {'Special Type': np.int8, 'Condition': np.int8, 'Sales/Day': np.float32, 'Buy Rate': np.float32}
+DECIMALS = 2 # Every float32 column (and listing prices) is in cents or hundredths
+
+class RaggedPrices:
+    # offsets: int64, len(items)+1. Item i owns prices[offsets[i]:offsets[i+1]]
+    # prices:  float32
+    def __init__(self, offsets, prices):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.prices = np.asarray(prices, dtype=np.float32)
+
+    @classmethod
+    def fromCells(cls, cells):
+        lengths = np.fromiter(map(len, cells), dtype=np.int64, count=len(cells))
+        offsets = np.zeros(len(cells)+1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        prices = np.fromiter((price for cell in cells for price in cell), dtype=np.float32, count=offsets[-1])
+        return cls(offsets, prices)
+
+    def toCells(self):
+        # Back to DBdata's tuples of float prices
+        prices = np.round(self.prices.astype(np.float64), DECIMALS).tolist()
+        offsets = self.offsets.tolist()
+        return [tuple(prices[offsets[i]:offsets[i+1]]) for i in range(len(offsets)-1)]
+
+    def lowest(self):
+        # First (lowest) listing per item, NaN for items without listings
+        starts, stops = self.offsets[:-1], self.offsets[1:]
+        found = stops > starts
+        lowest = np.full(len(starts), np.nan, dtype=np.float32)
+        lowest[found] = self.prices[starts[found]]
+        return lowest
+
+    def nbytes(self):
+        return self.offsets.nbytes + self.prices.nbytes
+
+class CompactItems:
+    def __init__(self, scalars, listings, sales):
+        # "scalars" is DBdata without the list columns, in the compact dtypes
+        self.scalars = scalars
+        self.listings = listings
+        self.sales = sales
+
+    @classmethod
+    def fromDF(cls, df, store=None):
+        # "store" is used if it lines up with df, otherwise one is built
+        if store is None or not store.index.equals(df.index):
+            store = SalesStore.fromDF(df)
+        scalars = df.drop(columns=['Listings', 'Sales from last month'])
+        scalars = scalars.astype(SCALAR_TYPES)
+        scalars['Item Name'] = scalars['Item Name'].astype('category')
+        return cls(scalars, RaggedPrices.fromCells(df['Listings'].tolist()), store)
+
+    def __len__(self):
+        return len(self.scalars.index)
+
+    def toDF(self):
+        # The DBdata this was made from: same columns, order, dtypes and values
+        df = self.scalars.astype({'Item Name': object, 'Special Type': np.int64, 'Condition': np.int64,
+                                  'Sales/Day': np.float64, 'Buy Rate': np.float64})
+        for column in ['Sales/Day', 'Buy Rate']:
+            df[column] = df[column].round(DECIMALS)
+        df['Sales from last month'] = pd.Series(self.sales.toLists(), index=df.index, dtype=object)
+        df['Listings'] = pd.Series(self.listings.toCells(), index=df.index, dtype=object)
+        return df[COLUMNS]
+
+    def toHDF(self, filename, key='compact'):
+        # Scalars go in a table (categorical names need one); listings in two flat arrays. The
+        #     sales arrays are already saved by writeItemInfo under 'sales'.
+        self.scalars.to_hdf(filename, key + '/items', mode='a', format='table')
+        pd.Series(self.listings.offsets).to_hdf(filename, key + '/listing_offsets', mode='a')
+        pd.Series(self.listings.prices).to_hdf(filename, key + '/listing_prices', mode='a')
+
+    @classmethod
+    def readHDF(cls, filename, key='compact'):
+        scalars = pd.read_hdf(filename, key + '/items')
+        listings = RaggedPrices(pd.read_hdf(filename, key + '/listing_offsets').values,
+                                pd.read_hdf(filename, key + '/listing_prices').values)
+        store = SalesStore.readHDF(filename)
+        if not store.index.equals(scalars.index) or len(listings.offsets) != len(scalars.index)+1:
+            raise KeyError('Compact tables in ' + filename + " don't line up")
+        return cls(scalars, listings, store)
+
+def writeCompact(DBdata, filename='../data/item_info.h5', key='csgo', store=None):
+    # writeItemInfo plus the compact tables, so readCompact can skip unpickling DBdata
+    if store is None:
+        store = SalesStore.fromDF(DBdata)
+    writeItemInfo(DBdata, filename, key, store)
+    CompactItems.fromDF(DBdata, store).toHDF(filename)
+
+def readCompact(filename='../data/item_info.h5', key='csgo'):
+    # The saved compact tables if writeCompact made them, otherwise converted from DBdata.
+    #     Everything that writes DBdata to the file starts it over (mode='w'), so saved tables
+    #     are never older than DBdata.
+    try:
+        return CompactItems.readHDF(filename)
+    except (KeyError, IndexError):
+        return CompactItems.fromDF(pd.read_hdf(filename, key))
+
+def readItemInfo(filename='../data/item_info.h5', key='csgo'):
+    # Loads DBdata together with its sales store. DBdata is rebuilt from the compact tables when
+    #     they're there, which skips unpickling the object frame; otherwise it's read as is and the
+    #     store is read from the same file if it still lines up, or rebuilt from the list cells.
+    try:
+        compact = CompactItems.readHDF(filename)
+        return compact.toDF(), compact.sales
+    except (KeyError, IndexError):
+        pass
+    DBdata = pd.read_hdf(filename, key)
+    try:
+        store = SalesStore.readHDF(filename)
+        if not store.matches(DBdata):
+            store = SalesStore.fromDF(DBdata)
+    except (KeyError, IndexError):
+        store = SalesStore.fromDF(DBdata)
+    return DBdata, store
+
+####################################################################################################
+# Memory report
+
+def deepSize(value):
+    # Bytes held by one cell, counting what lists and tuples point at
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        size += sum(deepSize(x) for x in value)
+    return size
+
+def objectBytes(df):
+    # Bytes per column of a regular DBdata. Object columns are measured cell by cell, since
+    #     memory_usage(deep=True) doesn't look inside the lists.
+    sizes = dict()
+    for column in df.columns:
+        if df[column].dtype == object:
+            sizes[column] = df[column].values.nbytes + sum(map(deepSize, df[column].values))
+        else:
+            sizes[column] = int(df[column].memory_usage(index=False))
+    return sizes
+
+def compactBytes(compact):
+    sizes = compact.scalars.memory_usage(index=False, deep=True).to_dict()
+    sizes['Listings'] = compact.listings.nbytes()
+    sales = compact.sales
+    sizes['Sales from last month'] = sales.offsets.nbytes + sales.timestamps.nbytes + sales.prices.nbytes
+    return {column: int(size) for column, size in sizes.items()}
+
+def memoryReport(DBdata, compact=None):
+    # One row per column: bytes as DBdata and as CompactItems
+    if compact is None:
+        compact = CompactItems.fromDF(DBdata)
+    before = objectBytes(DBdata)
+    after = compactBytes(compact)
+    report = pd.DataFrame({'Dtype': [str(DBdata[c].dtype) for c in DBdata.columns],
+                           'Compact Dtype': [str(compact.scalars[c].dtype) if c in compact.scalars else 'ragged'
+                                             for c in DBdata.columns],
+                           'Bytes': [before[c] for c in DBdata.columns],
+                           'Compact Bytes': [after[c] for c in DBdata.columns]}, index=DBdata.columns)
+    report.loc['Total'] = ['', '', report['Bytes'].sum(), report['Compact Bytes'].sum()]
+    report['Ratio'] = (report['Bytes']/report['Compact Bytes']).astype(float).round(1)
+    return report
+
+if __name__ == '__main__':
+    start = time.time()
+    DBdata = pd.read_hdf('../data/item_info.h5', 'csgo') # The object frame, for comparison
+    print('Read DBdata in {0:.2f}s'.format(time.time() - start))
+    start = time.time()
+    compact = readCompact('../data/item_info.h5')
+    print('Read compact items in {0:.2f}s'.format(time.time() - start))
+    print(memoryReport(DBdata, compact))
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### Scanner state in one SQLite file (WAL mode): scan cursors, per-item last scan times, run
+###     counters and ban events. Every update is its own transaction, so a crash never leaves a
+###     half-written file the way rewriting combineddata.json could, and several scanner processes
+###     can share cursors. Cursors are cached in process; reads only go to disk when asked to, so
+###     work shared between processes is claimed with advance(), which reads and moves a cursor in
+###     one transaction.
+
+import sqlite3                              # Embedded, transactional store
+import json                                 # Cursor values, importing combineddata.json
+import threading                            # One connection shared by the pipeline's threads
+import time
+import os
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS cursors (name TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS item_scans (label INTEGER PRIMARY KEY, scanned REAL NOT NULL, scans INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS bans (time REAL NOT NULL, endpoint TEXT NOT NULL, delay REAL NOT NULL);
+'''
+
+class StateStore:
+    def __init__(self, filename='../data/scanstate.db', legacy='combineddata.json'):
+        # "legacy" is the old metadata file; its cursors seed a fresh store
+        self.filename = filename
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(filename, timeout=30, isolation_level=None, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL') # WAL keeps this crash safe; only the last commit can be lost on power loss
+        self.db.executescript(SCHEMA)
+        self.cache = dict()
+        if legacy and os.path.exists(legacy) and not self.cursors(fresh=True):
+            with open(legacy, 'r') as f:
+                self.update(json.load(f))
+
+    def _transaction(self, statements, cached=None):
+        # BEGIN IMMEDIATE takes the write lock up front, so read-modify-write steps can't interleave
+        #     with another process
+        # "cached" maps the result to the cursor values it committed. The cache is updated under
+        #     the same lock, so it follows the commit order when threads race.
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                result = statements(self.db)
+                self.db.execute('COMMIT')
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+            if cached is not None:
+                self.cache.update(cached(result))
+        return result
+
+    ### Cursors: named JSON values (scan positions and the like)
+
+    def cursors(self, fresh=False):
+        with self.lock:
+            if fresh or not self.cache:
+                rows = self.db.execute('SELECT name, value FROM cursors').fetchall()
+                self.cache = {name: json.loads(value) for name, value in rows}
+            return dict(self.cache)
+
+    def cursor(self, name, default=None, fresh=False):
+        # The cached value can be behind other processes' writes; use advance() to claim work
+        with self.lock:
+            if fresh or name not in self.cache:
+                row = self.db.execute('SELECT value FROM cursors WHERE name = ?', (name,)).fetchone()
+                if row is None:
+                    return default
+                self.cache[name] = json.loads(row[0])
+            return self.cache[name]
+
+    def update(self, values):
+        # Sets several cursors in one transaction
+        def write(db):
+            db.executemany('INSERT OR REPLACE INTO cursors VALUES (?, ?)',
+                           [(name, json.dumps(value)) for name, value in values.items()])
+        self._transaction(write, cached=lambda result: values)
+
+    def setCursor(self, name, value):
+        self.update({name: value})
+
+    def advance(self, name, step=1, modulo=None, default=0):
+        # Atomically takes the cursor's current value and moves it on by "step". Processes sharing
+        #     the store each get a different value.
+        # With "modulo", a cursor that gets to it starts over at 0, the way a scan that reaches the
+        #     end of its list does; one already past it (the list got shorter) is taken as 0.
+        def claim(db):
+            row = db.execute('SELECT value FROM cursors WHERE name = ?', (name,)).fetchone()
+            value = json.loads(row[0]) if row is not None else default
+            if modulo is not None and value >= modulo:
+                value = 0
+            following = value + step
+            if modulo is not None and following >= modulo:
+                following = 0
+            db.execute('INSERT OR REPLACE INTO cursors VALUES (?, ?)', (name, json.dumps(following)))
+            return value, following
+        value, _ = self._transaction(claim, cached=lambda result: {name: result[1]})
+        return value
+
+    ### Per-item scans, counters and bans
+
+    def scanned(self, labels, when=None):
+        # Records a scan of every label in "labels" (and counts it)
+        when = time.time() if when is None else when
+        def write(db):
+            db.executemany('INSERT INTO item_scans VALUES (?, ?, 1) '
+                           'ON CONFLICT(label) DO UPDATE SET scanned = excluded.scanned, scans = scans + 1',
+                           [(int(label), when) for label in labels])
+        self._transaction(write)
+
+    def lastScans(self):
+        # label -> (epoch seconds of the last scan, number of scans)
+        with self.lock:
+            rows = self.db.execute('SELECT label, scanned, scans FROM item_scans').fetchall()
+        return {label: (scanned, scans) for label, scanned, scans in rows}
+
+    def count(self, name, amount=1):
+        def write(db):
+            db.execute('INSERT INTO counters VALUES (?, ?) '
+                       'ON CONFLICT(name) DO UPDATE SET value = value + excluded.value', (name, amount))
+        self._transaction(write)
+
+    def counters(self):
+        with self.lock:
+            return dict(self.db.execute('SELECT name, value FROM counters').fetchall())
+
+    def ban(self, endpoint, delay, when=None):
+        # Signature matches RateLimiter.on_throttle
+        when = time.time() if when is None else when
+        self._transaction(lambda db: db.execute('INSERT INTO bans VALUES (?, ?, ?)', (when, endpoint, delay)))
+
+    def bans(self, since=0):
+        with self.lock:
+            return self.db.execute('SELECT time, endpoint, delay FROM bans WHERE time >= ? ORDER BY time',
+                                   (since,)).fetchall()
+
+    def close(self):
+        with self.lock:
+            self.db.close()
+
+_stores = dict()
+def openStateStore(filename='../data/scanstate.db'):
+    # One connection per store, shared by every scanner in the process
+    if filename not in _stores:
+        _stores[filename] = StateStore(filename)
+    return _stores[filename]
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### Hyperparameter sweeps for BackTesterV2.
+### Every combination of a parameter grid is backtested in a process pool. The sales histories
+###     (SalesStore arrays) are placed in shared memory once, and every worker backtests straight
+###     off them: its DBdata's sales column is StoredHistory views into the shared arrays, so no
+###     worker pickles or rebuilds the per-item lists.
+
+import pandas as pd                         # Dataset format
+import numpy as np
+from multiprocessing import shared_memory   # Sales arrays shared with the workers
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import product               # Expanding the parameter grid
+import os
+
+from analysis import BackTesterV2, LessThanThirdQuartileHistorical, standardFilter
+from analysis import profitStats            # Same numbers profitAnalysisV2 reports
+from salesstore import SalesStore
+from schema import readItemInfo
+
+SALES_COLUMN = 'Sales from last month'
+STORE_ARRAYS = ['offsets', 'timestamps', 'prices']
+
+# One value list per BackTesterV2/LTTQH hyperparameter; every combination is run
+DEFAULT_GRID = {
+    'testregion': [[x, x-1] for x in range(5, 11)],
+    'liquidation_force_days': [1, 2, 3, 4, 5],
+    'percentage': [1.15, 1.20, 1.23, 1.30],
+    'dateregion': [[8,0]],
+    'usefallbackmethod': [True],
+}
+
+def expandGrid(grid):
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in product(*[grid[key] for key in keys])]
+
+####################################################################################################
+# Worker side. Each process attaches to the shared arrays once, in _initWorker.
+
+_worker = dict()
+
+def _attach(name, shape, dtype):
+    # Pool workers share the parent's resource tracker, so the parent's unlink covers this too
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=dtype, buffer=block.buf)
+
+def _initWorker(frame, layout, strategy):
+    blocks = []
+    arrays = dict()
+    for key, (name, shape, dtype) in layout.items():
+        block, arrays[key] = _attach(name, shape, dtype)
+        blocks.append(block)
+    store = SalesStore(frame.index, arrays['offsets'], arrays['timestamps'], arrays['prices'])
+    _worker['blocks'] = blocks # Keeps the mappings alive
+    _worker['store'] = store
+    _worker['DBdata'] = frame.assign(**{SALES_COLUMN: pd.Series(store.toViews(), index=frame.index, dtype=object)})
+    _worker['strategy'] = strategy
+
+def _runOne(params):
+    tester = BackTesterV2(_worker['strategy'], params['testregion'], params['liquidation_force_days'],
+                          inputs=[params['percentage'], params['dateregion']],
+                          usefallbackmethod=params['usefallbackmethod'])
+    _, phasesells = tester.runBacktest(_worker['DBdata'], verbose=False, store=_worker['store'])
+    return params, profitStats(*phasesells)
+
+####################################################################################################
+
+def sweep(DBdata, grid=DEFAULT_GRID, store=None, strategy=LessThanThirdQuartileHistorical, workers=None,
+          verbose=True):
+    # Backtests every combination in "grid" and returns one row per combination.
+    # "store" only has to cover DBdata's index; "workers" defaults to every core.
+    if store is None:
+        store = SalesStore.fromDF(DBdata)
+    store = store.subset(store.positions(DBdata.index))
+    frame = DBdata.drop(columns=[SALES_COLUMN])
+    combinations = expandGrid(grid)
+
+    blocks = []
+    layout = dict()
+    try:
+        for key in STORE_ARRAYS:
+            array = getattr(store, key)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+            blocks.append(block)
+            layout[key] = (block.name, array.shape, array.dtype)
+
+        rows = []
+        with ProcessPoolExecutor(max_workers=workers or os.cpu_count(), initializer=_initWorker,
+                                 initargs=(frame, layout, strategy)) as pool:
+            futures = [pool.submit(_runOne, params) for params in combinations]
+            for done, future in enumerate(as_completed(futures)):
+                params, summary = future.result()
+                rows.append(dict(params, **summary))
+                if verbose:
+                    print('    [{0}/{1}]'.format(done+1, len(combinations)), params, 'net', summary['Net Profit'])
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    results = pd.DataFrame(rows, columns=list(grid) + list(profitStats([], [], [])))
+    for key in grid: # List-valued parameters don't sort or group; store them as tuples
+        results[key] = results[key].apply(lambda x: tuple(x) if isinstance(x, list) else x)
+    return results.sort_values('Net Profit', ascending=False).reset_index(drop=True)
+
+if __name__ == '__main__':
+    print('Doing inital dataset import...')
+    DBdata, store = readItemInfo('../data/item_info.h5')
+    DBdata = standardFilter(DBdata)
+    print('Sweeping', len(expandGrid(DEFAULT_GRID)), 'combinations over', len(DBdata.index), 'items...')
+    results = sweep(DBdata, store=store)
+    print(results.head(20))
+    results.to_csv('../data/hyperparam-determination/sweep.csv', index=False)
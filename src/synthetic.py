@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+### PURPOSE:
+### Synthetic market data for benchmarks and experiments, so the real data files aren't needed.
+### syntheticDBdata builds a DBdata-shaped frame: heavy tailed sales volume, hourly sales whose
+###     prices follow a noisy random walk with occasional dips, sorted listings around the current
+###     price and a buy rate under it. listingHTML and chartHTML render the page fragments that
+###     cleanListing and cleanVolumetric parse.
+
+import pandas as pd                         # Dataset format
+import numpy as np                          # Vectorized generation
+from datetime import datetime
+
+from salesstore import SalesStore, toSeconds
+
+CONDITION_NAMES = ['Factory New', 'Minimal Wear', 'Field-Tested', 'Well-Worn', 'Battle-Scarred']
+WEAPONS = ['AK-47', 'M4A4', 'M4A1-S', 'AWP', 'Desert Eagle', 'USP-S', 'Glock-18', 'P250', 'MP9', 'UMP-45']
+
+def syntheticDBdata(items=1000, days=30, seed=0, now=None, max_listings=10):
+    # "now" defaults to the current hour; every item's 'Date' (last scan) is set to it
+    rng = np.random.default_rng(seed)
+    if now is None:
+        now = datetime.now().replace(minute=0, second=0, microsecond=0)
+    hours = days*24
+    start = toSeconds(now) - hours*3600
+
+    # Volume: a few very liquid items, a long tail of rarely sold ones
+    sales_per_day = np.minimum(rng.pareto(1.2, items)*4 + 0.2, 24)
+    sold = rng.random((items, hours)) < (sales_per_day/24)[:, None]
+
+    # Price: log random walk around a lognormal base, plus per-sale noise and occasional dips
+    base = np.round(np.exp(rng.normal(1.0, 1.2, items)) + 0.03, 2)
+    walk = np.cumsum(rng.normal(0, 0.004, (items, hours)), axis=1)
+    noise = rng.normal(0, 0.04, (items, hours))
+    dips = np.where(rng.random((items, hours)) < 0.01, rng.uniform(-0.35, -0.1, (items, hours)), 0)
+    prices = np.round(base[:, None]*np.exp(walk + noise + dips), 3)
+
+    lengths = sold.sum(axis=1)
+    offsets = np.zeros(items+1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    owner, hour = np.nonzero(sold) # Row-major, so already grouped by item and sorted by time
+    store = SalesStore(np.arange(items), offsets, start + hour.astype(np.int64)*3600, prices[owner, hour])
+
+    current = base*np.exp(walk[:, -1])
+    listings = []
+    for i in range(items):
+        count = rng.integers(1, max_listings+1) # LTTQH.run reads every item's lowest listing
+        listings.append(tuple(sorted(np.round(current[i]*rng.lognormal(0.05, 0.1, count), 2).tolist())))
+
+    conditions = rng.integers(0, 5, items)
+    special = (rng.random(items) < 0.08).astype(np.int64)
+    names = ['{0}{1} | Skin {2} ({3})'.format(['', 'Souvenir '][special[i]], WEAPONS[i % len(WEAPONS)], i,
+                                               CONDITION_NAMES[conditions[i]]) for i in range(items)]
+    return pd.DataFrame({'Item Name': names,
+                         'Special Type': special,
+                         'Condition': conditions.astype(np.int64),
+                         'Sales/Day': np.round(lengths/days, 2),
+                         'Buy Rate': np.round(current*0.8, 2),
+                         'Date': [now]*items,
+                         'Sales from last month': store.toLists(),
+                         'Listings': listings})
+
+def listingHTML(prices, seed=0, sold=0.05):
+    # #searchResultsRows markup for the given listing prices; a few rows show 'Sold!'
+    rng = np.random.default_rng(seed)
+    rows = []
+    for i, price in enumerate(prices):
+        text = 'Sold!' if rng.random() < sold else '${0:.2f} USD'.format(price)
+        rows.append('<div class="market_listing_row market_recent_listing_row" id="listing_{0}">'
+                    '<a id="listing_{0}_name" class="market_listing_item_name_link"></a>'
+                    '<span class="market_listing_price market_listing_price_with_fee">\n\t\t{1}\t\t</span>'
+                    '<span class="market_listing_price market_listing_price_without_fee">${2:.2f}</span>'
+                    '</div>'.format(3000000000 + i, text, price/1.15))
+    return '<div id="searchResultsRows">' + ''.join(rows) + '</div>'
+
+def chartHTML(history, volume=(1, 20), seed=0):
+    # Page content holding the price chart for a [[datetime, price], ...] history
+    rng = np.random.default_rng(seed)
+    points = ','.join('["{0} {1:02d}: +0",{2},"{3}"]'.format(date.strftime('%b %d %Y'), date.hour, price,
+                                                              rng.integers(*volume))
+                      for date, price in history)
+    return '<div><script type="text/javascript">var line1=[' + points + '];\nvar line2=[];</script></div>'
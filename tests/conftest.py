@@ -0,0 +1,6 @@
+# The modules in src/ import each other by bare name (they're run from inside src/), so the tests
+#     put src/ on the path the same way.
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
@@ -0,0 +1,106 @@
+# A local HTTP server serving the saved item pages, and a webdriver stand-in that loads pages from
+#     it with urllib and answers CSS selectors with BeautifulSoup, for tests of the browser code.
+import http.server
+import threading
+import urllib.parse
+import urllib.request
+
+from bs4 import BeautifulSoup
+from selenium.common.exceptions import NoSuchElementException
+
+from pages import readFixture
+
+BAN_PAGE = ('<html><body><div id="message"><h3>Sorry! You\'ve made too many requests recently. '
+            'Please wait and try your request again later.</h3></div></body></html>')
+
+class Element:
+    def __init__(self, tag):
+        self.tag = tag
+        self.text = tag.get_text()
+
+    def get_attribute(self, name):
+        if name == 'outerHTML':
+            return str(self.tag)
+        return self.tag.get(name)
+
+class FakeBrowser:
+    def __init__(self, name=None):
+        # "name" is sent as an X-Browser header, so the server can treat sessions differently
+        self.name = name
+        self.current_url = None
+        self.page_source = ''
+        self.soup = BeautifulSoup('', 'html.parser')
+        self.cookies = []
+        self.loads = 0
+        self.closed = False
+
+    def get(self, url):
+        request = urllib.request.Request(url, headers={'X-Browser': str(self.name)})
+        with urllib.request.urlopen(request, timeout=10) as response:
+            self.page_source = response.read().decode('utf-8')
+        self.current_url = url
+        self.soup = BeautifulSoup(self.page_source, 'html.parser')
+        self.loads += 1
+
+    def refresh(self):
+        self.get(self.current_url)
+
+    def find_element_by_css_selector(self, selector):
+        tag = self.soup.select_one(selector)
+        if tag is None:
+            raise NoSuchElementException(selector)
+        return Element(tag)
+
+    def find_element(self, by, selector):
+        return self.find_element_by_css_selector(selector)
+
+    def add_cookie(self, cookie):
+        self.cookies.append(cookie)
+
+    def get_cookies(self):
+        return list(self.cookies)
+
+    def quit(self):
+        self.closed = True
+
+class FixtureServer:
+    # /market/listings/730/<name> serves tests/fixtures/<name>; "banned" maps a name to the set of
+    #     X-Browser values that get the ban page for it instead. Every request is logged.
+    def __init__(self):
+        self.banned = dict()
+        self.requests = []
+        server = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                name = urllib.parse.unquote(self.path.rsplit('/', 1)[-1])
+                browser = self.headers.get('X-Browser')
+                server.requests.append((name, browser))
+                if browser in server.banned.get(name, ()):
+                    body = BAN_PAGE
+                else:
+                    try:
+                        body = readFixture(name)
+                    except FileNotFoundError:
+                        self.send_error(404)
+                        return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.end_headers()
+                self.wfile.write(body.encode('utf-8'))
+
+            def log_message(self, *args):
+                pass
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base = 'http://127.0.0.1:{0}'.format(self.httpd.server_address[1])
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def url(self, name):
+        return self.base + '/market/listings/730/' + urllib.parse.quote(name)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
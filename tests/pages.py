@@ -0,0 +1,21 @@
+# Saved item pages in tests/fixtures, and the pieces of them readItempage reads off the DOM
+import os
+from bs4 import BeautifulSoup
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+ITEM_PAGES = sorted(x for x in os.listdir(FIXTURES) if x.startswith('item_') and x.endswith('.html'))
+CHART_SELECTOR = 'body > div.responsive_page_frame.with_header > div.responsive_page_content > div.responsive_page_template_content'
+BUY_RATE_SELECTOR = '#market_commodity_buyrequests > span:nth-child(2)'
+
+def readFixture(name):
+    with open(os.path.join(FIXTURES, name), 'r') as f:
+        return f.read()
+
+def rawFromPage(html):
+    # Same dict readItempage builds from a live browser
+    soup = BeautifulSoup(html, 'html.parser')
+    listings = soup.select_one('#searchResultsRows')
+    buy_rate = soup.select_one(BUY_RATE_SELECTOR)
+    return {'Listings': str(listings) if listings is not None else None,
+            'Buy Rate': buy_rate.get_text() if buy_rate is not None else None,
+            'Chart': str(soup.select_one(CHART_SELECTOR))}
@@ -0,0 +1,193 @@
+# AsyncSearchScanner against a scripted local server: only rate limit answers back the endpoint
+#     off; dropped connections and non-JSON bodies are retried without touching the rate. A slow
+#     in-process client checks the concurrency bound and what one throttled page does to a batch.
+import http.server
+import json
+import threading
+import time
+import urllib.parse
+
+import pytest
+
+from asyncscan import AsyncSearchScanner, fetchJSON
+from httpclient import SteamHTTP
+from ratelimit import RateLimiter, Throttled
+
+class ScriptedServer:
+    # "script" maps a page's start offset to the answers it gives, in order; after the script
+    #     runs out the page is served normally. Answers: 'ok', '429', 'drop', 'html', 'null'.
+    def __init__(self, script=None, delay=0):
+        self.script = {start: list(answers) for start, answers in (script or {}).items()}
+        self.delay = delay
+        self.requests = []
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.most_inflight = 0
+        server = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+                start = int(query['start'][0])
+                with server.lock:
+                    server.requests.append(start)
+                    answers = server.script.get(start)
+                    answer = answers.pop(0) if answers else 'ok'
+                    server.inflight += 1
+                    server.most_inflight = max(server.most_inflight, server.inflight)
+                try:
+                    if server.delay:
+                        threading.Event().wait(server.delay)
+                    if answer == 'drop':
+                        self.close_connection = True
+                        return
+                    status, body = {'ok': (200, json.dumps({'success': True, 'start': start, 'total_count': 0, 'results': []})),
+                                    '429': (429, 'Too Many Requests'),
+                                    'html': (200, '<html>Sign In</html>'),
+                                    'null': (200, 'null')}[answer]
+                    body = body.encode('utf-8')
+                    self.send_response(status)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                finally:
+                    with server.lock:
+                        server.inflight -= 1
+
+            def log_message(self, *args):
+                pass
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base = 'http://127.0.0.1:{0}'.format(self.httpd.server_address[1])
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+def limiter(interval=0.001):
+    limiter = RateLimiter({'search': {'interval': interval, 'fastest': interval/2, 'slowest': 1}},
+                          backoff_base=0.001, backoff_cap=0.002)
+    limiter.throttles = []
+    limiter.on_throttle = lambda endpoint, delay: limiter.throttles.append(endpoint)
+    return limiter
+
+def scanPages(scanner, starts):
+    pages = dict()
+    scanner.run(scanner.scan([(0, start) for start in starts],
+                             lambda condition, start, response: pages.update({start: response})))
+    return pages
+
+@pytest.fixture(params=['urllib', 'SteamHTTP'])
+def fetcher(request):
+    if request.param == 'urllib':
+        yield fetchJSON
+    else:
+        client = SteamHTTP()
+        yield client.fetch
+        client.close()
+
+def test_dropped_connection_is_not_a_ban(fetcher):
+    with ScriptedServer({100: ['drop'], 200: ['html']}) as server:
+        rates = limiter()
+        scanner = AsyncSearchScanner(concurrency=1, base=server.base, fetch=fetcher, limiter=rates)
+        rate = rates.bucket('search').rate
+        pages = scanPages(scanner, [0, 100, 200])
+    assert all(page['success'] for page in pages.values())
+    assert sorted(server.requests) == [0, 100, 100, 200, 200]
+    assert rates.throttles == []
+    assert rates.bucket('search').rate >= rate # Only successes moved it
+
+@pytest.mark.parametrize('answer', ['429', 'null'])
+def test_rate_limit_answers_back_off(fetcher, answer):
+    with ScriptedServer({100: [answer]}) as server:
+        rates = limiter()
+        scanner = AsyncSearchScanner(concurrency=1, base=server.base, fetch=fetcher, limiter=rates)
+        pages = scanPages(scanner, [0, 100])
+    assert all(page['success'] for page in pages.values())
+    assert rates.throttles == ['search']
+    assert rates.bucket('search').streak == 0 # Reset by the retry's success
+
+def test_failures_give_up_after_attempts(fetcher):
+    with ScriptedServer({0: ['drop']*3}) as server:
+        rates = limiter()
+        scanner = AsyncSearchScanner(concurrency=1, base=server.base, fetch=fetcher, limiter=rates, attempts=3)
+        pages = scanPages(scanner, [0])
+    assert pages == {0: None}
+    assert server.requests == [0, 0, 0]
+    assert rates.throttles == []
+
+class SlowClient:
+    # A fetch that takes "delay" seconds and counts the requests in flight. "throttle" maps a page's
+    #     start offset to how many times it raises Throttled before answering.
+    def __init__(self, delay=0.05, throttle=None):
+        self.delay = delay
+        self.throttle = dict(throttle or {})
+        self.lock = threading.Lock()
+        self.inflight = 0
+        self.most_inflight = 0
+        self.started = [] # (monotonic time, start offset)
+
+    def __call__(self, url):
+        start = int(urllib.parse.parse_qs(urllib.parse.urlparse(url).query)['start'][0])
+        with self.lock:
+            self.started.append((time.monotonic(), start))
+            self.inflight += 1
+            self.most_inflight = max(self.most_inflight, self.inflight)
+            throttled = self.throttle.get(start, 0) > 0
+            if throttled:
+                self.throttle[start] -= 1
+        try:
+            if throttled:
+                raise Throttled('HTTP 429')
+            time.sleep(self.delay)
+            return {'success': True, 'start': start, 'total_count': 0, 'results': []}
+        finally:
+            with self.lock:
+                self.inflight -= 1
+
+@pytest.mark.parametrize('concurrency', [1, 3])
+def test_concurrency_bound(concurrency):
+    client = SlowClient()
+    scanner = AsyncSearchScanner(concurrency=concurrency, fetch=client, limiter=limiter())
+    started = time.monotonic()
+    pages = scanPages(scanner, range(0, 1200, 100))
+    elapsed = time.monotonic() - started
+    assert sorted(pages) == list(range(0, 1200, 100))
+    assert client.most_inflight == concurrency
+    assert elapsed >= 12/concurrency*client.delay
+
+def test_throttled_page_holds_back_the_batch():
+    client = SlowClient(throttle={300: 1})
+    rates = RateLimiter({'search': {'interval': 0.001, 'fastest': 0.0005, 'slowest': 1}},
+                        backoff_base=0.2, backoff_cap=0.2)
+    throttles = []
+    rates.on_throttle = lambda endpoint, delay: throttles.append((time.monotonic(), delay))
+    scanner = AsyncSearchScanner(concurrency=2, fetch=client, limiter=rates)
+    interval = rates.interval('search')
+    pages = scanPages(scanner, range(0, 800, 100))
+
+    # Every page still arrives; only the throttled one was asked for twice
+    assert all(page['success'] for page in pages.values()) and sorted(pages) == list(range(0, 800, 100))
+    assert sorted(start for _, start in client.started) == sorted(list(range(0, 800, 100)) + [300])
+    # The endpoint's rate was cut, and nothing new was sent until the backoff ran out
+    assert len(throttles) == 1
+    moment, delay = throttles[0]
+    assert 0.1 <= delay <= 0.2
+    later = [when for when, _ in client.started if when > moment + 0.01]
+    assert later and min(later) >= moment + delay - 0.01
+    assert rates.interval('search') > interval
+    assert rates.bucket('search').streak == 0
+
+def test_page_throttled_on_every_attempt_is_dropped_alone():
+    client = SlowClient(delay=0.01, throttle={100: 3})
+    rates = limiter()
+    scanner = AsyncSearchScanner(concurrency=2, fetch=client, limiter=rates, attempts=3)
+    pages = scanPages(scanner, [0, 100, 200])
+    assert pages[100] is None
+    assert pages[0]['success'] and pages[200]['success']
+    assert rates.throttles == ['search']*3
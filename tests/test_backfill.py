@@ -0,0 +1,52 @@
+# findmissing's backfill step on the saved item pages: loadItempage with firstscan=True has to work
+#     out the item's Special Type and Condition from its name, and give a row for every DBdata column.
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import browse_itempage
+import ratelimit
+from browse_itempage import loadItempage, parseItempage
+from fakebrowser import FakeBrowser, FixtureServer
+from pages import ITEM_PAGES, readFixture, rawFromPage
+from synthetic import syntheticDBdata
+
+@pytest.fixture(autouse=True)
+def fastLimiter(monkeypatch):
+    monkeypatch.setattr(ratelimit.limiter, 'buckets', dict())
+    monkeypatch.setattr(ratelimit.limiter, 'budgets', {'listings': {'interval': 0.001}})
+    monkeypatch.setattr(ratelimit.limiter, 'on_throttle', None)
+    monkeypatch.setattr(browse_itempage, 'REFRESH_TIMEOUT', 0.2)
+
+@pytest.fixture
+def server():
+    with FixtureServer() as server:
+        yield server
+
+NAMES = [('AK-47 | Redline (Field-Tested)', 0, 2),
+         ('Souvenir AWP | Safari Mesh (Factory New)', 1, 0),
+         ('StatTrak™ M4A1-S | Hyper Beast (Battle-Scarred)', 0, 4)]
+
+@pytest.mark.parametrize('name, special, condition', NAMES)
+def test_firstscan_reads_type_and_condition(name, special, condition):
+    raw = rawFromPage(readFixture('item_listings.html'))
+    pagedata = parseItempage(raw, {'Item Name': name}, firstscan=True)
+    assert (pagedata['Item Name'], pagedata['Special Type'], pagedata['Condition']) == (name, special, condition)
+
+@pytest.mark.parametrize('page', ITEM_PAGES)
+def test_backfill_row_from_saved_page(server, page):
+    # Same calls and buffering as findmissing's loop and flush
+    DBdata = syntheticDBdata(items=3, now=datetime(2026, 10, 18, 7))
+    name = 'AK-47 | Redline (Minimal Wear)'
+    browser, pagedata = loadItempage(FakeBrowser(), server.url(page), {'Item Name': name}, 2, firstscan=True)
+
+    buffer = {column: [pagedata.get(column)] for column in DBdata.columns}
+    assert set(DBdata.columns) <= set(pagedata)
+    new_index = DBdata.index.max() + 1
+    DBdata = pd.concat([DBdata, pd.DataFrame(buffer, index=[new_index], columns=DBdata.columns)])
+
+    row = DBdata.loc[new_index]
+    assert (row['Item Name'], row['Special Type'], row['Condition']) == (name, 0, 1)
+    assert row['Listings'] == pagedata['Listings']
+    assert row['Sales/Day'] == round(len(pagedata['Sales from last month'])/30, 2)
@@ -0,0 +1,115 @@
+# BackTesterV2's batched sell matching against plain scans: SellMatcher.firstAtLeast and
+#     SalesStore.searchsorted on random data, and the phase 1/2/3 results against the old
+#     per-purchase loop on synthetic data.
+import copy
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from analysis import BackTesterV2, LessThanThirdQuartileHistorical, SellMatcher, historicalSelector
+from salesstore import SalesStore
+from synthetic import syntheticDBdata
+
+NOW = datetime(2026, 10, 18, 7)
+
+def randomStore(lengths, seed=0):
+    # Items with the given numbers of sales; prices repeat a lot so ties at the threshold happen
+    rng = np.random.default_rng(seed)
+    offsets = np.zeros(len(lengths)+1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    timestamps = np.concatenate([np.sort(rng.choice(10**6, size=n, replace=False)) for n in lengths] + [np.zeros(0, dtype=np.int64)])
+    prices = rng.integers(1, 40, offsets[-1]).astype(np.float64)/4
+    return SalesStore(np.arange(len(lengths)), offsets, timestamps.astype(np.int64), prices)
+
+def firstAtLeastScan(prices, left, right, threshold):
+    for i in range(left, right):
+        if prices[i] >= threshold:
+            return i
+    return -1
+
+# Around every power of two up to 128, plus empty and single-sale items, in an order that puts
+#     item starts at odd and even offsets
+EDGE_LENGTHS = [0, 1, 2, 3, 4, 5, 7, 8, 9, 15, 16, 17, 0, 31, 32, 33, 63, 64, 65, 127, 128, 129, 1, 6]
+
+def test_first_at_least_every_range():
+    store = randomStore(EDGE_LENGTHS, seed=1)
+    matcher = SellMatcher(store)
+    lefts, rights, thresholds = [], [], []
+    for position in range(len(store.index)):
+        start, stop = store.offsets[position], store.offsets[position+1]
+        for left in range(start, stop+1):
+            for right in range(left, stop+1):
+                for threshold in (0.25, 5.0, 9.75, 100.0):
+                    lefts.append(left)
+                    rights.append(right)
+                    thresholds.append(threshold)
+    found = matcher.firstAtLeast(lefts, rights, thresholds)
+    expected = [firstAtLeastScan(store.prices, *query) for query in zip(lefts, rights, thresholds)]
+    assert found.tolist() == expected
+
+@pytest.mark.parametrize('seed', range(5))
+def test_first_at_least_random(seed):
+    rng = np.random.default_rng(seed)
+    store = randomStore(rng.integers(0, 300, 200), seed=seed)
+    matcher = SellMatcher(store)
+    positions = rng.integers(0, len(store.index), 5000)
+    starts, stops = store.offsets[positions], store.offsets[positions+1]
+    a = starts + (rng.random(5000)*(stops - starts + 1)).astype(np.int64)
+    b = starts + (rng.random(5000)*(stops - starts + 1)).astype(np.int64)
+    left, right = np.minimum(a, b), np.maximum(a, b)
+    threshold = store.prices[np.minimum(left, len(store.prices)-1)] + rng.integers(-2, 6, 5000)/4
+    found = matcher.firstAtLeast(left, right, threshold)
+    expected = [firstAtLeastScan(store.prices, *query) for query in zip(left, right, threshold)]
+    assert found.tolist() == expected
+
+def test_searchsorted_matches_numpy():
+    rng = np.random.default_rng(7)
+    store = randomStore(EDGE_LENGTHS, seed=7)
+    positions = np.repeat(np.arange(len(store.index)), 40)
+    values = rng.integers(-10, 10**6 + 10, len(positions))
+    values[::7] = store.timestamps[rng.integers(0, len(store.timestamps), len(values[::7]))] # Exact hits
+    for side in ('left', 'right'):
+        found = store.searchsorted(positions, values, side)
+        for position, value, flat in zip(positions, values, found):
+            start, stop = store.offsets[position], store.offsets[position+1]
+            assert flat == start + np.searchsorted(store.timestamps[start:stop], value, side)
+
+def oldSell(backtester, DBdata, unique_name, p):
+    # The per-purchase loop BackTesterV2 used before batching: scan the phase 1 window for the
+    #     recommended sell, then the phase 2 window for the fallback price. Returns (phase, date, price).
+    history = DBdata.loc[DBdata['Item Name'] == unique_name['Name']].iloc[0]['Sales from last month']
+    phase1bounds = [p['Buy Date'], p['Buy Date'] + timedelta(days=backtester.liquidation_force_days)]
+    phase2bounds = [phase1bounds[1], unique_name['Date Pulled']]
+    for date, price in historicalSelector(history, phase1bounds):
+        if price >= p['Recommended Sell']:
+            return 1, date, p['Recommended Sell']
+    if backtester.usefallbackmethod:
+        estimate = p['Fallback Method'](history, phase1bounds, p)
+    else:
+        estimate = p['Fallback Sell']
+    for date, price in historicalSelector(history, phase2bounds):
+        if price >= estimate:
+            return 2, date, estimate
+    return 3, None, None
+
+@pytest.mark.parametrize('fallbackmethod', [True, False])
+def test_phases_match_the_old_loop(fallbackmethod):
+    DBdata = syntheticDBdata(items=1500, now=NOW, seed=5)
+    original = copy.deepcopy(DBdata)
+    backtester = BackTesterV2(LessThanThirdQuartileHistorical, [5, 4], 2, inputs=[1.23, [8,0]],
+                              usefallbackmethod=fallbackmethod)
+    purchases, phases = backtester.runBacktest(DBdata, verbose=False)
+
+    expected = {1: [], 2: [], 3: []}
+    for unique_name in purchases:
+        for p in unique_name['Purchases']:
+            phase, date, price = oldSell(backtester, original, unique_name, p)
+            expected[phase].append(p)
+            if phase < 3:
+                assert p['Sell Date'] == date
+                assert p['Profit'] == pytest.approx(price/1.15 - p['Buy Price'])
+    for phase, sells in zip((1, 2, 3), phases):
+        assert [id(p) for p in sells] == [id(p) for p in expected[phase]]
+    assert all(len(x) > 0 for x in phases) # Every phase is exercised
+    assert DBdata.equals(original)
@@ -0,0 +1,39 @@
+# Peak memory of a full backtest stays within a small multiple of the dataset it runs on.
+#     Deep copies of DBdata (what runBacktest and LTTQH.prepare used to make) duplicate every
+#     nested sales list; two of them alone peak at about 3x the dataset.
+import contextlib
+import io
+import tracemalloc
+
+from analysis import BackTesterV2, LessThanThirdQuartileHistorical
+from schema import objectBytes
+from synthetic import syntheticDBdata
+
+ITEMS = 1000     # ~30 MB of DBdata as Python objects
+PEAK_LIMIT = 1.5 # Peak traced allocations over the dataset's own size
+
+def test_backtest_peak_memory():
+    DBdata = syntheticDBdata(ITEMS, seed=0)
+    dataset = sum(objectBytes(DBdata).values())
+    tester = BackTesterV2(LessThanThirdQuartileHistorical, [5, 4], 2, inputs=[1.23, [8,0]],
+                          usefallbackmethod=True)
+    tracemalloc.start()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            results = tester.runBacktest(DBdata, verbose=False)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert results is not None
+    assert peak < PEAK_LIMIT*dataset, 'Backtest peaked at {0:.1f}x the dataset'.format(peak/dataset)
+
+def test_backtest_leaves_DBdata_alone():
+    DBdata = syntheticDBdata(200, seed=1)
+    before = DBdata['Sales from last month'].apply(len).tolist()
+    identities = [id(x) for x in DBdata['Sales from last month']]
+    tester = BackTesterV2(LessThanThirdQuartileHistorical, [5, 4], 2, inputs=[1.23, [8,0]],
+                          usefallbackmethod=True)
+    with contextlib.redirect_stdout(io.StringIO()):
+        tester.runBacktest(DBdata, verbose=False)
+    assert DBdata['Sales from last month'].apply(len).tolist() == before
+    assert [id(x) for x in DBdata['Sales from last month']] == identities
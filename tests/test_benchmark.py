@@ -0,0 +1,43 @@
+# The benchmark suite runs end to end on the small scale, and compare() flags slowdowns
+import pytest
+
+import benchmark
+from benchmark import BENCHMARKS, SCALES, compare, runBenchmarks, timeBest
+
+def run(results, scale='small'):
+    return {'Commit': None, 'Results': {name: {scale: seconds} for name, seconds in results.items()}}
+
+def test_every_benchmark_runs():
+    current = runBenchmarks({'small': SCALES['small']}, repeat=1, verbose=False)
+    assert set(current['Results']) == set(BENCHMARKS)
+    assert all(results['small'] > 0 for results in current['Results'].values())
+    assert current['Scales'] == {'small': SCALES['small']}
+
+def test_only():
+    current = runBenchmarks({'tiny': 50}, only=['cleanListing', 'cleanVolumetric'], repeat=2, verbose=False)
+    assert set(current['Results']) == {'cleanListing', 'cleanVolumetric'}
+    assert set(current['Results']['cleanListing']) == {'tiny'}
+
+def test_time_best_is_the_fastest_run(capsys):
+    delays = iter([0.03, 0.001, 0.02])
+    def function(data):
+        print('dropped')
+        benchmark.time.sleep(next(delays))
+    best = timeBest(function, None, 3)
+    assert 0.001 <= best < 0.015
+    assert capsys.readouterr().out == ''
+
+def test_compare_flags_regressions():
+    baseline = run({'LTTQH.run': 1.0, 'cleanListing': 0.010, 'standardFilter': 0.5})
+    current = run({'LTTQH.run': 1.2, 'cleanListing': 0.020, 'cleanVolumetric': 0.1})
+    report = compare(baseline, current, tolerance=1.25).set_index('Benchmark')
+
+    assert list(report.index) == ['LTTQH.run', 'cleanListing'] # Only benchmarks in both runs
+    assert report.loc['LTTQH.run', 'Ratio'] == pytest.approx(1.2)
+    assert not report.loc['LTTQH.run', 'Regression']
+    assert report.loc['cleanListing', 'Regression']
+    assert not compare(baseline, current, tolerance=2.5)['Regression'].any()
+
+def test_compare_only_matching_scales():
+    report = compare(run({'LTTQH.run': 1.0}, 'small'), run({'LTTQH.run': 5.0}, 'large'))
+    assert report.empty
@@ -0,0 +1,130 @@
+# BrowserPool against the local fixture server: every page is checked out by exactly one session,
+#     pages a session is banned on are recycled to the others, and sessions are closed after.
+import itertools
+import threading
+
+import pytest
+
+import browse_itempage
+import ratelimit
+from browse_itempage import parseItempage
+from browserpool import BrowserPool
+from fakebrowser import FakeBrowser, FixtureServer
+from pages import ITEM_PAGES, readFixture, rawFromPage
+
+@pytest.fixture(autouse=True)
+def fastLimiter(monkeypatch):
+    # Fresh limiter state, millisecond budgets and backoffs, short refresh waits
+    monkeypatch.setattr(ratelimit.limiter, 'buckets', dict())
+    monkeypatch.setattr(ratelimit.limiter, 'budgets', {'listings': {'interval': 0.001, 'fastest': 0.0005, 'slowest': 0.01}})
+    monkeypatch.setattr(ratelimit.limiter, 'backoff_base', 0.001)
+    monkeypatch.setattr(ratelimit.limiter, 'backoff_cap', 0.002)
+    monkeypatch.setattr(ratelimit.limiter, 'on_throttle', None)
+    monkeypatch.setattr(browse_itempage, 'REFRESH_TIMEOUT', 0.2) # item_no_listings.html never gets results
+
+@pytest.fixture
+def server():
+    with FixtureServer() as server:
+        yield server
+
+def browsers():
+    # make_browser for the pool; browser n sends X-Browser: n
+    counter = itertools.count()
+    return lambda: FakeBrowser(next(counter))
+
+ITEM = {'Item Name': 'AK-47 | Redline (Field-Tested)', 'Special Type': 0, 'Condition': 2}
+
+def test_every_page_checked_out_once(server):
+    pool = BrowserPool(3, make_browser=browsers(), interval=0.001)
+    jobs = [(server.url(page), (n, page)) for n, page in enumerate(ITEM_PAGES*4)]
+    pages = []
+    dropped = pool.scan(jobs, lambda context, raw: pages.append((context, raw)))
+    pool.close()
+
+    assert dropped == []
+    assert sorted(context for context, _ in pages) == sorted(context for _, context in jobs)
+    assert sum(x['Fetched'] for x in pool.stats()) == len(jobs)
+    assert all(session.browser.closed for session in pool.sessions)
+    for (n, page), raw in pages: # Same pieces the DOM read gives for the saved page
+        expected = rawFromPage(readFixture(page))
+        assert raw['Listings'] == expected['Listings']
+        assert parseItempage(raw, ITEM)['Listings'] == parseItempage(expected, ITEM)['Listings']
+
+def test_banned_page_is_recycled_to_another_session(server):
+    # Sessions 0 and 1 are always banned on the page; only session 2 can load it
+    server.banned['item_listings.html'] = {'0', '1'}
+    pool = BrowserPool(3, make_browser=browsers(), interval=0.001, retries=2)
+    pages = []
+    dropped = pool.scan([(server.url('item_listings.html'), 'context')],
+                        lambda context, raw: pages.append(context), attempts=2)
+    pool.close()
+
+    assert dropped == []
+    assert pages == ['context']
+    stats = {x['Session']: x for x in pool.stats()}
+    assert stats[2]['Fetched'] == 1
+    assert stats[0]['Fetched'] == stats[1]['Fetched'] == 0
+    # Each session gave up at most once; none was offered the page again after giving up
+    assert all(stats[n]['Failed'] <= 1 for n in stats)
+    assert sum(1 for name, browser in server.requests if browser == '2') == 1
+
+def test_page_dropped_when_every_session_is_banned(server):
+    server.banned['item_listings.html'] = {'0', '1', '2'}
+    pool = BrowserPool(3, make_browser=browsers(), interval=0.001, retries=2)
+    dropped = pool.scan([(server.url('item_listings.html'), 'banned'), (server.url('item_all_sold.html'), 'sold')],
+                        lambda context, raw: None, attempts=1)
+    pool.close()
+    assert dropped == ['banned']
+    assert sum(x['Failed'] for x in pool.stats()) == 3
+
+def test_retries_limit_sessions_offered(server):
+    server.banned['item_listings.html'] = {'0', '1', '2'}
+    pool = BrowserPool(3, make_browser=browsers(), interval=0.001, retries=1)
+    dropped = pool.scan([(server.url('item_listings.html'), 'banned')], lambda context, raw: None, attempts=1)
+    pool.close()
+    assert dropped == ['banned']
+    assert sum(x['Failed'] for x in pool.stats()) == 2
+
+def test_callback_errors_stop_the_scan(server):
+    pool = BrowserPool(2, make_browser=browsers(), interval=0.001)
+    def on_page(context, raw):
+        raise ValueError('bad page')
+    with pytest.raises(ValueError):
+        pool.scan([(server.url(page), page) for page in ITEM_PAGES], on_page)
+    pool.close()
+
+class BrokenBrowser(FakeBrowser):
+    # Session 0's webdriver fails on every page load with something other than a ban
+    def get(self, url):
+        if self.name == 0 and 'listings' in url:
+            raise RuntimeError('chrome not reachable')
+        super().get(url)
+
+def scanWithin(pool, jobs, seconds=20, **kwargs):
+    # scan() in a thread, so a hang fails the test instead of the run
+    result = dict()
+    thread = threading.Thread(target=lambda: result.update(dropped=pool.scan(jobs, **kwargs)), daemon=True)
+    thread.start()
+    thread.join(seconds)
+    assert not thread.is_alive(), 'scan() hung'
+    return result['dropped']
+
+def test_failing_session_hands_pages_to_the_others(server):
+    counter = itertools.count()
+    pool = BrowserPool(2, make_browser=lambda: BrokenBrowser(next(counter)), interval=0.001)
+    pages = []
+    jobs = [(server.url(page), page) for page in ITEM_PAGES]
+    dropped = scanWithin(pool, jobs, on_page=lambda context, raw: pages.append(context))
+    pool.close()
+    assert dropped == []
+    assert sorted(pages) == sorted(ITEM_PAGES)
+    stats = {x['Session']: x for x in pool.stats()}
+    assert stats[0]['Fetched'] == 0 and stats[1]['Fetched'] == len(ITEM_PAGES)
+
+def test_failing_only_session_drops_its_pages(server):
+    pool = BrowserPool(1, make_browser=lambda: BrokenBrowser(0), interval=0.001)
+    jobs = [(server.url(page), page) for page in ITEM_PAGES]
+    dropped = scanWithin(pool, jobs, on_page=lambda context, raw: None)
+    pool.close()
+    assert sorted(dropped) == sorted(ITEM_PAGES)
+    assert pool.stats()[0]['Failed'] == len(ITEM_PAGES)
@@ -0,0 +1,112 @@
+# Resuming the missing items crawl from a checkpoint cut off mid-write: only the pages the checkpoint
+#     doesn't have are requested, and the missing names are the checkpoint's plus the new pages'.
+import http.server
+import json
+import threading
+import urllib.parse
+
+import pandas as pd
+import pytest
+
+from asyncscan import AsyncSearchScanner, PAGE_SIZE, fetchJSON
+from itemindex import ItemIndex
+from missingitems import crawlMissing, readCheckpoint
+from ratelimit import RateLimiter
+
+TOTALS = {0: 250, 1: 120, 2: 30} # Three, two and one pages
+
+def pageNames(condition, start):
+    return ['Item {0}-{1}'.format(condition, i) for i in range(start, min(start + PAGE_SIZE, TOTALS[condition]))]
+
+def known(name):
+    # Every third item is already in DBdata
+    return int(name.rsplit('-', 1)[1]) % 3 == 0
+
+class SearchServer:
+    # market/search/render JSON for TOTALS; every (condition, start) requested is logged
+    def __init__(self):
+        self.requests = []
+        server = self
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                query = urllib.parse.parse_qs(urllib.parse.urlparse(self.path).query)
+                condition = int(query['category_730_Exterior[]'][0][len('tag_WearCategory'):])
+                start = int(query['start'][0])
+                server.requests.append((condition, start))
+                body = {'success': True, 'start': start, 'total_count': TOTALS[condition],
+                        'results': [{'name': name} for name in pageNames(condition, start)]}
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.end_headers()
+                self.wfile.write(json.dumps(body).encode('utf-8'))
+
+            def log_message(self, *args):
+                pass
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base = 'http://127.0.0.1:{0}'.format(self.httpd.server_address[1])
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def server():
+    with SearchServer() as server:
+        yield server
+
+@pytest.fixture
+def names():
+    every = [name for condition in TOTALS for start in range(0, TOTALS[condition], PAGE_SIZE)
+                  for name in pageNames(condition, start)]
+    return ItemIndex.fromDF(pd.DataFrame({'Item Name': [name for name in every if known(name)]}))
+
+def scanner(base):
+    limiter = RateLimiter({'search': {'interval': 0.001}}, backoff_base=0.001, backoff_cap=0.002)
+    return AsyncSearchScanner(concurrency=2, base=base, fetch=fetchJSON, limiter=limiter)
+
+def missingOn(condition, start):
+    return [name for name in pageNames(condition, start) if not known(name)]
+
+def checkpointLine(condition, start):
+    return json.dumps({'Condition': condition, 'Start': start, 'Total': TOTALS[condition],
+                       'Missing': missingOn(condition, start)}) + '\n'
+
+ALL_PAGES = {(condition, start) for condition in TOTALS for start in range(0, TOTALS[condition], PAGE_SIZE)}
+
+def test_fresh_crawl_requests_every_page(server, names, tmp_path):
+    checkpoint = str(tmp_path/'crawl.jsonl')
+    missing, failed = crawlMissing(names, scanner(server.base), checkpoint, conditions=list(TOTALS), verbose=False)
+
+    assert failed == []
+    assert sorted(server.requests) == sorted(ALL_PAGES)
+    assert sorted(missing) == sorted(name for page in ALL_PAGES for name in missingOn(*page))
+    assert readCheckpoint(checkpoint)[1] == {0: {0, 100, 200}, 1: {0, 100}, 2: {0}}
+
+def test_resume_from_truncated_checkpoint(server, names, tmp_path):
+    checkpoint = tmp_path/'crawl.jsonl'
+    logged = [(0, 0), (0, 100), (2, 0)]
+    torn = checkpointLine(1, 0)[:40] # Crash while writing condition 1's first page
+    checkpoint.write_text(''.join(checkpointLine(*page) for page in logged) + torn)
+
+    totals, done, before = readCheckpoint(str(checkpoint))
+    assert totals == {0: 250, 2: 30}
+    assert done == {0: {0, 100}, 2: {0}}
+
+    missing, failed = crawlMissing(names, scanner(server.base), str(checkpoint), conditions=list(TOTALS), verbose=False)
+
+    assert failed == []
+    assert sorted(server.requests) == sorted(ALL_PAGES - set(logged))
+    assert missing[:len(before)] == before
+    assert sorted(missing) == sorted(name for page in ALL_PAGES for name in missingOn(*page))
+    assert len(missing) == len(set(missing))
+
+    # The torn line was cut off, so another resume sees every page and fetches nothing
+    server.requests.clear()
+    again, failed = crawlMissing(names, scanner(server.base), str(checkpoint), conditions=list(TOTALS), verbose=False)
+    assert failed == [] and server.requests == []
+    assert again == missing
@@ -0,0 +1,88 @@
+# ItemJournal: rows survive a reload, and a failing writer is reported to the caller instead of
+#     leaving flush() waiting forever
+import pickle
+import threading
+import warnings
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import journal as journalmodule
+from journal import CLOSE, FLUSH, ItemJournal, readSegment
+from schema import writeCompact
+from synthetic import syntheticDBdata
+
+@pytest.fixture
+def store(tmp_path):
+    filename = str(tmp_path/'item_info.h5')
+    DBdata = syntheticDBdata(items=20, now=datetime(2026, 10, 18, 7))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+        writeCompact(DBdata, filename)
+    return filename, DBdata
+
+def row(DBdata, label, listings):
+    changed = dict(DBdata.loc[label])
+    changed['Listings'] = listings
+    return changed
+
+def test_rows_are_on_disk_after_flush(store):
+    filename, DBdata = store
+    journal = ItemJournal(filename).start()
+    journal.record(3, row(DBdata, 3, (9.99,)))
+    journal.flush()
+    assert [index for index, _ in readSegment(journal.segments()[-1])] == [3]
+    assert ItemJournal(filename).load().loc[3, 'Listings'] == (9.99,)
+    journal.close()
+
+def test_compaction_failure_is_raised(store, monkeypatch):
+    filename, DBdata = store
+    def full(*args, **kwargs):
+        raise OSError('No space left on device')
+    monkeypatch.setattr(journalmodule, 'writeCompact', full)
+    journal = ItemJournal(filename, compact_every=2).start()
+    journal.record(1, row(DBdata, 1, (1.0,)))
+    journal.record(2, row(DBdata, 2, (2.0,)))
+    with pytest.raises(OSError): # The rows are written and flushed before compaction fails
+        journal.flush()
+        journal.flush()
+    with pytest.raises(OSError):
+        journal.record(3, row(DBdata, 3, (3.0,)))
+    with pytest.raises(OSError):
+        journal.close()
+    # Nothing journaled is lost; the segment is replayed on the next load
+    assert ItemJournal(filename).load().loc[2, 'Listings'] == (2.0,)
+
+def test_write_failure_wakes_waiting_flushes(store):
+    filename, DBdata = store
+    journal = ItemJournal(filename).start()
+    bad = row(DBdata, 1, (1.0,))
+    bad['Listings'] = threading.Lock() # Can't be pickled
+    journal.record(1, bad)
+    with pytest.raises(TypeError):
+        journal.flush()
+    with pytest.raises(TypeError):
+        journal.close()
+
+def test_flush_notices_a_dead_writer(store, monkeypatch):
+    filename, _ = store
+    monkeypatch.setattr(journalmodule, 'RECHECK', 0.01)
+    journal = ItemJournal(filename).start()
+    journal.queue.put((CLOSE, False)) # The writer exits without close() knowing
+    journal.thread.join()
+    with pytest.raises(RuntimeError):
+        journal.flush()
+
+def test_close_in_a_batch_keeps_what_follows(store):
+    # CLOSE, a row and a flush all in the writer's first batch
+    filename, DBdata = store
+    journal = ItemJournal(filename)
+    written = threading.Event()
+    journal.queue.put((CLOSE, False))
+    journal.queue.put((4, row(DBdata, 4, (4.0,))))
+    journal.queue.put((FLUSH, written))
+    journal.start()
+    assert written.wait(5)
+    journal.thread.join()
+    assert ItemJournal(filename).load().loc[4, 'Listings'] == (4.0,)
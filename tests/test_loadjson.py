@@ -0,0 +1,63 @@
+# loadJSON only backs off on throttling; other client failures skip the page
+import pytest
+
+import combinedfuncs
+import ratelimit
+from combinedfuncs import loadJSON
+from httpclient import ClientFailure
+from ratelimit import Throttled
+
+class FakeClient:
+    def __init__(self, *results):
+        # Each call returns the next result, or raises it if it's an exception
+        self.results = list(results)
+        self.calls = 0
+
+    def getJSON(self, url):
+        self.calls += 1
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+@pytest.fixture
+def throttles(monkeypatch):
+    monkeypatch.setattr(ratelimit.limiter, 'buckets', dict())
+    monkeypatch.setattr(ratelimit.limiter, 'budgets', {'search': {'interval': 0.001}})
+    monkeypatch.setattr(ratelimit.limiter, 'backoff_base', 0.001)
+    monkeypatch.setattr(ratelimit.limiter, 'backoff_cap', 0.002)
+    seen = []
+    monkeypatch.setattr(ratelimit.limiter, 'on_throttle', lambda endpoint, delay: seen.append(endpoint))
+    return seen
+
+PAGE = {'success': True, 'results': []}
+
+def test_success(throttles):
+    client = FakeClient(PAGE)
+    assert loadJSON(None, 'url', client) == PAGE
+    assert throttles == []
+
+def test_client_failure_skips_without_backing_off(throttles):
+    client = FakeClient(ClientFailure('connection reset'))
+    rate = ratelimit.limiter.bucket('search').rate
+    assert loadJSON(None, 'url', client) is None
+    assert client.calls == 1
+    assert throttles == []
+    assert ratelimit.limiter.bucket('search').rate == rate
+
+def test_throttle_status_backs_off_and_retries(throttles):
+    client = FakeClient(Throttled('HTTP 429'), {'success': False}, PAGE)
+    assert loadJSON(None, 'url', client) == PAGE
+    assert client.calls == 3
+    assert throttles == ['search', 'search']
+
+def test_gives_up_after_attempts(throttles):
+    client = FakeClient(*[Throttled('HTTP 502')]*3)
+    with pytest.raises(Throttled):
+        loadJSON(None, 'url', client, attempts=3)
+
+def test_client_failure_falls_back_to_browser(throttles, monkeypatch):
+    monkeypatch.setattr(combinedfuncs, 'readBrowserJSON', lambda browser, url: PAGE)
+    client = FakeClient(ClientFailure('login page'))
+    assert loadJSON(object(), 'url', client) == PAGE
+    assert throttles == []
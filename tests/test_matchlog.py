@@ -0,0 +1,87 @@
+# MatchLog round trips: appended matches read back whole, by time range and by day, and the old
+#     rewritten (pickled) 'csgo' frame is served until migrate() folds it into the log
+import os
+import warnings
+from datetime import datetime, timedelta
+
+import pandas as pd
+import pytest
+
+from matchlog import LOG_COLUMNS, MatchLog
+
+DAY = datetime(2026, 10, 17)
+
+def matches(names, dates, lists=False):
+    # Rows shaped like LTTQH.run output; "lists" adds the list columns the old file kept
+    frame = pd.DataFrame({'Item Name': names,
+                          'Condition': [n % 5 for n in range(len(names))],
+                          'Special Type': [0]*len(names),
+                          'Sales/Day': [1.5 + n for n in range(len(names))],
+                          'Buy Rate': [0.8]*len(names),
+                          'Date': dates,
+                          'Lowest Listing': [1.0 + n for n in range(len(names))],
+                          'Q1': [1.1]*len(names), 'Q2': [1.2]*len(names), 'Q3': [1.5]*len(names),
+                          'Ratio': [1.36]*len(names)})
+    if lists:
+        frame['Sales from last month'] = [[[date, 1.25]] for date in dates]
+        frame['Listings'] = [(1.0, 1.1)]*len(names)
+    return frame
+
+@pytest.fixture
+def filename(tmp_path):
+    return str(tmp_path/'LTTQHitems.h5')
+
+def test_reads_before_anything_is_logged(filename):
+    log = MatchLog(filename)
+    assert list(log.read().columns) == LOG_COLUMNS
+    assert len(log.read(DAY).index) == 0
+    assert len(log.readDay(DAY).index) == 0
+    log.migrate()
+    log.append(matches([], []))
+    assert not os.path.exists(filename) # None of these create the file
+
+def test_append_and_read_back(filename):
+    log = MatchLog(filename)
+    first = matches(['AK-47 | Skin 1 (Field-Tested)', 'AWP | Skin 2 (Factory New)'],
+                    [DAY + timedelta(hours=1), DAY + timedelta(hours=23, minutes=59)])
+    second = matches(['M4A4 | Skin 3 (Minimal Wear)'], [DAY + timedelta(days=1)])
+    second.index = [40] # Labels from DBdata aren't kept
+    log.append(first)
+    log.append(second)
+
+    found = log.read()
+    expected = pd.concat([first, second], ignore_index=True)
+    pd.testing.assert_frame_equal(found, expected[LOG_COLUMNS])
+    assert found['Condition'].dtype == 'int64'
+
+    assert log.read(start=DAY + timedelta(hours=2))['Item Name'].tolist() == expected['Item Name'][1:].tolist()
+    assert log.read(end=DAY + timedelta(days=1))['Item Name'].tolist() == expected['Item Name'][:2].tolist()
+    assert log.readDay(DAY + timedelta(hours=15))['Item Name'].tolist() == expected['Item Name'][:2].tolist()
+    assert log.readDay(DAY + timedelta(days=1))['Item Name'].tolist() == expected['Item Name'][2:].tolist()
+    assert len(log.readDay(DAY - timedelta(days=1)).index) == 0
+
+def test_legacy_frame_is_read_then_migrated(filename):
+    # What writeMatch used to leave behind: the whole frame, list columns and all, rewritten under 'csgo'
+    legacy = matches(['Glock-18 | Skin 4 (Well-Worn)', 'P250 | Skin 5 (Battle-Scarred)'],
+                     [DAY - timedelta(days=1), DAY + timedelta(hours=5)], lists=True)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', pd.errors.PerformanceWarning) # Object columns get pickled
+        legacy.to_hdf(filename, key='csgo', mode='w')
+    log = MatchLog(filename)
+    new = matches(['MP9 | Skin 6 (Factory New)'], [DAY + timedelta(hours=6)])
+    log.append(new)
+
+    before = log.read()
+    assert before['Item Name'].tolist() == legacy['Item Name'].tolist() + new['Item Name'].tolist()
+    assert before['Listings'][0] == (1.0, 1.1) # Still the pickled lists
+    assert log.readDay(DAY)['Item Name'].tolist() == ['P250 | Skin 5 (Battle-Scarred)', 'MP9 | Skin 6 (Factory New)']
+
+    log.migrate()
+    with pd.HDFStore(filename, mode='r') as store:
+        assert store.keys() == ['/matchlog']
+    after = log.read()
+    assert list(after.columns) == LOG_COLUMNS
+    assert sorted(after['Item Name']) == sorted(before['Item Name'])
+    assert log.readDay(DAY)['Item Name'].tolist() == ['MP9 | Skin 6 (Factory New)', 'P250 | Skin 5 (Battle-Scarred)']
+    log.migrate() # Nothing left to move
+    assert len(log.read().index) == 3
@@ -0,0 +1,137 @@
+# Histogram buckets and quantiles, the Prometheus text output and the JSONL flushes
+import json
+import time
+
+import pytest
+
+from metrics import BUCKETS, PREFIX, Histogram, Metrics
+
+def test_bucket_placement():
+    histogram = Histogram()
+    for seconds in [0.0001, 0.0005, 0.0006, 1, 1.5, 300, 301]:
+        histogram.observe(seconds)
+    # Upper bounds are inclusive, like Prometheus' le
+    assert histogram.counts[BUCKETS.index(0.0005)] == 2
+    assert histogram.counts[BUCKETS.index(0.001)] == 1
+    assert histogram.counts[BUCKETS.index(1)] == 1
+    assert histogram.counts[BUCKETS.index(2.5)] == 1
+    assert histogram.counts[BUCKETS.index(300)] == 1
+    assert histogram.counts[-1] == 1 # Overflow
+    assert histogram.count == 7 and sum(histogram.counts) == 7
+    assert histogram.total == pytest.approx(sum([0.0001, 0.0005, 0.0006, 1, 1.5, 300, 301]))
+    assert histogram.max == 301
+
+def test_quantiles():
+    histogram = Histogram(bounds=(1, 2, 4))
+    assert histogram.quantile(0.5) is None
+    for seconds in [0.5]*10 + [1.5]*10 + [3]*20:
+        histogram.observe(seconds)
+    # Interpolated inside the bucket holding the q-th observation, capped at the max
+    assert histogram.quantile(0.25) == pytest.approx(1.0)
+    assert histogram.quantile(0.5) == pytest.approx(2.0)
+    assert histogram.quantile(0.75) == pytest.approx(3.0)
+    assert histogram.quantile(0.99) == 3
+    assert histogram.quantile(0.1) == pytest.approx(0.4)
+
+    histogram.observe(10) # Past the top bound: reported as the max
+    assert histogram.quantile(1) == 10
+
+def test_summary():
+    histogram = Histogram()
+    for seconds in [0.002, 0.004, 0.006]:
+        histogram.observe(seconds)
+    summary = histogram.summary()
+    assert summary['Count'] == 3
+    assert summary['Mean'] == pytest.approx(0.004)
+    assert summary['Max'] == 0.006
+    assert summary['p50'] <= summary['p90'] <= summary['p99'] <= summary['Max']
+    assert Histogram().summary()['Mean'] is None
+
+def test_sleep_ratio():
+    metrics = Metrics()
+    assert metrics.sleepRatio() is None
+    metrics.count('sleep_seconds', 3)
+    metrics.fetched('fetch_item', time.perf_counter() - 2, 'item_pages')
+    assert metrics.sleepRatio() == pytest.approx(1.5, abs=0.01)
+    assert metrics.counters['item_pages'] == 1
+    assert metrics.histograms['fetch_item'].count == 1
+
+def parse(text):
+    # {(name, labels): value} from the exposition text, and the declared types
+    samples, types = dict(), dict()
+    for line in text.splitlines():
+        if line.startswith('# TYPE'):
+            _, _, name, kind = line.split()
+            types[name] = kind
+            continue
+        name, value = line.rsplit(' ', 1)
+        labels = ''
+        if '{' in name:
+            name, labels = name[:-1].split('{')
+        samples[(name, labels)] = float(value)
+    return samples, types
+
+def test_prometheus_text():
+    metrics = Metrics()
+    metrics.count('item_pages', 4)
+    metrics.count('sleep_seconds', 6)
+    metrics.count('work_seconds', 2)
+    for seconds in [0.003, 0.003, 0.2, 1000]:
+        metrics.observe('parse', seconds)
+    metrics.observe('fetch_item', 0.8)
+    text = metrics.prometheus()
+    samples, types = parse(text)
+
+    assert text.endswith('\n')
+    assert types[PREFIX + 'item_pages_total'] == 'counter'
+    assert samples[(PREFIX + 'item_pages_total', '')] == 4
+    assert types[PREFIX + 'sleep_ratio'] == 'gauge'
+    assert samples[(PREFIX + 'sleep_ratio', '')] == 3
+    assert types[PREFIX + 'stage_seconds'] == 'histogram'
+
+    bucket = lambda stage, le: samples[(PREFIX + 'stage_seconds_bucket', 'stage="{0}",le="{1}"'.format(stage, le))]
+    # Cumulative, ending at +Inf with the count
+    assert bucket('parse', 0.0025) == 0
+    assert bucket('parse', 0.005) == 2
+    assert bucket('parse', 0.25) == 3
+    assert bucket('parse', 300) == 3
+    assert bucket('parse', '+Inf') == 4
+    counts = [bucket('parse', le) for le in list(BUCKETS) + ['+Inf']]
+    assert counts == sorted(counts)
+    assert samples[(PREFIX + 'stage_seconds_count', 'stage="parse"')] == 4
+    assert samples[(PREFIX + 'stage_seconds_sum', 'stage="parse"')] == pytest.approx(1000.206)
+    assert bucket('fetch_item', 1) == 1 and bucket('fetch_item', 0.5) == 0
+
+def test_no_sleep_ratio_before_work():
+    samples, types = parse(Metrics().prometheus())
+    assert PREFIX + 'sleep_ratio' not in types
+    assert samples == dict()
+
+def test_jsonl_flush(tmp_path):
+    filename = str(tmp_path/'metrics.jsonl')
+    metrics = Metrics().start(filename, every=3600)
+    with metrics.time('parse'):
+        pass
+    metrics.count('search_pages', 3)
+    metrics.flush()
+    metrics.count('search_pages', 2)
+    metrics.close() # One last flush
+
+    lines = [json.loads(line) for line in open(filename)]
+    assert len(lines) == 2
+    assert lines[0]['Counters'] == {'search_pages': 3}
+    assert lines[1]['Counters'] == {'search_pages': 5}
+    assert lines[0]['Stages']['parse']['Count'] == 1
+    assert lines[1]['Per Minute']['search_pages'] > 0
+    assert metrics.thread is None
+
+def test_prometheus_flush_replaces_the_file(tmp_path):
+    filename = str(tmp_path/'arbiter.prom')
+    metrics = Metrics().start(filename, every=3600)
+    assert metrics.format == 'prometheus'
+    metrics.count('item_pages')
+    metrics.flush()
+    metrics.count('item_pages')
+    metrics.close()
+    assert parse(open(filename).read())[0][(PREFIX + 'item_pages_total', '')] == 2
+    assert [x.name for x in tmp_path.iterdir()] == ['arbiter.prom']
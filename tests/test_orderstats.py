@@ -0,0 +1,63 @@
+# QuartileIndex against LessThanThirdQuartileHistorical.prepare as sales stream in for months, so
+#     the window's running mean and spread go through thousands of adds and removes
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis import LessThanThirdQuartileHistorical
+from orderstats import QuartileIndex, WindowQuartiles
+
+START = datetime(2026, 3, 1)
+
+def stream(days, level, noise, seed=0):
+    # Roughly two sales an hour around "level", with the odd dip for the outlier cut to catch
+    rng = np.random.default_rng(seed)
+    hours = np.flatnonzero(rng.random(days*24) < 0.5)
+    prices = level + rng.normal(0, noise, len(hours))
+    prices[rng.random(len(hours)) < 0.02] -= noise*8
+    return [(START + timedelta(hours=int(hour), minutes=int(rng.integers(60))), round(float(price), 6))
+            for hour, price in zip(hours, prices)]
+
+def prepared(strategy, history):
+    DBdata = pd.DataFrame({'Item Name': ['Item'], 'Special Type': [0], 'Buy Rate': [2.0],
+                           'Listings': [(1.0,)], 'Sales from last month': [history]})
+    found = strategy.prepare(DBdata)
+    if not len(found.index):
+        return None
+    return tuple(found.loc[0, ['Q1', 'Q2', 'Q3']])
+
+# A cheap item, and pricey ones whose prices barely move: the case where sum of squares minus
+#     total*mean loses the spread to cancellation
+@pytest.mark.parametrize('level, noise', [(0.35, 0.02), (1800.0, 0.05), (250000.0, 0.01)])
+def test_long_stream_matches_prepare(level, noise):
+    history = stream(120, level, noise)
+    strategy = LessThanThirdQuartileHistorical(0.8, [8,0])
+    qindex = QuartileIndex([8,0])
+    compared = 0
+    seen = 0
+    for day in range(1, 121):
+        for hour in (3, 15):
+            now = START + timedelta(days=day, hours=hour)
+            while seen < len(history) and history[seen][0] <= now:
+                seen += 1
+            # Like a scanner's, each update has the whole scraped history; today's sales can change
+            qindex.update(0, history[:seen])
+            if day > 30 and hour == 15: # prepare's volume cut needs 60 sales in the whole history
+                assert qindex.quartiles(0) == prepared(strategy, history[:seen])
+                compared += 1
+    assert compared == 90
+
+def test_spread_survives_a_long_stream():
+    # A steady 250k item after 20000 sales in and out of a 50 sale window
+    rng = np.random.default_rng(3)
+    prices = 250000 + rng.normal(0, 0.01, 20000)
+    window = WindowQuartiles()
+    for n, price in enumerate(prices):
+        window._add(n, float(price))
+        if len(window) > 50:
+            window._drop()
+    tail = prices[-50:]
+    assert window.mean == pytest.approx(tail.mean(), abs=1e-9)
+    assert window.spread == pytest.approx(((tail - tail.mean())**2).sum(), rel=1e-6)
@@ -0,0 +1,96 @@
+# cleanListing against the BeautifulSoup reference, and parseVolumetric against the eval-based
+#     cleanVolumetric it replaced, over the saved item pages. Run directly for the timings:
+#     PYTHONPATH=src python tests/test_parsing.py
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from browse_itempage import cleanListing, cleanListingSoup, parseVolumetric, cleanVolumetric
+from pages import ITEM_PAGES, readFixture, rawFromPage
+
+NOW = datetime(2026, 10, 18, 7) # The fixtures' charts end an hour before this
+
+def evalVolumetric(data, now):
+    # cleanVolumetric before the JSON parser (eval, per-point datetimes), with "now" pinned
+    data = data[data.find('var line1')+10:data.find(']];')+2]
+    if data == '':
+        return []
+    better_data = eval(data)
+    better_data = [[x[0][:3],x[0][4:6],x[0][7:11],x[0][12:14],x[1]] for x in better_data]
+    month_lookup = {'Jan': 1, 'Feb': 2, 'Mar': 3,
+                    'Apr': 4, 'May': 5, 'Jun': 6,
+                    'Jul': 7, 'Aug': 8, 'Sep': 9,
+                    'Oct': 10, 'Nov': 11, 'Dec': 12}
+    better_data = [[datetime(year=int(x[2]),month=month_lookup[x[0]],day=int(x[1]), hour=int(x[3])),x[4]] for x in better_data]
+    last_month = now - timedelta(days=30)
+    return [x for x in better_data if last_month < x[0] < now]
+
+@pytest.mark.parametrize('page', ITEM_PAGES)
+def test_cleanListing_matches_soup(page):
+    raw = rawFromPage(readFixture(page))
+    if raw['Listings'] is None:
+        pytest.skip('No #searchResultsRows on this page')
+    assert cleanListing(raw['Listings']) == cleanListingSoup(raw['Listings'])
+
+def test_listing_pages():
+    raw = rawFromPage(readFixture('item_listings.html'))
+    prices, ids = cleanListing(raw['Listings'])
+    assert list(prices) == sorted(prices)
+    assert len(prices) == 9 # One of the ten rows is 'Sold!'
+    assert prices[0] == 3.87
+
+def test_all_sold_page():
+    raw = rawFromPage(readFixture('item_all_sold.html'))
+    assert cleanListing(raw['Listings']) == ((), ())
+    assert cleanListingSoup(raw['Listings']) == ((), ())
+
+def test_no_listings_page():
+    raw = rawFromPage(readFixture('item_no_listings.html'))
+    assert raw['Listings'] is None
+    assert cleanListing('') == cleanListingSoup('') == ((), ())
+    assert cleanVolumetric(raw['Chart'], NOW) == evalVolumetric(raw['Chart'], NOW) == []
+
+@pytest.mark.parametrize('page', ITEM_PAGES)
+def test_parseVolumetric_matches_eval(page):
+    chart = rawFromPage(readFixture(page))['Chart']
+    expected = evalVolumetric(chart, NOW)
+    timestamps, prices, volumes = parseVolumetric(chart, NOW)
+    assert timestamps.astype('datetime64[s]').astype(object).tolist() == [date for date, _ in expected]
+    assert prices.tolist() == [float(price) for _, price in expected]
+    assert len(volumes) == len(expected)
+    assert cleanVolumetric(chart, NOW) == [[date, float(price)] for date, price in expected]
+
+def test_chart_is_cut_to_30_days():
+    # item_listings.html's chart covers 35 days
+    chart = rawFromPage(readFixture('item_listings.html'))['Chart']
+    timestamps, _, _ = parseVolumetric(chart, NOW)
+    assert len(timestamps) > 0
+    assert timestamps.min() > NOW - timedelta(days=30)
+
+def timeBest(function, argument, repeat=20):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(argument)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def parserTimings(repeat=20):
+    # Best-of-"repeat" seconds per call on the largest saved page, old parser vs new
+    raw = rawFromPage(readFixture('item_listings.html'))
+    return {'cleanListingSoup': timeBest(cleanListingSoup, raw['Listings'], repeat),
+            'cleanListing': timeBest(cleanListing, raw['Listings'], repeat),
+            'evalVolumetric': timeBest(lambda chart: evalVolumetric(chart, NOW), raw['Chart'], repeat),
+            'parseVolumetric': timeBest(lambda chart: parseVolumetric(chart, NOW), raw['Chart'], repeat)}
+
+def test_new_parsers_are_faster():
+    timings = parserTimings()
+    assert timings['cleanListing'] < timings['cleanListingSoup']
+    assert timings['parseVolumetric'] < timings['evalVolumetric']
+
+if __name__ == '__main__':
+    timings = parserTimings(repeat=200)
+    for old, new in [('cleanListingSoup', 'cleanListing'), ('evalVolumetric', 'parseVolumetric')]:
+        print('{0:<17} {1:>9.1f}us   {2:<17} {3:>9.1f}us   {4:.1f}x'.format(
+              old, timings[old]*1e6, new, timings[new]*1e6, timings[old]/timings[new]))
@@ -0,0 +1,116 @@
+# Pipeline with scripted sources: every job goes through the stages in order, close() drains what
+#     was fetched and stops the threads, and a failing stage is raised in the fetch thread
+import threading
+import time
+
+import pytest
+
+from pipeline import Pipeline
+
+class ScriptedSource:
+    # Emits "count" jobs per fetch; "fail" maps a stage name to the job number that raises there
+    def __init__(self, name, log, count=3, fail=None, delay=0):
+        self.name = name
+        self.log = log
+        self.count = count
+        self.fail = fail or dict()
+        self.delay = delay
+        self.fetches = 0
+
+    def fetch(self, browser, DBdata, emit):
+        for n in range(self.count):
+            number = self.fetches*self.count + n
+            self.log.append(('fetch', self.name, number, threading.current_thread().name))
+            emit({'Source': self, 'Number': number})
+        self.fetches += 1
+        return browser + [self.name]
+
+    def _step(self, stage, job):
+        self.log.append((stage, self.name, job['Number'], threading.current_thread().name))
+        if self.fail.get(stage) == job['Number']:
+            raise ValueError('{0} failed on {1}'.format(stage, job['Number']))
+        if self.delay:
+            time.sleep(self.delay)
+
+    def parse(self, job):
+        self._step('parse', job)
+        job['Parsed'] = True
+        return job
+
+    def evaluate(self, job, DBdata):
+        self._step('evaluate', job)
+        assert self.lock.locked() # DBdata is written under the pipeline's lock
+        DBdata.append((self.name, job['Number']))
+        return job
+
+    def persist(self, job):
+        self._step('persist', job)
+        assert job['Parsed'] and 'Fetched' in job
+
+class Recorder:
+    def __init__(self):
+        self.jobs = []
+        self.closed = False
+
+    def record(self, job):
+        self.jobs.append(job['Number'])
+
+    def close(self):
+        self.closed = True
+
+def steps(log, stage):
+    return [(name, number) for step, name, number, _ in log if step == stage]
+
+def test_stages_run_in_order():
+    log, DBdata = [], []
+    sources = [ScriptedSource('a', log), ScriptedSource('b', log, count=2)]
+    pipeline = Pipeline(sources, [], DBdata, maxsize=2, verbose=False)
+    browser = pipeline.run(rounds=2)
+
+    fetched = [('a', 0), ('a', 1), ('a', 2), ('b', 0), ('b', 1), ('a', 3), ('a', 4), ('a', 5), ('b', 2), ('b', 3)]
+    assert browser == ['a', 'b', 'a', 'b'] # Each fetch's browser is handed to the next
+    for stage in ['fetch', 'parse', 'evaluate', 'persist']:
+        assert steps(log, stage) == fetched # One thread per stage keeps the fetch order
+    assert DBdata == fetched
+    # Every job is parsed before it's evaluated and evaluated before it's persisted
+    for job in fetched:
+        order = [step for step, name, number, _ in log if (name, number) == job]
+        assert order == ['fetch', 'parse', 'evaluate', 'persist']
+    threads = {step: {thread for s, _, _, thread in log if s == step} for step in ['fetch', 'parse', 'evaluate', 'persist']}
+    assert threads['fetch'] == {threading.current_thread().name}
+    assert [threads[stage] for stage in ['parse', 'evaluate', 'persist']] == [{'parse'}, {'evaluate'}, {'persist'}]
+    assert {name: x['Done'] for name, x in pipeline.stats().items()} == \
+           {'fetch': 10, 'parse': 10, 'evaluate': 10, 'persist': 10}
+
+def test_close_drains_and_stops():
+    log, recorder = [], Recorder()
+    source = ScriptedSource('slow', log, count=6, delay=0.02)
+    pipeline = Pipeline([source], [], [], maxsize=1, verbose=False, recorder=recorder)
+    pipeline.run(rounds=1)
+    # Fetching finished long before persisting did; close() still waited for every job
+    assert [number for _, number in steps(log, 'persist')] == list(range(6))
+    assert recorder.jobs == list(range(6)) and recorder.closed
+    assert not any(stage.thread.is_alive() for stage in pipeline.stages)
+    assert pipeline.blocked > 0 # Backpressure from the bounded queues
+
+@pytest.mark.parametrize('stage', ['parse', 'evaluate', 'persist'])
+def test_stage_errors_reach_the_fetch_thread(stage):
+    log = []
+    source = ScriptedSource('a', log, count=4, fail={stage: 1})
+    pipeline = Pipeline([source], [], [], maxsize=2, verbose=False)
+    with pytest.raises(ValueError, match='{0} failed on 1'.format(stage)):
+        pipeline.run() # Would run forever without the error
+    assert not any(x.thread.is_alive() for x in pipeline.stages)
+    # The failing job goes no further; the ones before it still make it through
+    persisted = [number for _, number in steps(log, 'persist')]
+    assert persisted[0] == 0
+    if stage != 'persist':
+        assert 1 not in persisted
+
+def test_error_on_the_last_job_is_raised_by_close():
+    log = []
+    source = ScriptedSource('a', log, count=3, fail={'persist': 2})
+    pipeline = Pipeline([source], [], [], verbose=False)
+    with pytest.raises(ValueError, match='persist failed on 2'):
+        pipeline.run(rounds=1)
+    assert [number for _, number in steps(log, 'persist')] == [0, 1, 2]
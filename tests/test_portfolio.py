@@ -0,0 +1,77 @@
+# portfolioTimeline's difference arrays against the per-hour loop profitAnalysisV2 used to run
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from analysis import BackTesterV2, LessThanThirdQuartileHistorical, hourSpread, portfolioTimeline, profitStats
+from synthetic import syntheticDBdata
+
+START = datetime(2026, 10, 10)
+
+def oldTimeline(all_buys, hour_spread):
+    # Every buy against every hour: held from its buy date through its sell date, inclusive
+    portfolio_size = [0]*len(hour_spread)
+    num_held = [0]*len(hour_spread)
+    for p in all_buys:
+        for index, hour in enumerate(hour_spread):
+            if isHeld(p, hour):
+                portfolio_size[index] += p['Buy Price']
+                num_held[index] += 1
+    return portfolio_size, num_held
+
+def isHeld(p, hour):
+    if 'Sell Date' in p:
+        return p['Buy Date'] <= hour <= p['Sell Date']
+    return p['Buy Date'] <= hour
+
+def buy(price, bought, sold=None, end=START + timedelta(days=8)):
+    p = {'Buy Price': price, 'Buy Date': bought, 'Regions': ([bought, bought + timedelta(days=2)],
+                                                             [bought + timedelta(days=2), end])}
+    if sold is not None:
+        p['Sell Date'] = sold
+    return p
+
+def hand():
+    hour = timedelta(hours=1)
+    return [buy(1.25, START, START + 5*hour),                          # Both ends on the hour
+            buy(3.10, START + 90*timedelta(minutes=1), START + 2*hour), # Bought between hours
+            buy(0.40, START + 3*hour, START + 3*hour),                  # Sold the hour it was bought
+            buy(7.77, START + 20*hour + timedelta(seconds=1)),          # Never sold
+            buy(2.00, START + 40*hour, START + 41*hour - timedelta(seconds=1)),
+            buy(5.55, START + 6*timedelta(days=1), START + 8*timedelta(days=1)), # Sold at the last hour
+            buy(0.99, START + 3*hour, START + 30*hour)]
+
+def assertSameTimeline(all_buys):
+    spread = hourSpread(all_buys)
+    timeline = portfolioTimeline(all_buys, spread)
+    portfolio, held = oldTimeline(all_buys, spread)
+    assert timeline.index.equals(spread)
+    assert np.allclose(timeline['Portfolio'], portfolio, rtol=0, atol=1e-9)
+    assert timeline['Held'].tolist() == held
+    return timeline, portfolio, held
+
+def test_hand_picked_buys():
+    timeline, portfolio, held = assertSameTimeline(hand())
+    assert max(held) == 3 and held[-1] == 2
+    stats = profitStats([dict(p, Profit=0) for p in hand() if 'Sell Date' in p], [],
+                        [p for p in hand() if 'Sell Date' not in p])
+    assert stats['Max Portfolio'] == round(max(portfolio), 2)
+    assert stats['Max Held'] == max(held)
+
+def test_random_buys():
+    rng = np.random.default_rng(4)
+    all_buys = []
+    for _ in range(60):
+        bought = START + timedelta(minutes=int(rng.integers(0, 5*24*60)))
+        sold = bought + timedelta(minutes=int(rng.integers(0, 3*24*60))) if rng.random() < 0.8 else None
+        all_buys.append(buy(round(float(rng.uniform(0.05, 40)), 2), bought, sold))
+    assertSameTimeline(all_buys)
+
+def test_backtest_buys():
+    DBdata = syntheticDBdata(items=600, now=datetime(2026, 10, 18, 7), seed=5)
+    tester = BackTesterV2(LessThanThirdQuartileHistorical, [5, 4], 2, inputs=[1.23, [8,0]], usefallbackmethod=True)
+    _, phases = tester.runBacktest(DBdata, verbose=False)
+    all_buys = phases[0] + phases[1] + phases[2]
+    assert len(all_buys) > 10
+    assertSameTimeline(all_buys)
@@ -0,0 +1,104 @@
+# The batched SalesStore filters behind LessThanThirdQuartileHistorical.prepare against the per-item
+#     list versions they replaced, on random stores and on synthetic sales
+import copy
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis import (LessThanThirdQuartileHistorical, historicalSelectorDF, quartileHistorical, quartiles,
+                      quartilesStore, removeHistoricalOutliers, removeHistoricalOutliersStore, standardFilter,
+                      volumeFilter)
+from salesstore import SalesStore
+from synthetic import syntheticDBdata
+
+NOW = datetime(2026, 10, 18, 7)
+
+def randomStore(lengths, seed=0, levels=None):
+    # "levels" rounds prices onto a few values so ties and repeated medians happen
+    rng = np.random.default_rng(seed)
+    offsets = np.zeros(len(lengths)+1, dtype=np.int64)
+    np.cumsum(lengths, out=offsets[1:])
+    timestamps = np.concatenate([np.sort(rng.choice(10**6, size=n, replace=False)) for n in lengths])
+    prices = rng.lognormal(1, 0.5, offsets[-1])
+    if levels:
+        prices = np.round(prices*levels)/levels
+    return SalesStore(np.arange(len(lengths))*3, offsets, timestamps.astype(np.int64) + 10**9, prices)
+
+@pytest.mark.parametrize('levels', [None, 2])
+def test_quartiles_store_matches_quartiles(levels):
+    lengths = list(range(3, 40)) + [3, 4, 3, 5, 4]
+    store = randomStore(lengths, seed=3, levels=levels)
+    found = quartilesStore(store)
+    assert found.index.tolist() == store.index.tolist()
+    for label, history in zip(store.index, store.toLists()):
+        expected = quartileHistorical(history)
+        assert tuple(found.loc[label, ['Q1', 'Q2', 'Q3']]) == pytest.approx(expected, abs=0, rel=1e-12)
+
+def test_quartiles_store_needs_three_sales():
+    store = randomStore([5, 2, 4])
+    with pytest.raises(AssertionError):
+        quartiles([1.0, 2.0])
+    with pytest.raises(AssertionError):
+        quartilesStore(store)
+
+@pytest.mark.parametrize('sigma', [1, 1.5])
+def test_outliers_store_matches_list_version(sigma):
+    lengths = list(range(2, 40)) + [2, 3, 3]
+    store = randomStore(lengths, seed=5)
+    found = removeHistoricalOutliersStore(store, sigma=sigma)
+    assert found.index.tolist() == store.index.tolist()
+    for kept, history in zip(found.toLists(), store.toLists()):
+        assert kept == removeHistoricalOutliers(history, sigma=sigma)
+
+def test_outliers_store_keeps_flat_histories():
+    # removeHistoricalOutliers divides by a zero stdev here; the batched version keeps every point
+    offsets = np.array([0, 4, 7])
+    store = SalesStore(np.array([0, 1]), offsets, np.arange(7, dtype=np.int64) + 10**9,
+                       np.array([2.5, 2.5, 2.5, 2.5, 1.0, 2.0, 30.0]))
+    found = removeHistoricalOutliersStore(store)
+    assert found.lengths().tolist() == [4, 2]
+    assert [price for _, price in found.toLists()[0]] == [2.5]*4
+
+def oldPrepare(df, dateregion):
+    # LessThanThirdQuartileHistorical.prepare before it moved onto a SalesStore
+    df = copy.deepcopy(df)
+    satdf = standardFilter(df)
+    satdf = volumeFilter(satdf, 60)
+    satdf = historicalSelectorDF(satdf, dateregion)
+    satdf = volumeFilter(satdf, 3)
+    satdf['Sales from last month'] = satdf['Sales from last month'].apply(removeHistoricalOutliers, sigma=1.5)
+    satdf = volumeFilter(satdf, 5)
+    details = satdf['Sales from last month'].apply(quartileHistorical)
+    details = pd.DataFrame(details.tolist(), index=details.index, columns=['Q1','Q2','Q3'])
+    return satdf.join(details)
+
+@pytest.fixture(scope='module')
+def DBdata():
+    # 45 days of sales, so the 30 day region cuts some off
+    return syntheticDBdata(items=400, days=45, now=NOW, seed=11)
+
+@pytest.mark.parametrize('dateregion', [[30,0], [2,1], [1,0]])
+def test_prepare_matches_the_list_version(DBdata, dateregion):
+    original = copy.deepcopy(DBdata)
+    strategy = LessThanThirdQuartileHistorical(0.8, dateregion)
+    found = strategy.prepare(DBdata)
+    expected = oldPrepare(DBdata, dateregion)
+    assert DBdata.equals(original)
+
+    assert found.index.tolist() == expected.index.tolist()
+    assert len(found) > 50
+    for column in ['Q1', 'Q2', 'Q3']:
+        assert np.allclose(found[column], expected[column], rtol=1e-12, atol=0)
+    for label in found.index:
+        assert found.loc[label, 'Sales from last month'] == expected.loc[label, 'Sales from last month']
+
+    # Items the cut leaves with too few sales drop out of both
+    windowed = historicalSelectorDF(volumeFilter(standardFilter(DBdata), 60), dateregion)
+    few = windowed.index[windowed['Sales from last month'].apply(len) < 5]
+    assert len(few) > 0 or dateregion == [30,0]
+    assert not set(few) & set(found.index)
+    if dateregion == [30,0]:
+        longest = max(len(history) for history in DBdata['Sales from last month'])
+        assert max(found['Sales from last month'].apply(len)) < longest
@@ -0,0 +1,123 @@
+# TokenBucket and RateLimiter on a fake clock: token accrual, additive increase / multiplicative
+#     decrease inside the fastest/slowest clamps, and the jittered, capped exponential backoff
+import pytest
+
+import ratelimit
+from ratelimit import RateLimiter, TokenBucket
+
+class FakeClock:
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.slept = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(ratelimit, 'time', clock)
+    return clock
+
+@pytest.fixture
+def jitter(monkeypatch):
+    # uniform(a, b) returns the point "fraction" of the way from a to b; tests pick the fraction
+    jitter = {'fraction': 1.0}
+    monkeypatch.setattr(ratelimit.random, 'uniform', lambda a, b: a + (b - a)*jitter['fraction'])
+    return jitter
+
+def test_tokens_accrue_at_the_rate(clock):
+    bucket = TokenBucket(interval=2, burst=2)
+    assert bucket.reserve(clock.now) == 0
+    assert bucket.reserve(clock.now) == 0 # The burst
+    assert bucket.reserve(clock.now) == pytest.approx(2) # One interval for the next token
+    assert bucket.reserve(clock.now) == pytest.approx(4) # Reservations queue up
+    clock.now += 10
+    assert bucket.tokens == -2
+    assert bucket.reserve(clock.now) == 0 # Caught up, and capped at the burst
+    assert bucket.tokens == pytest.approx(1)
+
+def test_additive_increase_up_to_fastest(clock):
+    bucket = TokenBucket(interval=10, fastest=4, slowest=60)
+    step = (1/4 - 1/60)/50
+    assert bucket.increase == pytest.approx(step)
+    bucket.success()
+    assert bucket.rate == pytest.approx(1/10 + step)
+    for _ in range(200):
+        bucket.success()
+    assert bucket.rate == pytest.approx(1/4) # Clamped at "fastest"
+
+def test_multiplicative_decrease_down_to_slowest(clock, jitter):
+    bucket = TokenBucket(interval=10, fastest=4, slowest=60)
+    bucket.throttled(clock.now, 1, 2)
+    assert bucket.rate == pytest.approx(1/20)
+    bucket.throttled(clock.now, 1, 2)
+    assert bucket.rate == pytest.approx(1/40)
+    bucket.throttled(clock.now, 1, 2)
+    assert bucket.rate == pytest.approx(1/60) # Clamped at "slowest", not 1/80
+
+def test_default_clamps(clock):
+    bucket = TokenBucket(interval=3)
+    assert bucket.max_rate == pytest.approx(1/1.5)
+    assert bucket.min_rate == pytest.approx(1/24)
+
+def test_throttle_drops_saved_tokens(clock, jitter):
+    bucket = TokenBucket(interval=1, burst=5)
+    bucket.throttled(clock.now, 1, 1)
+    assert bucket.tokens == 0
+
+@pytest.mark.parametrize('fraction', [0.0, 0.5, 1.0])
+def test_backoff_doubles_up_to_the_cap(clock, jitter, fraction):
+    jitter['fraction'] = fraction
+    bucket = TokenBucket(interval=10)
+    delays = [bucket.throttled(clock.now, 30, 600) for _ in range(7)]
+    full = [30, 60, 120, 240, 480, 600, 600]
+    # Equal jitter: between half and all of the full delay
+    assert delays == pytest.approx([x/2 + x/2*fraction for x in full])
+    assert bucket.streak == 7
+    assert bucket.blocked_until == pytest.approx(clock.now + max(delays))
+    bucket.success()
+    assert bucket.streak == 0
+    assert bucket.throttled(clock.now, 30, 600) == pytest.approx(15 + 15*fraction)
+
+def test_blocked_endpoint_waits_out_the_backoff(clock, jitter):
+    bucket = TokenBucket(interval=1, burst=3)
+    delay = bucket.throttled(clock.now, 8, 600)
+    assert delay == 8
+    clock.now += 3
+    assert bucket.reserve(clock.now) == pytest.approx(5) # The backoff, not the token wait
+    clock.now += 5
+    assert bucket.reserve(clock.now) == 0 # Tokens kept accruing, at the halved rate
+    assert bucket.tokens == pytest.approx(2)
+
+def test_limiter_buckets(clock):
+    limiter = RateLimiter({'listings': {'interval': 2.5, 'fastest': 1.5, 'slowest': 30}})
+    assert limiter.interval('listings') == pytest.approx(2.5)
+    # Sub-budgets start from their parent's; "interval" only seeds new buckets
+    assert limiter.bucket('listings/1', interval=5).max_rate == pytest.approx(1/1.5)
+    assert limiter.interval('listings/1') == pytest.approx(5)
+    assert limiter.bucket('listings/1', interval=9) is limiter.bucket('listings/1')
+    assert limiter.interval('listings/1') == pytest.approx(5)
+    assert limiter.interval('unknown') == pytest.approx(10)
+
+def test_limiter_acquire_and_throttle(clock, jitter):
+    limiter = RateLimiter({'search': {'interval': 10}}, backoff_base=30, backoff_cap=600)
+    throttles = []
+    limiter.on_throttle = lambda endpoint, delay: throttles.append((endpoint, delay))
+    assert limiter.acquire('search') == 0
+    assert limiter.acquire('search') == pytest.approx(10)
+    assert clock.slept == [pytest.approx(10)]
+
+    assert limiter.throttled('search') == 30
+    assert limiter.throttled('search') == 60
+    assert throttles == [('search', 30), ('search', 60)]
+    assert limiter.interval('search') == pytest.approx(40)
+    # Everyone sits out the 60s backoff, or the token wait at the cut rate if that's longer: the
+    #     bucket is a token short since the last acquire and refills at 1/40s
+    assert limiter.acquire('search') == pytest.approx(1.75*40)
+    limiter.success('search')
+    assert limiter.bucket('search').streak == 0
@@ -0,0 +1,143 @@
+# ReplayEngine on a recording made from synthetic data. The recording starts five days before
+#     DBdata's newest sale, so an index built from all of DBdata would see the future.
+import copy
+from datetime import datetime, timedelta
+
+import pytest
+
+import orderstats
+from orderstats import QuartileIndex
+from replay import Recorder, ReplayEngine, readRecordings
+from salesstore import SalesStore, toSeconds
+from synthetic import syntheticDBdata, listingHTML, chartHTML
+
+NOW = datetime(2026, 10, 18, 7)
+START = NOW - timedelta(days=5)
+VOLATILE = ['Wall Seconds', 'Speedup']
+
+def epoch(date):
+    # Recorded times are epoch seconds; the engine reads them back with datetime.fromtimestamp
+    return date.timestamp()
+
+def before(DBdata, moment):
+    # DBdata as the scanner had it at "moment": no later sales
+    DBdata = DBdata.copy()
+    DBdata['Sales from last month'] = [[sale for sale in history if sale[0] <= moment]
+                                       for history in DBdata['Sales from last month']]
+    return DBdata
+
+@pytest.fixture(scope='module')
+def DBdata():
+    return syntheticDBdata(items=300, now=NOW, seed=4)
+
+def cheap(DBdata, count=8):
+    # Liquid items and a price well under their Q3 as of START
+    qindex = QuartileIndex.fromStore(SalesStore.fromDF(DBdata), [8,0], clock=toSeconds(START))
+    found = []
+    for label in DBdata['Sales/Day'].sort_values(ascending=False).index:
+        Q = qindex.quartiles(label)
+        if Q is not None:
+            found.append((DBdata.loc[label, 'Item Name'], round(Q[2]*0.6, 2), label))
+        if len(found) == count:
+            break
+    return found
+
+def searchJob(when, items):
+    results = [{'name': name, 'sell_price': int(round(price*100))} for name, price in items]
+    return {'Fetched': epoch(when), 'Condition': 0, 'Response': {'success': True, 'results': results}}
+
+def itemJob(DBdata, label, when, listings):
+    history = [sale for sale in DBdata.loc[label, 'Sales from last month'] if sale[0] <= when]
+    item = {key: DBdata.loc[label, key] for key in ['Item Name', 'Special Type', 'Condition']}
+    raw = {'Listings': listingHTML(listings, sold=0), 'Buy Rate': None, 'Chart': chartHTML(history)}
+    return {'Fetched': epoch(when), 'Item': item, 'Raw': raw}
+
+@pytest.fixture(scope='module')
+def recording(DBdata, tmp_path_factory):
+    # Cheap listings show up in search pages, stay for a while, and are gone from a later item page
+    filename = str(tmp_path_factory.mktemp('recordings')/'run.jsonl.gz')
+    recorder = Recorder(filename)
+    found = cheap(DBdata)
+    names = [(name, price) for name, price, _ in found]
+    recorder.record(searchJob(START, [(name, price*3) for name, price in names]))
+    for minutes in range(1, 30):
+        recorder.record(searchJob(START + timedelta(minutes=minutes), names))
+    for n, (name, price, label) in enumerate(found):
+        recorder.record(itemJob(DBdata, label, START + timedelta(minutes=30 + n), [price*2, price*3]))
+    recorder.record(searchJob(START + timedelta(days=2), [(name, price*2) for name, price in names]))
+    recorder.close()
+    return filename
+
+def replay(DBdata, recording):
+    engine = ReplayEngine(copy.deepcopy(DBdata))
+    report = engine.run(readRecordings([recording]))
+    return engine, {key: value for key, value in report.items() if key not in VOLATILE}
+
+def test_replay_is_deterministic(DBdata, recording):
+    first, report = replay(DBdata, recording)
+    second, again = replay(DBdata, recording)
+    assert report['Opportunities'] > 0 and report['Item pages'] == 8
+    assert report == again
+    assert first.opportunities().equals(second.opportunities())
+
+def test_quartiles_have_no_lookahead(DBdata, recording):
+    # The engine's quartiles at the first event are the ones built from the history up to then
+    engine = ReplayEngine(copy.deepcopy(DBdata))
+    engine.begin(epoch(START))
+    expected = QuartileIndex.fromStore(SalesStore.fromDF(before(DBdata, START)), [8,0])
+    assert engine.qindex.window() == expected.window()
+    for label in DBdata.index:
+        assert engine.qindex.quartiles(label) == expected.quartiles(label)
+
+    # ...and not the ones at DBdata's newest sale
+    latest = QuartileIndex.fromStore(SalesStore.fromDF(DBdata), [8,0])
+    assert any(latest.quartiles(label) != expected.quartiles(label) for label in DBdata.index)
+
+    # Same matches as replaying on the history the scanner actually had
+    _, report = replay(DBdata, recording)
+    _, truncated = replay(before(DBdata, START), recording)
+    assert report == truncated
+
+class LatestIndexEngine(ReplayEngine):
+    # Quartiles as of DBdata's newest sale, the way the shared scanner index is built
+    def begin(self, when):
+        self.qindex = QuartileIndex.fromStore(SalesStore.fromDF(self.DBdata), [8,0])
+
+def test_no_matches_from_later_sales(DBdata, tmp_path):
+    # Prices LTTQH only flags against Q3 at DBdata's newest sale, not against Q3 at START
+    store = SalesStore.fromDF(DBdata)
+    then = QuartileIndex.fromStore(store, [8,0], clock=toSeconds(START))
+    latest = QuartileIndex.fromStore(store, [8,0])
+    items = []
+    for label in DBdata.index:
+        Q, L = then.quartiles(label), latest.quartiles(label)
+        if Q is not None and L is not None and L[2] > Q[2]*1.05:
+            items.append((DBdata.loc[label, 'Item Name'], round(Q[2]/1.16*1.02, 2)))
+    assert items
+
+    filename = str(tmp_path/'run.jsonl.gz')
+    recorder = Recorder(filename)
+    recorder.record(searchJob(START, items))
+    recorder.close()
+    assert ReplayEngine(copy.deepcopy(DBdata)).run(readRecordings([filename]))['Matches'] == 0
+    assert LatestIndexEngine(copy.deepcopy(DBdata)).run(readRecordings([filename]))['Matches'] > 0
+
+def test_clock_follows_the_recording(DBdata, recording):
+    engine, _ = replay(DBdata, recording)
+    assert engine.qindex.clock == toSeconds(START + timedelta(days=2))
+    assert engine.qindex.window()[1] == toSeconds(datetime(2026, 10, 15))
+
+def test_engines_are_independent(DBdata, recording):
+    # An engine on another DBdata in the same process doesn't change this one's replay, and
+    #     neither touches the scanner's shared indexes
+    shared = dict(orderstats._indexes)
+    _, alone = replay(DBdata, recording)
+    other = syntheticDBdata(items=50, now=NOW, seed=9)
+    other_engine, other_report = replay(other, recording)
+    engine, report = replay(DBdata, recording)
+
+    assert report == alone
+    assert other_report['Opportunities'] == 0 # None of the recorded names are in it
+    assert engine.itemindex is not other_engine.itemindex
+    assert len(engine.itemindex) == 300 and len(other_engine.itemindex) == 50
+    assert orderstats._indexes == shared
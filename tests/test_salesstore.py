@@ -0,0 +1,116 @@
+# SalesStore built from DBdata's list cells: offsets, the round trip back to lists and frames, the
+#     HDF copy, and the windowing and subsetting helpers against their list counterparts
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis import historicalSelector, historicalSelectorDF
+from salesstore import SalesStore, fromEpochSeconds, toEpochSeconds, toSeconds
+from synthetic import syntheticDBdata
+
+NOW = datetime(2026, 10, 18, 7)
+
+def day(n, hour=0):
+    return datetime(2026, 10, n, hour)
+
+@pytest.fixture
+def DBdata():
+    # Empty histories, a single sale, one out of time order, repeated timestamps and labels that
+    #     aren't 0..n-1
+    histories = [[[day(1, 3), 1.5], [day(2), 1.25], [day(2, 5), 1.75]],
+                 [],
+                 [[day(3, 1), 0.1]],
+                 [[day(5), 2.0], [day(4), 3.0], [day(6), 4.0], [day(6), 5.0]],
+                 []]
+    return pd.DataFrame({'Item Name': ['A', 'B', 'C', 'D', 'E'], 'Sales from last month': histories},
+                        index=[10, 11, 14, 12, 30])
+
+def test_offsets(DBdata):
+    store = SalesStore.fromDF(DBdata)
+    assert store.index.tolist() == [10, 11, 14, 12, 30]
+    assert store.offsets.tolist() == [0, 3, 3, 4, 8, 8]
+    assert store.lengths().tolist() == [3, 0, 1, 4, 0]
+    assert len(store) == 5
+    assert store.owners().tolist() == [0, 0, 0, 2, 3, 3, 3, 3]
+    assert store.timestamps.dtype == np.int64 and store.prices.dtype == np.float64
+    # Sorted inside each item; the prices move with their timestamps
+    assert store.timestamps[4:8].tolist() == toEpochSeconds([day(4), day(5), day(6), day(6)]).tolist()
+    assert store.prices[4:8].tolist() == [3.0, 2.0, 4.0, 5.0]
+    assert store.lastSale([0, 1, 2, 3]).tolist() == [toSeconds(day(2, 5)), -1, toSeconds(day(3, 1)), toSeconds(day(6))]
+    assert store.positions([12, 10]).tolist() == [3, 0]
+    with pytest.raises(KeyError):
+        store.positions([10, 99])
+
+def test_list_round_trip(DBdata):
+    store = SalesStore.fromDF(DBdata)
+    lists = store.toLists()
+    expected = [sorted(history, key=lambda sale: sale[0]) for history in DBdata['Sales from last month']]
+    assert lists == expected
+    assert all(isinstance(date, datetime) and isinstance(price, float) for history in lists for date, price in history)
+    # Back into a frame and through the store again
+    again = DBdata.assign(**{'Sales from last month': pd.Series(lists, index=DBdata.index, dtype=object)})
+    second = SalesStore.fromDF(again)
+    assert second.index.equals(store.index)
+    for key in ['offsets', 'timestamps', 'prices']:
+        assert np.array_equal(getattr(second, key), getattr(store, key))
+    assert store.matches(again)
+    assert not store.matches(again.iloc[:-1])
+    shorter = again.copy()
+    shorter.at[10, 'Sales from last month'] = lists[0][:2]
+    assert not store.matches(shorter)
+
+def test_synthetic_round_trip():
+    DBdata = syntheticDBdata(items=150, now=NOW, seed=6)
+    store = SalesStore.fromDF(DBdata)
+    assert store.toLists() == DBdata['Sales from last month'].tolist()
+    assert store.offsets[-1] == sum(map(len, DBdata['Sales from last month']))
+
+def test_epoch_seconds():
+    dates = [datetime(1970, 1, 1), datetime(2026, 10, 18, 7, 30, 15), datetime(2000, 2, 29, 23, 59, 59)]
+    seconds = toEpochSeconds(dates)
+    assert seconds.tolist() == [0, toSeconds(dates[1]), toSeconds(dates[2])]
+    assert fromEpochSeconds(seconds) == dates
+
+def test_hdf_round_trip(DBdata, tmp_path):
+    store = SalesStore.fromDF(DBdata)
+    filename = str(tmp_path/'sales.h5')
+    store.toHDF(filename)
+    loaded = SalesStore.readHDF(filename)
+    assert loaded.index.equals(store.index)
+    assert loaded.toLists() == store.toLists()
+
+def test_subset_mask_take(DBdata):
+    store = SalesStore.fromDF(DBdata)
+    lists = store.toLists()
+    subset = store.subset([3, 1, 0])
+    assert subset.index.tolist() == [12, 11, 10]
+    assert subset.toLists() == [lists[3], lists[1], lists[0]]
+    masked = store.mask(store.prices > 1.6)
+    assert masked.index.equals(store.index)
+    assert masked.toLists() == [[sale for sale in history if sale[1] > 1.6] for history in lists]
+
+@pytest.mark.parametrize('dateregion', [[2,0], [1,0], [3,1], [day(2), day(5, 12)]])
+def test_windows_match_the_list_selectors(dateregion):
+    DBdata = syntheticDBdata(items=80, now=NOW, seed=8)
+    store = SalesStore.fromDF(DBdata)
+    # Each item from its own last sale, like historicalSelector
+    for label, history in zip(DBdata.index, DBdata['Sales from last month']):
+        if history:
+            assert store.historicalSelector(label, dateregion) == historicalSelector(history, dateregion)
+    # Anchored on the first item's last sale, like historicalSelectorDF
+    anchor = store.lastSale([0])[0]
+    windowed = store.window(dateregion, anchor=anchor)
+    assert windowed.toLists() == historicalSelectorDF(DBdata, dateregion)['Sales from last month'].tolist()
+
+def test_views(DBdata):
+    store = SalesStore.fromDF(DBdata)
+    for view, history in zip(store.toViews(), store.toLists()):
+        assert len(view) == len(history)
+        assert list(view) == history
+        assert view[:2] == history[:2]
+        if history:
+            assert view[-1] == history[-1] and view[0] == history[0]
+        with pytest.raises(IndexError):
+            view[len(history)]
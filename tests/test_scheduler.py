@@ -0,0 +1,88 @@
+# RescanScheduler ordering: most overdue first, each item once per take, rescoring on observe
+from datetime import datetime
+
+import pandas as pd
+
+from scheduler import RescanScheduler
+
+NOW = 1_800_000_000.0
+DAY = 86400
+
+class FakeQuartiles:
+    # orderstats.QuartileIndex stand-in: label -> (Q1, Q2, Q3)
+    def __init__(self, quartiles):
+        self.values = quartiles
+
+    def quartiles(self, label):
+        return self.values.get(label)
+
+def items(rows):
+    # rows: (label, sales/day, lowest listing, seconds since last scan)
+    return pd.DataFrame({'Sales/Day': [x[1] for x in rows],
+                         'Listings': [(x[2],) if x[2] is not None else () for x in rows],
+                         'Date': [datetime.utcfromtimestamp(NOW - x[3]) for x in rows]},
+                        index=[x[0] for x in rows])
+
+def test_take_orders_by_due_time():
+    # Without quartiles, value = sales/day * near (0.10), so due = last scan + 10 days/(sales/day)
+    df = items([(10, 1.0, None, 0.5*DAY),   # due in 9.5 days
+                (11, 4.0, None, 0.5*DAY),   # due in 2 days
+                (12, 1.0, None, 3*DAY),     # due in 7 days
+                (13, 0.5, None, 0)])        # due in 20 days
+    scheduler = RescanScheduler.fromDF(df, base_interval=DAY)
+    assert scheduler.due(11) == NOW + 2*DAY
+    assert scheduler.take(4, now=NOW) == [11, 12, 10, 13]
+
+def test_take_returns_each_item_once():
+    # The hot item is due again long before the others; it still comes up only once per pass
+    df = items([(1, 1000.0, None, DAY), (2, 0.1, None, DAY), (3, 0.1, None, DAY)])
+    scheduler = RescanScheduler.fromDF(df, base_interval=DAY)
+    taken = scheduler.take(3, now=NOW)
+    assert sorted(taken) == [1, 2, 3]
+    assert taken[0] == 1
+    # Next pass starts with it again, since it's the first due
+    assert scheduler.take(1, now=NOW + 100)[0] == 1
+
+def test_take_more_than_items():
+    scheduler = RescanScheduler.fromDF(items([(1, 1.0, None, DAY), (2, 1.0, None, DAY)]))
+    assert sorted(scheduler.take(5, now=NOW)) == [1, 2]
+
+def test_taken_items_are_rescheduled():
+    scheduler = RescanScheduler.fromDF(items([(1, 1.0, None, DAY), (2, 2.0, None, DAY)]), base_interval=DAY)
+    scheduler.take(2, now=NOW)
+    assert scheduler.items[1]['Last'] == scheduler.items[2]['Last'] == NOW
+    assert scheduler.pop(now=NOW) == 2 # Higher value, so due sooner after the same scan time
+
+def test_closeness_to_buy_line_moves_items_up():
+    # Same volume and staleness; item 2's listing is at the buy line, item 1's far above it
+    qindex = FakeQuartiles({1: (9.0, 10.0, 11.0), 2: (9.0, 10.0, 11.0)})
+    line = 11.0/1.16
+    scheduler = RescanScheduler.fromDF(items([(1, 1.0, 2*line, 0), (2, 1.0, line, 0)]), qindex=qindex,
+                                       percentage=1.15, base_interval=DAY)
+    assert scheduler.gap(2) == 1.0
+    assert scheduler.take(2, now=NOW) == [2, 1]
+
+def test_observe_rescores():
+    qindex = FakeQuartiles({1: (9.0, 10.0, 11.0), 2: (9.0, 10.0, 11.0)})
+    line = 11.0/1.16
+    scheduler = RescanScheduler.fromDF(items([(1, 1.0, 3*line, 0), (2, 1.0, 3*line, 0)]), qindex=qindex,
+                                       base_interval=DAY)
+    scheduler.take(2, now=NOW)
+    # Item 1 comes back just above the line (a near miss), item 2 unchanged
+    scheduler.observe(1, {'Sales/Day': 1.0, 'Listings': [line*1.05]}, now=NOW + 10)
+    scheduler.observe(2, {'Sales/Day': 1.0, 'Listings': [3*line]}, now=NOW + 10)
+    assert scheduler.items[1]['Near'] == 1
+    assert scheduler.due(1) < scheduler.due(2)
+    assert scheduler.pop(now=NOW + 20) == 1
+
+def test_stale_heap_entries_are_skipped_and_compacted():
+    scheduler = RescanScheduler.fromDF(items([(n, 1.0, None, DAY) for n in range(5)]), base_interval=DAY)
+    for step in range(100):
+        scheduler.observe(step % 5, {'Sales/Day': 1.0 + step, 'Listings': []}, now=NOW + step)
+    assert len(scheduler.heap) <= 4*len(scheduler) + 1
+    assert sorted(scheduler.take(5, now=NOW + 200)) == list(range(5))
+
+def test_added_items_are_due_right_away():
+    scheduler = RescanScheduler.fromDF(items([(1, 5.0, None, 0)]), base_interval=DAY)
+    scheduler.add(2, 0.1)
+    assert scheduler.take(1, now=NOW) == [2]
@@ -0,0 +1,66 @@
+# item_info.h5 round trips: the loaders rebuild the same DBdata from the compact tables as from
+#     the object frame, and fall back to the object frame when writeCompact didn't make them.
+from datetime import datetime
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from journal import ItemJournal
+from salesstore import writeItemInfo
+from schema import CompactItems, readCompact, readItemInfo, writeCompact
+from synthetic import syntheticDBdata
+
+NOW = datetime(2026, 10, 18, 7)
+
+@pytest.fixture(autouse=True)
+def quiet():
+    with warnings.catch_warnings(): # PyTables pickles the object columns
+        warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+        yield
+
+@pytest.fixture
+def DBdata():
+    return syntheticDBdata(items=200, now=NOW, seed=3)
+
+def test_compact_round_trip(DBdata):
+    compact = CompactItems.fromDF(DBdata)
+    assert compact.scalars['Item Name'].dtype == 'category'
+    assert compact.scalars['Condition'].dtype == np.int8
+    assert compact.toDF().equals(DBdata)
+
+@pytest.mark.parametrize('write', [writeCompact, writeItemInfo])
+def test_loaders_read_what_was_written(DBdata, tmp_path, write):
+    filename = str(tmp_path/'item_info.h5')
+    write(DBdata, filename)
+
+    assert readCompact(filename).toDF().equals(DBdata)
+    loaded, store = readItemInfo(filename)
+    assert loaded.equals(DBdata)
+    assert store.matches(loaded)
+
+def test_compact_tables_saved_only_by_writeCompact(DBdata, tmp_path):
+    filename = str(tmp_path/'item_info.h5')
+    writeCompact(DBdata, filename)
+    CompactItems.readHDF(filename)
+    writeItemInfo(DBdata.iloc[:50], filename) # Starts the file over, so no stale compact tables
+    with pytest.raises(KeyError):
+        CompactItems.readHDF(filename)
+    assert readCompact(filename).toDF().equals(DBdata.iloc[:50])
+
+def test_journal_replays_on_top_of_compact_tables(DBdata, tmp_path):
+    filename = str(tmp_path/'item_info.h5')
+    writeCompact(DBdata, filename)
+    journal = ItemJournal(filename).start()
+    changed = dict(DBdata.loc[5])
+    changed['Listings'] = (1.23, 4.56)
+    journal.record(5, changed)
+    journal.flush()
+
+    loaded = journal.load()
+    assert loaded.loc[5, 'Listings'] == (1.23, 4.56)
+    assert loaded.drop(index=5).equals(DBdata.drop(index=5))
+
+    journal.close(compact=True) # Folds the segment back in through writeCompact
+    assert readCompact(filename).toDF().loc[5, 'Listings'] == (1.23, 4.56)
@@ -0,0 +1,87 @@
+# StateStore cursors shared by several connections, threads and processes: advance() hands every
+#     claimant a different value, and the in-process cache follows the commit order
+import multiprocessing
+import threading
+
+import pandas as pd
+import pytest
+
+import combinedfuncs
+from combinedfuncs import SeleniumSource
+from statestore import StateStore
+
+@pytest.fixture
+def filename(tmp_path):
+    return str(tmp_path/'scanstate.db')
+
+def test_advance_across_connections(filename):
+    first, second = StateStore(filename, legacy=None), StateStore(filename, legacy=None)
+    claims = [store.advance('selenium_iloc', 3, modulo=10) for store in [first, second]*3]
+    assert claims == [0, 3, 6, 9, 0, 3] # 9 + 3 reaches the end, so the cursor starts over
+    assert first.cursor('selenium_iloc', fresh=True) == second.cursor('selenium_iloc', fresh=True) == 6
+
+def test_advance_past_a_shorter_list(filename):
+    store = StateStore(filename, legacy=None)
+    store.setCursor('selenium_iloc', 12)
+    assert store.advance('selenium_iloc', 5, modulo=8) == 0
+    assert store.advance('selenium_iloc', 5, modulo=8) == 5
+    assert store.cursor('selenium_iloc') == 0
+
+def test_cached_cursor_is_behind_other_connections(filename):
+    first, second = StateStore(filename, legacy=None), StateStore(filename, legacy=None)
+    first.setCursor('selenium_iloc', 4)
+    assert second.cursor('selenium_iloc') == 4
+    first.setCursor('selenium_iloc', 7)
+    assert second.cursor('selenium_iloc') == 4
+    assert second.cursor('selenium_iloc', fresh=True) == 7
+    assert second.advance('selenium_iloc') == 7 # Claims always read the file
+
+def claimMany(filename, count, results):
+    store = StateStore(filename, legacy=None)
+    results.put([store.advance('counter') for _ in range(count)])
+    store.close()
+
+def test_advance_across_processes(filename):
+    StateStore(filename, legacy=None).close() # Schema in place before the processes race
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    processes = [context.Process(target=claimMany, args=(filename, 50, results)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    claims = [value for _ in processes for value in results.get(timeout=60)]
+    for process in processes:
+        process.join()
+    assert sorted(claims) == list(range(200))
+    assert StateStore(filename, legacy=None).cursor('counter') == 200
+
+def test_cache_follows_commits_across_threads(filename):
+    store = StateStore(filename, legacy=None)
+    claims = []
+    def claim():
+        for _ in range(100):
+            value = store.advance('counter')
+            claims.append(value)
+            store.setCursor('thread_{0}'.format(threading.get_ident()), value)
+    threads = [threading.Thread(target=claim) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(claims) == list(range(400))
+    assert store.cursors() == store.cursors(fresh=True)
+
+def test_selenium_sources_claim_different_items(filename, monkeypatch):
+    # Two scanners with their own connections to one state store split the item list between them
+    stores = [StateStore(filename, legacy=None), StateStore(filename, legacy=None)]
+    DBdata = pd.DataFrame({'Item Name': ['Item {0}'.format(i) for i in range(10)],
+                           'Special Type': 0, 'Condition': 0,
+                           'Sales from last month': [[None]*30]*10, 'Buy Rate': 2.0}, index=range(100, 110))
+    infodict = {'Pages': 3, 'Load Time': 0, 'Verbose': False}
+    sources = [SeleniumSource(infodict), SeleniumSource(infodict)]
+    claimed = []
+    for n in range(4):
+        monkeypatch.setattr(combinedfuncs, 'openStateStore', lambda: stores[n % 2])
+        claimed.append(sources[n % 2].claimBatch(DBdata).index.tolist())
+    assert claimed == [[100, 101, 102], [103, 104, 105], [106, 107, 108], [109]]
+    assert sources[1].of_interest is None # Reached the end; refreshed next pass
+    assert stores[0].advance('selenium_iloc', 3, modulo=10) == 0
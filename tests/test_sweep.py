@@ -0,0 +1,89 @@
+# The process-pool sweep against serial backtests, and its shared memory cleanup
+import contextlib
+import io
+from datetime import datetime
+from multiprocessing import shared_memory
+
+import pytest
+
+import sweep as sweepmodule
+from analysis import BackTesterV2, LessThanThirdQuartileHistorical, profitStats, standardFilter
+from salesstore import SalesStore
+from sweep import expandGrid, sweep
+from synthetic import syntheticDBdata
+
+NOW = datetime(2026, 10, 18, 7)
+GRID = {'testregion': [[5, 4], [7, 6]],
+        'liquidation_force_days': [1, 3],
+        'percentage': [1.23],
+        'dateregion': [[8,0]],
+        'usefallbackmethod': [True, False]}
+
+@pytest.fixture(scope='module')
+def DBdata():
+    return standardFilter(syntheticDBdata(items=400, now=NOW, seed=2))
+
+def serial(DBdata, params):
+    tester = BackTesterV2(LessThanThirdQuartileHistorical, params['testregion'], params['liquidation_force_days'],
+                          inputs=[params['percentage'], params['dateregion']],
+                          usefallbackmethod=params['usefallbackmethod'])
+    return tester.runBacktest(DBdata, verbose=False)
+
+class Recorder:
+    # Stands in for the shared_memory module and notes the blocks sweep creates
+    def __init__(self):
+        self.created = []
+
+    def SharedMemory(self, *args, **kwargs):
+        block = shared_memory.SharedMemory(*args, **kwargs)
+        if kwargs.get('create'):
+            self.created.append(block.name)
+        return block
+
+def assertUnlinked(names):
+    assert names
+    for name in names:
+        with pytest.raises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+def test_sweep_matches_serial_runs(DBdata, monkeypatch):
+    recorder = Recorder()
+    monkeypatch.setattr(sweepmodule, 'shared_memory', recorder)
+    results = sweep(DBdata, grid=GRID, workers=2, verbose=False)
+    assert len(results.index) == len(expandGrid(GRID))
+    for params in expandGrid(GRID):
+        row = results[(results['testregion'] == tuple(params['testregion']))
+                      & (results['liquidation_force_days'] == params['liquidation_force_days'])
+                      & (results['usefallbackmethod'] == params['usefallbackmethod'])]
+        assert len(row.index) == 1
+        expected = profitStats(*serial(DBdata, params)[1])
+        assert row.iloc[0][list(expected)].to_dict() == pytest.approx(expected)
+    assert results['Net Profit'].is_monotonic_decreasing
+    assertUnlinked(recorder.created)
+
+def test_views_backtest_like_lists(DBdata):
+    # What a worker runs on: the sales column as StoredHistory views over the store's arrays
+    store = SalesStore.fromDF(DBdata)
+    views = DBdata.assign(**{'Sales from last month': store.toViews()})
+    assert [len(x) for x in views['Sales from last month']] == [len(x) for x in DBdata['Sales from last month']]
+    assert list(views['Sales from last month'].iloc[3]) == DBdata['Sales from last month'].iloc[3]
+    assert views['Sales from last month'].iloc[3][-1] == DBdata['Sales from last month'].iloc[3][-1]
+    params = expandGrid(GRID)[0]
+    _, expected = serial(DBdata, params)
+    tester = BackTesterV2(LessThanThirdQuartileHistorical, params['testregion'], params['liquidation_force_days'],
+                          inputs=[params['percentage'], params['dateregion']], usefallbackmethod=True)
+    _, found = tester.runBacktest(views, verbose=False, store=store)
+    assert [[(p['Name'], p['Buy Date'], p.get('Sell Date')) for p in phase] for phase in found] == \
+           [[(p['Name'], p['Buy Date'], p.get('Sell Date')) for p in phase] for phase in expected]
+
+class BrokenStrategy(LessThanThirdQuartileHistorical):
+    def runBacktestV2(self, *args, **kwargs):
+        raise RuntimeError('Strategy failed')
+
+def test_blocks_unlinked_when_a_worker_fails(DBdata, monkeypatch):
+    recorder = Recorder()
+    monkeypatch.setattr(sweepmodule, 'shared_memory', recorder)
+    with pytest.raises(RuntimeError):
+        with contextlib.redirect_stdout(io.StringIO()):
+            sweep(DBdata, grid=GRID, strategy=BrokenStrategy, workers=2, verbose=False)
+    assertUnlinked(recorder.created)
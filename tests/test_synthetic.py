@@ -0,0 +1,58 @@
+# syntheticDBdata is reproducible and DBdata-shaped; its page fragments parse back to the data
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from browse_itempage import cleanListing, cleanListingSoup, cleanVolumetric
+from synthetic import syntheticDBdata, listingHTML, chartHTML
+
+NOW = datetime(2026, 10, 18, 7)
+COLUMNS = ['Item Name', 'Special Type', 'Condition', 'Sales/Day', 'Buy Rate', 'Date',
+           'Sales from last month', 'Listings']
+
+@pytest.fixture(scope='module')
+def DBdata():
+    return syntheticDBdata(items=300, days=30, seed=1, now=NOW)
+
+def test_same_seed_same_data(DBdata):
+    assert syntheticDBdata(items=300, days=30, seed=1, now=NOW).equals(DBdata)
+    assert not syntheticDBdata(items=300, days=30, seed=2, now=NOW).equals(DBdata)
+
+def test_shape_and_types(DBdata):
+    assert list(DBdata.columns) == COLUMNS
+    assert list(DBdata.index) == list(range(300))
+    assert DBdata['Item Name'].is_unique
+    assert DBdata['Condition'].between(0, 4).all()
+    assert set(DBdata['Special Type']) <= {0, 1}
+    assert (DBdata['Date'] == NOW).all()
+    souvenir = DBdata['Item Name'].str.startswith('Souvenir ')
+    assert (souvenir == (DBdata['Special Type'] == 1)).all()
+
+def test_sales_and_listings(DBdata):
+    lengths = DBdata['Sales from last month'].apply(len)
+    assert np.allclose(DBdata['Sales/Day'], np.round(lengths/30, 2))
+    for history in DBdata['Sales from last month']:
+        dates = [date for date, _ in history]
+        assert dates == sorted(dates)
+        assert all(NOW.timestamp() - 30*86400 <= date.timestamp() < NOW.timestamp() for date in dates)
+    for listings in DBdata['Listings']:
+        assert 1 <= len(listings) <= 10
+        assert list(listings) == sorted(listings)
+    assert (DBdata['Buy Rate'] < DBdata['Listings'].apply(max)).all()
+
+def test_pages_parse_back(DBdata):
+    for i in range(20):
+        listings, history = DBdata['Listings'][i], DBdata['Sales from last month'][i]
+        page = listingHTML(listings, seed=i, sold=0)
+        assert cleanListing(page)[0] == tuple(listings)
+        assert cleanListing(page) == cleanListingSoup(page)
+        recent = [sale for sale in history if sale[0] > NOW - timedelta(days=30)] # The chart cut is exclusive
+        assert cleanVolumetric(chartHTML(history, seed=i), NOW) == recent
+
+def test_sold_rows_are_skipped():
+    prices = [round(1 + i/100, 2) for i in range(200)]
+    page = listingHTML(prices, seed=0, sold=0.3)
+    parsed = cleanListing(page)[0]
+    assert 0 < len(parsed) < len(prices)
+    assert set(parsed) <= set(prices)